@@ -18,4 +18,125 @@ if not SECRET_KEY:
     )
 
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 8  # 8 ชั่วโมง (เหมาะกับ 1 วันเรียน)
\ No newline at end of file
+ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 8  # 8 ชั่วโมง (เหมาะกับ 1 วันเรียน)
+
+# Cache ข้อมูลผู้ใช้ที่ Login แล้ว (ต่อ 1 Worker) ลด SELECT users ทุก Request
+AUTH_PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("AUTH_PRINCIPAL_CACHE_TTL_SECONDS", "300"))
+AUTH_PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_PRINCIPAL_CACHE_MAX_ENTRIES", "5000"))
+AUTH_PRINCIPAL_SYNC_SECONDS = float(os.getenv("AUTH_PRINCIPAL_SYNC_SECONDS", "5"))  # รอบเช็กการ Invalidate จาก Worker อื่น
+
+# บันทึก last_active_at แบบ Write-behind (รวมเป็น UPDATE เดียวทุกรอบ) และหน้าต่างเวลาที่นับว่า "กำลังใช้งาน"
+ACTIVITY_FLUSH_SECONDS = float(os.getenv("ACTIVITY_FLUSH_SECONDS", "10"))
+ACTIVITY_WINDOW_SECONDS = float(os.getenv("ACTIVITY_WINDOW_SECONDS", "60"))
+
+# จำกัดการเดารหัสผ่าน (Sliding Window ต่อบัญชีและต่อ IP) ตัดก่อนถึงขั้น bcrypt
+# Backend: "memory" (ต่อ Worker) | "database" (ใช้ร่วมกันทุก Worker) | "none" (ปิด)
+LOGIN_THROTTLE_BACKEND = os.getenv("LOGIN_THROTTLE_BACKEND", "memory").lower()
+LOGIN_THROTTLE_WINDOW_SECONDS = float(os.getenv("LOGIN_THROTTLE_WINDOW_SECONDS", "300"))
+LOGIN_MAX_FAILURES_PER_ACCOUNT = int(os.getenv("LOGIN_MAX_FAILURES_PER_ACCOUNT", "5"))
+# ทั้งห้องเรียนมักออกเน็ตผ่าน IP เดียวกัน (NAT ของโรงเรียน) จึงตั้งเพดานต่อ IP ไว้สูงกว่าต่อบัญชีมาก
+LOGIN_MAX_FAILURES_PER_IP = int(os.getenv("LOGIN_MAX_FAILURES_PER_IP", "100"))
+# จำนวน Proxy ที่อยู่หน้าแอป (Railway = 1) ใช้เลือก IP จริงจาก X-Forwarded-For โดยนับจากขวา
+# 0 = ไม่เชื่อ X-Forwarded-For เลย (รันตรงโดยไม่มี Proxy) ห้ามตั้งมากกว่าจำนวน Proxy จริง ไม่งั้นผู้ใช้ปลอม IP ได้
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+# รัน Migration ที่ค้างอยู่ตอนเปิดระบบ (ปิดได้ถ้ารัน python migrate.py เองตอน Deploy)
+DB_MIGRATE_ON_STARTUP = os.getenv("DB_MIGRATE_ON_STARTUP", "true").lower() == "true"
+
+# แบ่งหน้ารายการของครูแบบ Keyset (Cursor) และอายุ Cache ของจำนวนรวม
+PAGINATION_DEFAULT_LIMIT = int(os.getenv("PAGINATION_DEFAULT_LIMIT", "50"))
+PAGINATION_MAX_LIMIT = int(os.getenv("PAGINATION_MAX_LIMIT", "200"))
+PAGINATION_COUNT_TTL_SECONDS = float(os.getenv("PAGINATION_COUNT_TTL_SECONDS", "30"))
+
+# นำเข้ารายชื่อนักเรียนทั้งห้อง (Hash รหัสผ่านแบบขนานหลาย Process)
+ROSTER_MAX_ROWS = int(os.getenv("ROSTER_MAX_ROWS", "2000"))
+ROSTER_HASH_WORKERS = int(os.getenv("ROSTER_HASH_WORKERS", str(os.cpu_count() or 2)))
+
+# ==========================================
+# 🤖 AI GRADING CONFIGURATION
+# ==========================================
+
+GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-2.5-flash")
+
+# Model Routing 2 ระดับ: งานสั้น/ขั้นตอนต้น ๆ ใช้โมเดลเล็กก่อน แล้ว Escalate ไปโมเดลหลักเมื่อผลไม่น่าเชื่อถือ
+AI_ROUTING_ENABLED = os.getenv("AI_ROUTING_ENABLED", "true").lower() == "true"
+GEMINI_LIGHT_MODEL_NAME = os.getenv("GEMINI_LIGHT_MODEL_NAME", "gemini-2.5-flash-lite")
+AI_ROUTING_LIGHT_STEPS = [int(s) for s in os.getenv("AI_ROUTING_LIGHT_STEPS", "1,2").split(",") if s.strip()]
+AI_ROUTING_LIGHT_MAX_TOKENS = int(os.getenv("AI_ROUTING_LIGHT_MAX_TOKENS", "300"))  # งานสั้นกว่านี้ใช้โมเดลเล็ก
+AI_PASS_THRESHOLD = float(os.getenv("AI_PASS_THRESHOLD", "60"))                     # เกณฑ์ผ่าน (คะแนนเต็ม 100)
+AI_ROUTING_THRESHOLD_MARGIN = float(os.getenv("AI_ROUTING_THRESHOLD_MARGIN", "8"))  # คะแนนห่างเกณฑ์ผ่านไม่เกินนี้ให้โมเดลหลักตรวจซ้ำ
+
+# Cache ผลตรวจในหน่วยความจำ (L1) ต่อ 1 Worker
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "1000"))
+AI_CACHE_MAX_BYTES = int(os.getenv("AI_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))  # 16 MB
+AI_CACHE_TTL_SECONDS = int(os.getenv("AI_CACHE_TTL_SECONDS", str(60 * 60 * 6)))  # 6 ชั่วโมง
+
+# Cache ผลตรวจในฐานข้อมูล (L2) ใช้ร่วมกันทุก Worker
+AI_L2_CACHE_ENABLED = os.getenv("AI_L2_CACHE_ENABLED", "true").lower() == "true"
+AI_L2_CACHE_TTL_SECONDS = int(os.getenv("AI_L2_CACHE_TTL_SECONDS", str(60 * 60 * 24 * 30)))  # 30 วัน
+
+# [IMPORTANT] เปลี่ยนค่านี้ทุกครั้งที่แก้เกณฑ์ (Rubric) หรือ Prompt เพื่อไม่ให้ใช้ผลตรวจเก่า
+AI_RUBRIC_VERSION = os.getenv("AI_RUBRIC_VERSION", "2026.2")
+
+# โหมดการตรวจงาน: "sync" = รอผล AI ใน Request เดิม, "async" = ตอบ 202 แล้วตรวจเบื้องหลังผ่านคิว
+AI_GRADING_MODE = os.getenv("AI_GRADING_MODE", "sync").lower()
+AI_GRADING_WORKERS = int(os.getenv("AI_GRADING_WORKERS", "4"))          # จำนวนงานตรวจพร้อมกันต่อ 1 Worker
+AI_GRADING_MAX_ATTEMPTS = int(os.getenv("AI_GRADING_MAX_ATTEMPTS", "3"))
+AI_GRADING_LEASE_SECONDS = int(os.getenv("AI_GRADING_LEASE_SECONDS", "180"))  # งานที่ถูกถือเกินนี้ถือว่า Worker ตาย
+AI_GRADING_POLL_SECONDS = float(os.getenv("AI_GRADING_POLL_SECONDS", "2"))
+
+# Circuit Breaker: ล้มเหลวติดกันครบจำนวนนี้ หยุดเรียก AI ชั่วคราวแล้วตอบ Fallback ทันที
+AI_BREAKER_FAILURE_THRESHOLD = int(os.getenv("AI_BREAKER_FAILURE_THRESHOLD", "5"))
+AI_BREAKER_RESET_SECONDS = float(os.getenv("AI_BREAKER_RESET_SECONDS", "30"))
+
+# Admission Control: งานรอตรวจเกินนี้ตอบ 503 + Retry-After แทนการรับงานเพิ่ม
+AI_ADMISSION_MAX_INFLIGHT = int(os.getenv("AI_ADMISSION_MAX_INFLIGHT", "64"))   # โหมด sync/stream: งานที่รอ AI อยู่ต่อ 1 Worker
+AI_ADMISSION_MAX_QUEUE = int(os.getenv("AI_ADMISSION_MAX_QUEUE", "500"))        # โหมด async: งานค้างในคิวทั้งระบบ
+AI_ADMISSION_RETRY_AFTER = int(os.getenv("AI_ADMISSION_RETRY_AFTER", "30"))
+
+# Micro-batching: รวมหลายงานของ Step เดียวกันเป็น Prompt เดียว (ทำงานเฉพาะตอนโหลดสูง)
+AI_BATCH_ENABLED = os.getenv("AI_BATCH_ENABLED", "true").lower() == "true"
+AI_BATCH_WINDOW_MS = int(os.getenv("AI_BATCH_WINDOW_MS", "200"))
+AI_BATCH_MAX_SIZE = int(os.getenv("AI_BATCH_MAX_SIZE", "8"))
+AI_BATCH_LOAD_THRESHOLD = int(os.getenv("AI_BATCH_LOAD_THRESHOLD", "4"))  # เริ่มรวม Batch เมื่อมีงานค้างที่ Gemini ตั้งแต่เท่านี้
+
+# Adaptive Limiter (AIMD) + โควตาต่อนาทีตาม Tier ของ Gemini API
+AI_CONCURRENCY_INITIAL = int(os.getenv("AI_CONCURRENCY_INITIAL", "20"))
+AI_CONCURRENCY_MIN = int(os.getenv("AI_CONCURRENCY_MIN", "2"))
+AI_CONCURRENCY_MAX = int(os.getenv("AI_CONCURRENCY_MAX", "50"))
+AI_RPM_LIMIT = int(os.getenv("AI_RPM_LIMIT", "1000"))
+AI_TPM_LIMIT = int(os.getenv("AI_TPM_LIMIT", "1000000"))
+
+# Global Limiter ใช้ร่วมกันทุก uvicorn Worker: "none" | "database" | "memory"
+AI_GLOBAL_LIMITER = os.getenv("AI_GLOBAL_LIMITER", "database").lower()
+AI_GLOBAL_CONCURRENCY = int(os.getenv("AI_GLOBAL_CONCURRENCY", "20"))
+AI_GLOBAL_RPM = int(os.getenv("AI_GLOBAL_RPM", str(AI_RPM_LIMIT)))
+AI_GLOBAL_LEASE_SECONDS = int(os.getenv("AI_GLOBAL_LEASE_SECONDS", "60"))
+
+# งบ Token สูงสุดของงานนักเรียน 1 ชิ้นใน Prompt (ยาวกว่านี้จะถูกย่อ/ตัดก่อนส่ง)
+AI_CONTENT_TOKEN_BUDGET = int(os.getenv("AI_CONTENT_TOKEN_BUDGET", "2000"))
+
+# ด่านคัดกรองงานขยะในเครื่องก่อนส่ง AI (พิมพ์มั่ว/ซ้ำ/คัดลอกโจทย์)
+AI_PRESCREEN_ENABLED = os.getenv("AI_PRESCREEN_ENABLED", "true").lower() == "true"
+
+# ขอให้ Gemini ตอบเป็น JSON ตาม Schema (response_mime_type + response_schema)
+AI_STRUCTURED_OUTPUT = os.getenv("AI_STRUCTURED_OUTPUT", "true").lower() == "true"
+
+# ดัชนีหางานที่คล้ายกันข้ามนักเรียน (ตรวจการลอกงานโดยไม่ต้องพึ่ง AI)
+AI_SIMILARITY_ENABLED = os.getenv("AI_SIMILARITY_ENABLED", "true").lower() == "true"
+AI_SIMILARITY_THRESHOLD = float(os.getenv("AI_SIMILARITY_THRESHOLD", "0.8"))
+AI_SIMILARITY_MAX_ENTRIES = int(os.getenv("AI_SIMILARITY_MAX_ENTRIES", "50000"))
+AI_SIMILARITY_REBUILD_LIMIT = int(os.getenv("AI_SIMILARITY_REBUILD_LIMIT", "20000"))
+AI_SIMILARITY_REBUILD_SECONDS = float(os.getenv("AI_SIMILARITY_REBUILD_SECONDS", "20"))
+# ดึงงานใหม่ที่ Worker อื่นบันทึกเข้าดัชนีของ Worker นี้ทุกกี่วินาที (0 = ปิด ใช้ได้เฉพาะกรณีรัน Worker เดียว)
+AI_SIMILARITY_SYNC_SECONDS = float(os.getenv("AI_SIMILARITY_SYNC_SECONDS", "30"))
+# ใช้ผลตรวจ AI ของงานที่เกือบเหมือนกันซ้ำ แทนการเรียก AI ใหม่ (ปิดไว้เป็นค่าเริ่มต้น)
+AI_SIMILARITY_REUSE_RESULT = os.getenv("AI_SIMILARITY_REUSE_RESULT", "false").lower() == "true"
+AI_SIMILARITY_REUSE_THRESHOLD = float(os.getenv("AI_SIMILARITY_REUSE_THRESHOLD", "0.95"))
+
+# Backend ของ LLM: "gemini" (จริง) | "fake" (จำลอง) | "record" (เรียกจริง+บันทึก) | "replay" (เล่นซ้ำจาก Cassette)
+AI_LLM_BACKEND = os.getenv("AI_LLM_BACKEND", "gemini").lower()
+AI_CASSETTE_PATH = os.getenv("AI_CASSETTE_PATH", "cassettes/gemini.jsonl")
+AI_FAKE_LATENCY_MS = float(os.getenv("AI_FAKE_LATENCY_MS", "1500"))
+AI_FAKE_LATENCY_SIGMA = float(os.getenv("AI_FAKE_LATENCY_SIGMA", "0.5"))
+AI_FAKE_429_RATE = float(os.getenv("AI_FAKE_429_RATE", "0"))
@@ -0,0 +1,37 @@
+# backend/app/core/http_cache.py
+import hashlib
+from typing import Optional
+
+from fastapi import Request, Response
+
+
+def make_etag(kind: str, version: int, *parts) -> str:
+    """Weak ETag: ข้อมูลเดียวกันในเชิงความหมาย (ไม่รับประกันว่า Byte ตรงกันทุกตัว)"""
+    extra = hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:12] if parts else "0"
+    return f'W/"{kind}-{version}-{extra}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # การเทียบแบบ Weak: ไม่สนใจ Prefix W/
+    target = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if (candidate[2:] if candidate.startswith("W/") else candidate) == target:
+            return True
+    return False
+
+
+def conditional_response(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """
+    คืน Response 304 ถ้า If-None-Match ตรงกับ ETag ปัจจุบัน (ให้ Endpoint คืนค่านี้ทันทีก่อนรัน Query หนัก)
+    ไม่งั้นใส่ ETag ลงใน Response ปกติแล้วคืน None
+    """
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
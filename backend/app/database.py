@@ -1,6 +1,9 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
 import os
+import asyncio
+import functools
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -51,4 +54,74 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# ==========================================
+# [NEW] โหมด Async (asyncpg / aiosqlite)
+# DB_MODE=sync  (ค่าเริ่มต้น) Endpoint แบบ def รันใน Thread Pool เหมือนเดิม
+# DB_MODE=async Endpoint ใช้ AsyncSession บน Event Loop ไม่กิน Thread ต่อ Request
+# งานเบื้องหลัง (คิวตรวจ, Cache L2, Limiter) ยังใช้ SessionLocal แบบ Sync ใน Thread ทั้งสองโหมด
+# ==========================================
+DB_MODE = os.getenv("DB_MODE", "sync").lower()
+
+def _async_database_url():
+    url = make_url(SQLALCHEMY_DATABASE_URL)
+    connect_args = {}
+    if url.drivername in ("postgresql", "postgresql+psycopg2"):
+        # asyncpg ไม่รู้จัก sslmode แบบ libpq ต้องแปลงเป็น ssl
+        sslmode = url.query.get("sslmode")
+        if sslmode:
+            url = url.difference_update_query(["sslmode"])
+            if sslmode != "disable":
+                connect_args["ssl"] = "require"
+        url = url.set(drivername="postgresql+asyncpg")
+    elif url.drivername in ("sqlite", "sqlite+pysqlite"):
+        url = url.set(drivername="sqlite+aiosqlite")
+    return url, connect_args
+
+async_engine = None
+AsyncSessionLocal = None
+
+if DB_MODE == "async":
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    async_url, async_connect_args = _async_database_url()
+    async_engine_kwargs = {k: v for k, v in engine_kwargs.items() if k != "connect_args"}
+    async_engine = create_async_engine(async_url, connect_args=async_connect_args, **async_engine_kwargs)
+    # expire_on_commit=False: Object ที่คืนจาก Endpoint ต้องอ่านค่าได้หลัง Commit โดยไม่ต้อง Query ซ้ำนอก Greenlet
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Dependency ที่ Router ใช้ (เลือกตาม DB_MODE)
+get_session = get_async_db if DB_MODE == "async" else get_db
+
+async def run_db(db, fn, *args, **kwargs):
+    """
+    รันโค้ด ORM แบบ Sync (db.query ...) โดยไม่บล็อก Event Loop
+    - Session (โหมด sync): รันใน Thread
+    - AsyncSession (โหมด async): รันผ่าน run_sync บน Connection แบบ Async
+    """
+    if DB_MODE == "async":
+        return await db.run_sync(lambda session: fn(session, *args, **kwargs))
+    return await asyncio.to_thread(fn, db, *args, **kwargs)
+
+def db_endpoint(fn):
+    """
+    Decorator สำหรับ Endpoint แบบ def ที่รับ db
+    โหมด sync คืนฟังก์ชันเดิม (FastAPI รันใน Thread Pool)
+    โหมด async ห่อเป็น async def ที่รันตัวฟังก์ชันผ่าน AsyncSession.run_sync
+    (run_sync รันบน Thread ของ Event Loop: ห้ามใช้กับ Endpoint ที่มีงาน CPU หนัก เช่น bcrypt ให้ใช้ run_db + asyncio.to_thread แทน)
+    """
+    if DB_MODE != "async":
+        return fn
+
+    @functools.wraps(fn)
+    async def wrapper(**kwargs):
+        db = kwargs.pop("db")
+        return await db.run_sync(lambda session: fn(db=session, **kwargs))
+
+    return wrapper
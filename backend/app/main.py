@@ -1,12 +1,24 @@
 import os
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import engine
-from app.models import edp
+from app.database import async_engine, DB_MODE
 from app.routers import edp as edp_router, auth, analytics, quiz
+from app.services.grading_queue import get_grading_queue
+from app.services.similarity_index import get_similarity_index
+from app.services.activity_tracker import get_activity_tracker
+from app.services.roster_import import shutdown_hash_pool
+from app.core.config import (
+    AI_SIMILARITY_ENABLED, AI_SIMILARITY_REBUILD_LIMIT, AI_SIMILARITY_REBUILD_SECONDS, DB_MIGRATE_ON_STARTUP
+)
+from app.migrations import migrate
 
 
-edp.Base.metadata.create_all(bind=engine)
+# [NEW] Schema มาจาก Migration แบบมีเวอร์ชัน (app/migrations) แทน create_all + สคริปต์ปรับตารางเฉพาะกิจ
+if DB_MIGRATE_ON_STARTUP:
+    migrate()
+else:
+    print("⚠️  DB_MIGRATE_ON_STARTUP=false: ตรวจให้แน่ใจว่ารัน python migrate.py แล้ว")
 
 app = FastAPI(title="EDP AI Platform 2026", version="2.0.0")
 
@@ -46,6 +58,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # ให้ Frontend (ต่าง Origin) อ่าน Header ของการแบ่งหน้าได้
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "ETag"],
 )
 
 app.include_router(auth.router)
@@ -53,6 +67,34 @@ app.include_router(edp_router.router)
 app.include_router(analytics.router)
 app.include_router(quiz.router)
 
+@app.on_event("startup")
+async def start_background_workers():
+    # Worker Pool สำหรับตรวจงานแบบ Async (หยิบงานค้างในคิวจาก DB ต่อได้ทันทีหลัง Restart)
+    get_grading_queue().start()
+    # เขียน last_active_at แบบรวม Batch เบื้องหลัง
+    get_activity_tracker().start()
+    print(f"🗄️  Database mode: {DB_MODE}")
+
+    # สร้างดัชนีงานที่คล้ายกันจากตาราง edp_steps เบื้องหลัง (จำกัดจำนวนและเวลา ไม่ถ่วงการเปิดระบบ)
+    if AI_SIMILARITY_ENABLED:
+        app.state.similarity_rebuild = asyncio.create_task(asyncio.to_thread(
+            get_similarity_index().rebuild_from_db,
+            AI_SIMILARITY_REBUILD_LIMIT,
+            AI_SIMILARITY_REBUILD_SECONDS
+        ))
+        # ดัชนีแยกต่อ Worker: ดึงงานที่ Worker อื่นรับไว้เข้ามาเป็นระยะ ไม่ต้องรอ Restart
+        get_similarity_index().start()
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    await get_grading_queue().stop()
+    await get_activity_tracker().stop()
+    if AI_SIMILARITY_ENABLED:
+        await get_similarity_index().stop()
+    await asyncio.to_thread(shutdown_hash_pool)
+    if async_engine is not None:
+        await async_engine.dispose()
+
 @app.get("/")
 def home():
     return {"message": "EDP AI System Backend is Secure & Ready!", "docs": "/docs"}
\ No newline at end of file
@@ -0,0 +1,17 @@
+# backend/app/migrations/__init__.py
+from app.database import engine
+from app.migrations.runner import (
+    Migration, current_version, pending_migrations, run_migrations, drop_migration_history
+)
+from app.migrations.versions import MIGRATIONS
+
+
+def migrate(target=None):
+    """อัปเดต Schema ของฐานข้อมูลหลักให้เป็นเวอร์ชันล่าสุด (หรือถึง target)"""
+    return run_migrations(engine, MIGRATIONS, target)
+
+
+__all__ = [
+    "MIGRATIONS", "Migration", "migrate", "current_version", "pending_migrations",
+    "run_migrations", "drop_migration_history",
+]
@@ -0,0 +1,106 @@
+# backend/app/migrations/runner.py
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, select, text
+from sqlalchemy.engine import Engine
+
+try:
+    import fcntl  # มีเฉพาะ Linux/macOS (Production บน Railway)
+except ImportError:
+    fcntl = None
+
+# ตารางเก็บเวอร์ชันที่รันไปแล้ว (แยก MetaData จาก Model ของแอป เพื่อไม่ให้ถูก drop_all/create_all ไปด้วย)
+_meta = MetaData()
+schema_migrations = Table(
+    "schema_migrations", _meta,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+MIGRATION_LOCK_KEY = 80420127
+
+
+class Migration:
+    """
+    1 เวอร์ชันของ Schema
+    - upgrade(conn, dialect): conn อยู่ในโหมด AUTOCOMMIT ทุกคำสั่ง Commit ทันที
+      (จำเป็นสำหรับ CREATE INDEX CONCURRENTLY ของ Postgres) จึงต้องเขียนให้รันซ้ำได้ (IF NOT EXISTS)
+    """
+
+    def __init__(self, version: int, name: str, upgrade: Callable):
+        self.version = version
+        self.name = name
+        self.upgrade = upgrade
+
+
+@contextmanager
+def _migration_lock(conn):
+    """กันหลาย Worker รัน Migration พร้อมกันตอนเปิดระบบ"""
+    if conn.dialect.name == "postgresql":
+        # ใช้ try-lock แบบวนรอ ไม่ให้ Worker ที่รออยู่ค้าง Transaction ไว้
+        # (CREATE INDEX CONCURRENTLY ต้องรอทุก Transaction ที่เปิดก่อนหน้าจบ ถ้ารอแบบบล็อกจะติดกันเอง)
+        while not conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY}).scalar():
+            time.sleep(0.5)
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        return
+
+    if fcntl is None:
+        yield
+        return
+    lock_path = os.path.join(tempfile.gettempdir(), "edp_migrations.lock")
+    with open(lock_path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _applied_versions(conn) -> set:
+    schema_migrations.create(conn, checkfirst=True)
+    return {row[0] for row in conn.execute(select(schema_migrations.c.version))}
+
+
+def current_version(engine: Engine) -> int:
+    with engine.connect() as conn:
+        versions = _applied_versions(conn)
+        conn.commit()
+    return max(versions, default=0)
+
+
+def pending_migrations(engine: Engine, migrations: List[Migration]) -> List[Migration]:
+    with engine.connect() as conn:
+        applied = _applied_versions(conn)
+        conn.commit()
+    return [m for m in migrations if m.version not in applied]
+
+
+def run_migrations(engine: Engine, migrations: List[Migration], target: Optional[int] = None) -> List[int]:
+    """รันทุกเวอร์ชันที่ยังไม่เคยรัน (ถึง target ถ้าระบุ) ตามลำดับ คืนรายการเวอร์ชันที่รันในครั้งนี้"""
+    ran = []
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        with _migration_lock(conn):
+            applied = _applied_versions(conn)
+            for migration in sorted(migrations, key=lambda m: m.version):
+                if migration.version in applied or (target is not None and migration.version > target):
+                    continue
+                started = time.perf_counter()
+                print(f"🧱 Migration {migration.version:04d}_{migration.name} ...")
+                migration.upgrade(conn, conn.dialect.name)
+                conn.execute(schema_migrations.insert().values(version=migration.version, name=migration.name))
+                ran.append(migration.version)
+                print(f"   done in {time.perf_counter() - started:.2f}s")
+    return ran
+
+
+def drop_migration_history(engine: Engine):
+    with engine.begin() as conn:
+        schema_migrations.drop(conn, checkfirst=True)
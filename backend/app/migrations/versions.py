@@ -0,0 +1,128 @@
+# backend/app/migrations/versions.py
+# ประวัติ Schema ของระบบ (เพิ่มเวอร์ชันใหม่ต่อท้ายเสมอ ห้ามแก้เวอร์ชันที่ Deploy ไปแล้ว)
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+
+from app.database import Base
+from app.migrations.runner import Migration
+
+
+def _baseline(conn, dialect):
+    # ตารางทั้งหมดตาม Model ปัจจุบัน (ตารางที่มีอยู่แล้วจะถูกข้าม) แทน create_all ใน main.py และ update_db.py เดิม
+    import app.models.edp  # noqa: F401  ให้ Model ทุกตัวลงทะเบียนกับ Base ก่อน
+    Base.metadata.create_all(bind=conn)
+
+
+# (ชื่อ Index, ตาราง, คอลัมน์) ตามลำดับคอลัมน์ที่ใช้ใน WHERE แล้วตามด้วย ORDER BY
+COMPOSITE_INDEXES = [
+    # งานล่าสุดของ Project/Step ตอนส่งงาน (_prepare_submission) และ Rebuild project_progress
+    ("ix_edp_steps_project_step_id", "edp_steps", ("project_id", "step_number", "id")),
+    # โปรเจกต์ของนักเรียน (/edp/projects) และรายการโปรเจกต์ของครูเรียงตามวันที่สร้าง
+    ("ix_projects_owner_created", "projects", ("owner_id", "created_at")),
+    # รายชื่อ/การกระจายนักเรียนตามห้อง (/edp/teacher/stats, /edp/teacher/students)
+    ("ix_users_role_class_room", "users", ("role", "class_room")),
+    # ประวัติการสอบของนักเรียน (/quiz/history) เรียงจากล่าสุด
+    ("ix_quiz_attempts_student_created", "quiz_attempts", ("student_id", "created_at")),
+]
+
+
+def create_index(conn, dialect, name: str, table: str, columns):
+    cols = ", ".join(columns)
+    if dialect == "postgresql":
+        # Index ที่สร้างแบบ CONCURRENTLY แล้วล้มกลางทางจะค้างเป็น INVALID (IF NOT EXISTS จะข้ามไป) ต้องลบก่อน
+        invalid = conn.execute(text(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ), {"name": name}).first()
+        if invalid:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        # ไม่ล็อกการเขียนของตารางระหว่างสร้าง Index (ระบบใช้งานต่อได้ระหว่าง Deploy)
+        conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({cols})"))
+    else:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({cols})"))
+
+
+# Keyset Pagination ของรายการฝั่งครู (/edp/teacher/students, /edp/teacher/projects)
+KEYSET_INDEXES = [
+    ("ix_users_role_id", "users", ("role", "id")),
+    ("ix_projects_created_id", "projects", ("created_at", "id")),
+]
+
+
+def _create_indexes(conn, dialect, indexes):
+    for name, table, columns in indexes:
+        create_index(conn, dialect, name, table, columns)
+        print(f"   + {name} ON {table} ({', '.join(columns)})")
+    if dialect == "postgresql":
+        for table in sorted({table for _, table, _ in indexes}):
+            conn.execute(text(f"ANALYZE {table}"))
+    else:
+        conn.execute(text("ANALYZE"))
+
+
+# อ่านรายชื่อนักเรียนที่ Active ล่าสุดตอน Flush ของ ActivityTracker (ทุก Worker ทุกรอบ)
+ACTIVITY_INDEXES = [
+    ("ix_users_role_last_active", "users", ("role", "last_active_at")),
+]
+
+
+def _composite_indexes(conn, dialect):
+    _create_indexes(conn, dialect, COMPOSITE_INDEXES)
+
+
+def _keyset_indexes(conn, dialect):
+    _create_indexes(conn, dialect, KEYSET_INDEXES)
+
+
+def _activity_indexes(conn, dialect):
+    _create_indexes(conn, dialect, ACTIVITY_INDEXES)
+
+
+def _backfill_project_progress(conn, dialect):
+    # เติม project_progress จาก edp_steps ที่มีอยู่ก่อนเพิ่มตาราง
+    from app.services.progress import ensure_progress
+    db = Session(bind=conn)
+    try:
+        created = ensure_progress(db)
+        print(f"   project_progress: {created} rows")
+    finally:
+        db.close()
+
+
+def _data_version_counter(conn, dialect):
+    # ตาราง data_versions มาจาก baseline (create_all) แล้ว ใส่แถวตัวนับเริ่มต้น
+    import app.models.edp  # noqa: F401
+    Base.metadata.create_all(bind=conn)
+    from app.services.data_version import ensure_data_version
+    db = Session(bind=conn)
+    try:
+        ensure_data_version(db)
+    finally:
+        db.close()
+
+
+def _progress_ever_completed(conn, dialect):
+    # ฐานข้อมูลใหม่ได้คอลัมน์นี้จาก baseline (create_all) แล้ว เพิ่มเฉพาะฐานข้อมูลเดิม
+    columns = {col["name"] for col in inspect(conn).get_columns("project_progress")}
+    if "ever_completed" not in columns:
+        conn.execute(text("ALTER TABLE project_progress ADD COLUMN ever_completed BOOLEAN DEFAULT FALSE"))
+    # นับโปรเจกต์ที่เสร็จแบบเดิม: มีงาน Step 6 ครั้งใดก็ได้ที่ได้ >= 60
+    updated = conn.execute(text(
+        "UPDATE project_progress SET ever_completed = EXISTS ("
+        " SELECT 1 FROM edp_steps s WHERE s.project_id = project_progress.project_id"
+        " AND s.step_number = 6 AND COALESCE(s.teacher_score, s.score) >= 60"
+        ") WHERE step_number = 6"
+    )).rowcount
+    print(f"   project_progress.ever_completed: {updated} rows")
+    create_index(conn, dialect, "ix_project_progress_ever_completed", "project_progress", ("ever_completed",))
+
+
+MIGRATIONS = [
+    Migration(1, "baseline", _baseline),
+    Migration(2, "composite_indexes", _composite_indexes),
+    Migration(3, "backfill_project_progress", _backfill_project_progress),
+    Migration(4, "keyset_pagination_indexes", _keyset_indexes),
+    Migration(5, "data_version_counter", _data_version_counter),
+    Migration(6, "activity_index", _activity_indexes),
+    Migration(7, "progress_ever_completed", _progress_ever_completed),
+]
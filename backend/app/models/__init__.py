@@ -0,0 +1,2 @@
+# ลงทะเบียน Hook ตัวนับเวอร์ชันข้อมูล (ETag ของ Dashboard ครู) ให้ทุก Session ที่ใช้ Model ของระบบ
+import app.services.data_version  # noqa: F401
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, Float, DateTime, JSON, Boolean
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, Float, DateTime, JSON, Boolean, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -84,7 +84,7 @@ class EdpStep(Base):
     # ✅ NEW: เวลาที่ใช้ในการทำ Step นี้ (วินาที) - ต้องส่งมาจาก Frontend
     time_spent_seconds = Column(Integer, default=0) 
 
-    status = Column(String, default="submitted") # submitted, passed, revision_needed
+    status = Column(String, default="submitted") # pending, submitted, passed, revision_needed, grading_failed
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -116,4 +116,88 @@ class QuizAttempt(Base):
     time_spent_seconds = Column(Integer) # เวลาที่ใช้ (วินาที)
     answers_log = Column(JSON) # เก็บ Log การตอบรายข้อ [{"q_id":1, "choice":0, "is_correct":True}, ...]
     
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+# 6. ตาราง Cache ผลตรวจจาก AI (L2) - ใช้ร่วมกันทุก Worker และไม่หายเมื่อ Deploy ใหม่
+class AiResultCache(Base):
+    __tablename__ = "ai_result_cache"
+    __table_args__ = (
+        UniqueConstraint("cache_key", "rubric_version", name="uq_ai_result_cache_key_version"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String(64), index=True)      # MD5 จาก GeminiService._get_cache_key(step_number, content)
+    rubric_version = Column(String(64), index=True) # เวอร์ชันของเกณฑ์/Prompt ที่ใช้ตรวจ
+    step_number = Column(Integer)
+
+    result = Column(JSON)                           # ผลตรวจเต็มรูปแบบที่ได้จาก AI
+    hit_count = Column(Integer, default=0)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), index=True)
+
+# 7. ตารางคิวงานตรวจด้วย AI (Grading Job Queue) - อยู่ใน DB เพื่อไม่ให้งานหายเมื่อ Worker Restart
+class GradingJob(Base):
+    __tablename__ = "grading_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    step_id = Column(Integer, ForeignKey("edp_steps.id"), index=True)
+
+    status = Column(String, default="queued", index=True) # queued, running, done, failed
+    attempts = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+
+    worker_id = Column(String, nullable=True)                 # Worker ที่กำลังถืองานนี้อยู่
+    locked_at = Column(DateTime(timezone=True), nullable=True) # เวลาที่ถูกหยิบไปทำ (ใช้คืนงานที่ค้างเมื่อ Worker ตาย)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    step = relationship("EdpStep")
+
+# 8. ตาราง Lease ของการเรียก Gemini (Global Rate Limiter) - ใช้นับโควตารวมทุก Worker
+class AiRateLease(Base):
+    __tablename__ = "ai_rate_leases"
+
+    id = Column(Integer, primary_key=True, index=True)
+    holder = Column(String)                                       # hostname:pid ของ Worker ที่ถือ Lease
+    acquired_at = Column(DateTime(timezone=True), index=True)     # ใช้นับ RPM ย้อนหลัง 60 วินาที
+    expires_at = Column(DateTime(timezone=True), index=True)      # กัน Lease ค้างเมื่อ Worker ตาย
+    released_at = Column(DateTime(timezone=True), nullable=True, index=True)
+
+# 9. บันทึกการเปลี่ยนแปลงข้อมูลผู้ใช้ (ใช้ล้าง Cache ผู้ใช้ที่ Login ของทุก Worker)
+class PrincipalInvalidation(Base):
+    __tablename__ = "principal_invalidations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+# 10. ความพยายาม Login ที่ล้มเหลว (Login Throttle แบบใช้ร่วมกันทุก Worker)
+class LoginAttempt(Base):
+    __tablename__ = "login_attempts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String, index=True)                              # "account:<email>" หรือ "ip:<address>"
+    created_at = Column(DateTime(timezone=True), index=True)
+
+# 11. ความคืบหน้าล่าสุดของแต่ละโปรเจกต์ (1 แถวต่อ Project + Step) อัปเดตใน Transaction เดียวกับการส่ง/ให้คะแนน
+# ใช้แทนการหา max(edp_steps.id) GROUP BY ซึ่งช้าลงเรื่อย ๆ ตามจำนวนครั้งที่ส่งงาน
+class ProjectProgress(Base):
+    __tablename__ = "project_progress"
+
+    project_id = Column(Integer, ForeignKey("projects.id"), primary_key=True)
+    step_number = Column(Integer, primary_key=True)
+    latest_step_id = Column(Integer, ForeignKey("edp_steps.id"), index=True)  # งานที่ส่งล่าสุดของ Step นี้
+    effective_score = Column(Float, nullable=True)                             # คะแนนครู (ถ้ามี) ไม่งั้นคะแนน AI
+    is_current = Column(Boolean, default=False, index=True)                     # Step ที่นักเรียนส่งล่าสุดในโปรเจกต์
+    completed = Column(Boolean, default=False, index=True)                      # ผ่าน Step 6 แล้ว (มีได้แถวเดียวต่อโปรเจกต์)
+    ever_completed = Column(Boolean, default=False, index=True)                 # เคยมีงาน Step 6 ที่ผ่าน (งานใดก็ได้ ไม่ถูกล้าง) ใช้นับบน Dashboard
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+# 12. ตัวนับเวอร์ชันข้อมูล (เพิ่มทุกครั้งที่ users/projects/edp_steps ถูกเขียน) ใช้ทำ ETag ของหน้า Dashboard ครู
+class DataVersion(Base):
+    __tablename__ = "data_versions"
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
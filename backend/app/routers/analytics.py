@@ -1,15 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import func, desc, case
-from app.database import get_db
+from app.database import get_session, db_endpoint
 from app.models.edp import EdpStep, Project, User
 from app.routers.auth import get_current_user # ✅ Import ตัวตรวจสอบ User
 
 router = APIRouter(prefix="/analytics", tags=["Teacher Analytics"])
 
 @router.get("/overview")
+@db_endpoint
 def get_overview(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
     current_user: User = Depends(get_current_user) # ✅ บังคับต้องมี Token ยืนยันตัวตน
 ):
     """
@@ -52,8 +53,9 @@ def get_overview(
     }
 
 @router.get("/at-risk-students")
+@db_endpoint
 def get_at_risk_students(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
     current_user: User = Depends(get_current_user) # ✅ บังคับต้องมี Token
 ):
     """
@@ -99,8 +101,9 @@ def get_at_risk_students(
     ]
 
 @router.get("/critical-thinking-matrix")
+@db_endpoint
 def get_critical_thinking_matrix(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
     current_user: User = Depends(get_current_user) # ✅ บังคับต้องมี Token
 ):
     """
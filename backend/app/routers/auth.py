@@ -1,16 +1,21 @@
 # backend/app/routers/auth.py
+import asyncio
+import math
 from datetime import datetime, timedelta, timezone
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, EmailStr
 from jose import jwt, JWTError
 
 from app.schemas.edp import ChangePassword
-from app.database import get_db
+from app.database import get_session, db_endpoint, run_db, SessionLocal
 from app.models.edp import User
 from app.core import security
+from app.services.principal_cache import get_principal_cache, invalidate_principal
+from app.services.activity_tracker import get_activity_tracker
+from app.services.login_throttle import get_login_throttle, client_ip
 
 from app.core.config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
 
@@ -31,10 +36,28 @@ class ProfileUpdate(BaseModel):
     last_name: Optional[str] = None
     class_room: Optional[str] = None
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-):
+def _load_user(email: str) -> Optional[User]:
+    """
+    ค้นผู้ใช้ด้วย Session อายุสั้นของตัวเอง (ไม่ใช่ Session ของ Request) แล้วคืน Connection ทันที
+    ผู้ใช้ที่ได้ไม่ผูกกับ Session เหมือนผู้ใช้จาก Cache
+    """
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == email).first()
+        if user is not None:
+            get_principal_cache().put(user)
+        return user
+    finally:
+        db.close()
+
+def _sync_principals():
+    db = SessionLocal()
+    try:
+        get_principal_cache().sync_invalidations(db)
+    finally:
+        db.close()
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -48,43 +71,41 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
 
-    user = db.query(User).filter(User.email == email).first()
-    if user is None:
-        raise credentials_exception
-
-    # [OPTIMIZED & FIXED] อัปเดต last_active_at เฉพาะเมื่อผ่านไปแล้วอย่างน้อย 1 นาที
-    # และแก้ไขปัญหา Timezone Crash บน SQLite
-    now = datetime.now(timezone.utc)
-    
-    if user.last_active_at is None:
-        user.last_active_at = now
-        db.commit()
+    # [NEW] Principal Cache: Request ส่วนใหญ่ยืนยันตัวตนได้โดยไม่ต้อง Query
+    # ถึงรอบ Sync การ Invalidate แล้ว ให้ Request เดียวเป็นคน Sync ที่เหลือใช้ Cache ต่อ
+    cache = get_principal_cache()
+    if cache.claim_sync():
+        try:
+            await asyncio.to_thread(_sync_principals)
+        except Exception as e:
+            print(f"Principal cache sync error: {e}")
+
+    user_id = payload.get("id")
+    snapshot = cache.get(user_id, email) if user_id is not None else None
+    if snapshot is not None:
+        user = cache.materialize(snapshot)
     else:
-        # ทำให้มั่นใจว่า last_active_at จาก DB มี Timezone แน่นอนก่อนเปรียบเทียบ
-        last_active = user.last_active_at
-        if last_active.tzinfo is None:
-            last_active = last_active.replace(tzinfo=timezone.utc)
-            
-        time_diff = (now - last_active).total_seconds()
-        
-        if time_diff > 60:
-            user.last_active_at = now
-            db.commit()
+        # [OPTIMIZED] Query ใน Thread ด้วย Session อายุสั้น ไม่ถือ Connection ของ Request ไว้ตลอด Endpoint
+        user = await asyncio.to_thread(_load_user, email)
+        if user is None:
+            raise credentials_exception
 
+    # [OPTIMIZED] last_active_at ไม่ถูก Commit ใน Request แล้ว Tracker รวมเขียนเป็น Batch ทุกไม่กี่วินาที
+    get_activity_tracker().touch(user.id, user.role)
     return user
 
 # --- API Endpoints ---
 
-@router.post("/register", status_code=201)
-def register(user_in: UserRegister, db: Session = Depends(get_db)):
+def _check_register_available(db: Session, user_in: UserRegister):
     if db.query(User).filter(User.email == user_in.email).first():
         raise HTTPException(status_code=400, detail="อีเมลนี้ถูกใช้งานแล้ว")
     if db.query(User).filter(User.student_id == user_in.student_id).first():
         raise HTTPException(status_code=400, detail="เลขประจำตัวนี้มีในระบบแล้ว")
 
+def _insert_user(db: Session, user_in: UserRegister, hashed_password: str) -> User:
     new_user = User(
         email=user_in.email,
-        hashed_password=security.get_password_hash(user_in.password),
+        hashed_password=hashed_password,
         student_id=user_in.student_id,
         first_name=user_in.first_name,
         last_name=user_in.last_name,
@@ -94,16 +115,52 @@ def register(user_in: UserRegister, db: Session = Depends(get_db)):
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
+    return new_user
+
+# [OPTIMIZED] Endpoint ที่ใช้ bcrypt เป็น async def: Query ผ่าน run_db ส่วน bcrypt รันใน Thread Pool
+# (ถ้าใช้ db_endpoint ในโหมด DB_MODE=async ตัวฟังก์ชันทั้งก้อนจะรันบน Event Loop รวมถึง bcrypt ด้วย)
+@router.post("/register", status_code=201)
+async def register(user_in: UserRegister, db: Session = Depends(get_session)):
+    await run_db(db, _check_register_available, user_in)
+    hashed_password = await asyncio.to_thread(security.get_password_hash, user_in.password)
+    new_user = await run_db(db, _insert_user, user_in, hashed_password)
     return {"message": "สมัครสมาชิกสำเร็จ", "student_id": new_user.student_id}
 
+def _find_login_user(db: Session, email: str) -> Optional[User]:
+    try:
+        return db.query(User).filter(User.email == email).first()
+    finally:
+        db.close()
+
 @router.post("/login")
-def login(
+async def login(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_session)
 ):
-    user = db.query(User).filter(User.email == form_data.username).first()
-    if not user or not security.verify_password(form_data.password, user.hashed_password):
+    # [NEW] ตัดการเดารหัสผ่านที่เกินเพดานก่อนค้นผู้ใช้และก่อน bcrypt (ไม่กิน CPU ของ Worker)
+    # IP มาจาก client_ip(): รายการใน X-Forwarded-For ที่ Proxy ของเราต่อท้าย (ไม่ใช่รายการซ้ายสุดที่ผู้ใช้ปลอมได้)
+    throttle = get_login_throttle()
+    ip = client_ip(request)
+    retry_after = await asyncio.to_thread(throttle.retry_after, form_data.username, ip)
+    if retry_after > 0:
+        raise HTTPException(
+            status_code=429,
+            detail="พยายามเข้าสู่ระบบผิดหลายครั้งเกินไป กรุณารอสักครู่แล้วลองใหม่",
+            headers={"Retry-After": str(int(math.ceil(retry_after)))}
+        )
+
+    user = await run_db(db, _find_login_user, form_data.username)
+    if not user:
+        await asyncio.to_thread(throttle.record_failure, form_data.username, ip, False)
+        raise HTTPException(status_code=400, detail="อีเมลหรือรหัสผ่านไม่ถูกต้อง")
+
+    # [OPTIMIZED] bcrypt ใช้ CPU ~0.2 วินาที: รันใน Thread Pool ไม่บล็อก Event Loop
+    throttle.record_hash()
+    if not await asyncio.to_thread(security.verify_password, form_data.password, user.hashed_password):
+        await asyncio.to_thread(throttle.record_failure, form_data.username, ip)
         raise HTTPException(status_code=400, detail="อีเมลหรือรหัสผ่านไม่ถูกต้อง")
+    await asyncio.to_thread(throttle.record_success, form_data.username)
 
     # [CLEAN CODE] ในฟังก์ชันสร้าง Token มีค่า Default ของ EXP อยู่แล้ว ตัดทิ้งให้โค้ดสั้นลงได้
     access_token = security.create_access_token(
@@ -131,44 +188,57 @@ def get_my_profile(current_user: User = Depends(get_current_user)):
     }
 
 @router.patch("/profile")
+@db_endpoint
 def update_my_profile(
     profile_data: ProfileUpdate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
-    if profile_data.first_name: current_user.first_name = profile_data.first_name
-    if profile_data.last_name: current_user.last_name = profile_data.last_name
-    if profile_data.class_room: current_user.class_room = profile_data.class_room
+    # current_user อาจมาจาก Cache (ไม่ผูกกับ Session) ต้องโหลดแถวจริงมาแก้
+    user = db.query(User).filter(User.id == current_user.id).first()
+    if profile_data.first_name: user.first_name = profile_data.first_name
+    if profile_data.last_name: user.last_name = profile_data.last_name
+    if profile_data.class_room: user.class_room = profile_data.class_room
     
+    invalidate_principal(db, user.id)
     db.commit()
     return {"message": "อัปเดตข้อมูลสำเร็จ"}
 
+def _load_user_by_id(db: Session, user_id: int) -> Optional[User]:
+    return db.query(User).filter(User.id == user_id).first()
+
+def _save_password(db: Session, user: User, hashed_password: str):
+    user.hashed_password = hashed_password
+    invalidate_principal(db, user.id)
+    db.commit()
+
 @router.post("/reset-password/{student_id}")
-def reset_student_password(
+async def reset_student_password(
     student_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
     if current_user.role != "teacher":
         raise HTTPException(status_code=403, detail="สำหรับครูเท่านั้น")
 
-    student = db.query(User).filter(User.id == student_id).first()
+    student = await run_db(db, _load_user_by_id, student_id)
     if not student:
         raise HTTPException(status_code=404, detail="ไม่พบข้อมูลนักเรียน")
 
-    student.hashed_password = security.get_password_hash("password123")
-    db.commit()
+    hashed_password = await asyncio.to_thread(security.get_password_hash, "password123")
+    await run_db(db, _save_password, student, hashed_password)
     return {"message": f"รีเซ็ตรหัสผ่านของ {student.first_name} เป็น 'password123' เรียบร้อยแล้ว"}
 
 @router.post("/change-password")
-def change_password(
+async def change_password(
     password_data: ChangePassword,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
-    if not security.verify_password(password_data.old_password, current_user.hashed_password):
+    user = await run_db(db, _load_user_by_id, current_user.id)
+    if not await asyncio.to_thread(security.verify_password, password_data.old_password, user.hashed_password):
         raise HTTPException(status_code=400, detail="รหัสผ่านเดิมไม่ถูกต้อง")
 
-    current_user.hashed_password = security.get_password_hash(password_data.new_password)
-    db.commit()
-    return {"message": "เปลี่ยนรหัสผ่านสำเร็จ"}
\ No newline at end of file
+    hashed_password = await asyncio.to_thread(security.get_password_hash, password_data.new_password)
+    await run_db(db, _save_password, user, hashed_password)
+    return {"message": "เปลี่ยนรหัสผ่านสำเร็จ"}
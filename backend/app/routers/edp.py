@@ -1,16 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+import json
+import time
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Request, Response, UploadFile, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session, aliased
-from sqlalchemy import desc, func, distinct, case, and_
+from sqlalchemy import desc, func, distinct, case, and_, or_
 from datetime import datetime, timezone, timedelta 
-from typing import List
-from app.database import get_db
+from typing import List, Optional
+from app.database import get_session, db_endpoint, run_db, SessionLocal
 # ✅ เพิ่ม QuizAttempt เข้ามาในการ Import ด้านล่างนี้
-from app.models.edp import EdpStep, Project, User, QuizAttempt
+from app.models.edp import EdpStep, Project, User, QuizAttempt, GradingJob, ProjectProgress
 from app.schemas.edp import (
     StepCreate, StepResponse, ProjectCreate, ProjectWithStudent, 
     TeacherGrade, StudentUpdate, UserInfo, DashboardStats
 )
-from app.services.gemini_service import GeminiService
+from app.services.gemini_service import GeminiService, get_gemini_service
+from app.services.persistent_cache import purge_ai_result_cache
+from app.services.grading import apply_analysis
+from app.services.progress import record_step, refresh_score, delete_progress
+from app.services.grading_queue import get_grading_queue
+from app.services.similarity_index import get_similarity_index
+from app.services.principal_cache import get_principal_cache, invalidate_principal
+from app.services.activity_tracker import get_activity_tracker
+from app.services.login_throttle import get_login_throttle
+from app.services import roster_import
+from app.services.pagination import InvalidCursor, decode_cursor, encode_cursor, get_count_cache
+from app.services.data_version import get_data_version, bump_data_version
+from app.core.http_cache import conditional_response, make_etag
+from app.core.config import (
+    AI_RUBRIC_VERSION, AI_GRADING_MODE, AI_GRADING_POLL_SECONDS,
+    AI_SIMILARITY_ENABLED, AI_SIMILARITY_REUSE_RESULT, AI_SIMILARITY_REUSE_THRESHOLD,
+    AI_ADMISSION_MAX_INFLIGHT, AI_ADMISSION_MAX_QUEUE, AI_ADMISSION_RETRY_AFTER,
+    PAGINATION_DEFAULT_LIMIT, PAGINATION_MAX_LIMIT, ACTIVITY_WINDOW_SECONDS
+)
 from app.routers.auth import get_current_user
 
 router = APIRouter(
@@ -18,27 +40,44 @@ router = APIRouter(
     tags=["EDP Process"]
 )
 
-def get_ai_service():
-    return GeminiService()
+def get_ai_service() -> GeminiService:
+    # ใช้ Instance เดียวตลอดอายุ Worker เพื่อให้ Cache ผลตรวจทำงานได้จริง
+    return get_gemini_service()
 
 # ==========================================
 # 📊 TEACHER ANALYTICS & MANAGEMENT (Optimized)
 # ==========================================
 
 @router.get("/teacher/stats", response_model=DashboardStats)
+@db_endpoint
 def get_dashboard_stats(
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
     if current_user.role != 'teacher':
         raise HTTPException(status_code=403, detail="Access denied: Teachers only")
 
+    # [NEW] Conditional GET: ข้อมูลไม่เปลี่ยนตั้งแต่รอบก่อน ตอบ 304 ด้วยการอ่านตัวนับ 1 แถว ไม่ต้องรัน Aggregate
+    # จำนวนผู้ใช้ออนไลน์นับต่อ Worker (ค่าไม่ตรงกันระหว่าง Worker) จึงไม่ใส่ใน ETag
+    # ใช้ช่วงเวลาเท่ากับหน้าต่าง "ออนไลน์" แทน: ทุก Worker ได้ ETag เดียวกัน (Dashboard Poll ทุก 10 วินาทียังได้ 304)
+    # แลกกับตัวเลขออนไลน์ใน 304 ที่ค้างได้ไม่เกิน ACTIVITY_WINDOW_SECONDS ซึ่งเป็นความละเอียดของตัวนับอยู่แล้ว
+    activity_bucket = int(time.time() // ACTIVITY_WINDOW_SECONDS)
+    not_modified = conditional_response(
+        request, response, make_etag("stats", get_data_version(db), activity_bucket)
+    )
+    if not_modified is not None:
+        return not_modified
+
+    total_active_users = get_activity_tracker().active_count("student")
     total_students = db.query(func.count(User.id)).filter(User.role == 'student').scalar()
     total_projects = db.query(func.count(Project.id)).scalar()
     
-    completed_projects = db.query(func.count(distinct(Project.id))).join(EdpStep).filter(
-        EdpStep.step_number == 6,
-        func.coalesce(EdpStep.teacher_score, EdpStep.score) >= 60
+    # [OPTIMIZED] นับจาก project_progress (1 แถวต่อโปรเจกต์ที่เคยผ่าน Step 6) แทนการ Join edp_steps ทั้งตาราง
+    # ความหมายเดิม: มีงาน Step 6 ครั้งใดก็ได้ที่ได้ >= 60 (ไม่ใช่เฉพาะงานล่าสุด)
+    completed_projects = db.query(func.count(ProjectProgress.project_id)).filter(
+        ProjectProgress.ever_completed.is_(True)
     ).scalar()
 
     avg_score = db.query(func.avg(func.coalesce(EdpStep.teacher_score, EdpStep.score))).scalar() or 0.0
@@ -50,12 +89,6 @@ def get_dashboard_stats(
     
     avg_time_map = {f"Step {s[0]}": round(s[1] or 0, 2) for s in time_stats}
 
-    one_min_ago = datetime.now(timezone.utc) - timedelta(minutes=1)
-    total_active_users = db.query(func.count(User.id)).filter(
-        User.role == 'student',
-        User.last_active_at >= one_min_ago
-    ).scalar()
-
     class_stats = db.query(
         User.class_room, 
         func.count(User.id)
@@ -74,44 +107,205 @@ def get_dashboard_stats(
         student_performance_avg=round(avg_score, 2)
     )
 
+@router.get("/teacher/ai-stats")
+async def get_ai_stats(
+    ai_service: GeminiService = Depends(get_ai_service),
+    current_user: User = Depends(get_current_user)
+):
+    """สถิติการทำงานของระบบตรวจด้วย AI ใน Worker นี้ (Cache hit/miss, คิวงาน ฯลฯ)"""
+    if current_user.role != 'teacher':
+        raise HTTPException(status_code=403, detail="Access denied: Teachers only")
+
+    queue = get_grading_queue()
+    stats = ai_service.get_stats()
+    stats["grading_queue"] = {**queue.stats(), "depth": await queue.depth()}
+    stats["similarity_index"] = get_similarity_index().stats() if AI_SIMILARITY_ENABLED else None
+    stats["admission"] = dict(_admission_rejected)
+    stats["principal_cache"] = get_principal_cache().stats()
+    stats["activity"] = get_activity_tracker().stats()
+    stats["login_throttle"] = get_login_throttle().stats()
+    stats["count_cache"] = get_count_cache().stats()
+    return stats
+
+@router.delete("/teacher/ai-cache")
+@db_endpoint
+def purge_ai_cache(
+    scope: str = "stale",
+    db: Session = Depends(get_session),
+    ai_service: GeminiService = Depends(get_ai_service),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    ล้าง Cache ผลตรวจจาก AI แบบ Bulk
+    - scope=stale: ลบผลตรวจของ Rubric เวอร์ชันเก่า (ใช้หลังเปลี่ยนเกณฑ์)
+    - scope=expired: ลบเฉพาะรายการที่หมดอายุ
+    - scope=all: ล้างทั้งหมด
+    """
+    if current_user.role != 'teacher':
+        raise HTTPException(status_code=403, detail="Access denied: Teachers only")
+
+    if scope == "stale":
+        deleted = purge_ai_result_cache(db, keep_version=AI_RUBRIC_VERSION)
+    elif scope == "expired":
+        deleted = purge_ai_result_cache(db, expired_only=True)
+    elif scope == "all":
+        deleted = purge_ai_result_cache(db)
+        ai_service.clear_local_cache()
+    else:
+        raise HTTPException(status_code=400, detail="scope must be one of: stale, expired, all")
+
+    return {"message": "AI cache purged", "deleted": deleted, "rubric_version": AI_RUBRIC_VERSION}
+
+def _page_limit(limit: int) -> int:
+    return max(1, min(limit, PAGINATION_MAX_LIMIT))
+
+def _decode_page_cursor(kind: str, cursor: str) -> dict:
+    try:
+        values = decode_cursor(kind, cursor)
+        values["id"] = int(values["id"])
+        return values
+    except (InvalidCursor, KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="cursor ไม่ถูกต้อง")
+
+def _cursor_datetime(value: Optional[str]) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="cursor ไม่ถูกต้อง")
+
+def _set_page_headers(response: Response, next_cursor: Optional[str], total: Optional[int]):
+    """Body ยังเป็น List เหมือนเดิม ข้อมูลการแบ่งหน้าส่งทาง Header (Frontend เดิมไม่ต้องเปลี่ยนรูปแบบข้อมูล)"""
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if total is not None:
+        response.headers["X-Total-Count"] = str(total)
+
 @router.get("/teacher/students", response_model=List[UserInfo])
+@db_endpoint
 def get_all_students(
-    skip: int = 0,
-    limit: int = 1000, 
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = PAGINATION_DEFAULT_LIMIT,
+    include_total: bool = False,
+    db: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
+    """
+    [OPTIMIZED] แบ่งหน้าแบบ Keyset เรียงตาม id ล่าสุดก่อน (หน้าลึก ๆ เร็วเท่าหน้าแรก)
+    - หน้าถัดไป: ส่ง cursor จาก Header X-Next-Cursor (ไม่มี Header = หน้าสุดท้าย)
+    - include_total=true: ใส่ X-Total-Count จากตัวนับที่ Cache ไว้
+    """
     if current_user.role != 'teacher':
         raise HTTPException(status_code=403, detail="Access denied")
-    
-    limit = min(limit, 1000)
-    
-    results = db.query(
-        User,
-        func.count(distinct(Project.id)).label("project_count"),
-        func.avg(func.coalesce(EdpStep.teacher_score, EdpStep.score)).label("average_score")
-    ).outerjoin(Project, User.id == Project.owner_id)\
-     .outerjoin(EdpStep, Project.id == EdpStep.project_id)\
-     .filter(User.role == 'student')\
-     .group_by(User.id)\
-     .order_by(User.id.desc())\
-     .offset(skip).limit(limit)\
-     .all()
-    
+
+    version = get_data_version(db)
+    not_modified = conditional_response(request, response, make_etag("students", version, request.url.query))
+    if not_modified is not None:
+        return not_modified
+
+    limit = _page_limit(limit)
+    query = db.query(User).filter(User.role == 'student')
+    if cursor:
+        query = query.filter(User.id < _decode_page_cursor("students", cursor)["id"])
+    students = query.order_by(User.id.desc()).limit(limit + 1).all()
+
+    has_more = len(students) > limit
+    students = students[:limit]
+    student_ids = [s.id for s in students]
+
+    # สถิติรายคนคำนวณเฉพาะนักเรียนในหน้านี้ (เดิม Join 3 ตาราง + GROUP BY ทั้งหมดก่อนตัดหน้า)
+    project_counts, avg_scores = {}, {}
+    if student_ids:
+        project_counts = dict(db.query(Project.owner_id, func.count(Project.id))
+                              .filter(Project.owner_id.in_(student_ids))
+                              .group_by(Project.owner_id).all())
+        avg_scores = dict(db.query(Project.owner_id, func.avg(func.coalesce(EdpStep.teacher_score, EdpStep.score)))
+                          .join(EdpStep, EdpStep.project_id == Project.id)
+                          .filter(Project.owner_id.in_(student_ids))
+                          .group_by(Project.owner_id).all())
+
     response_data = []
-    for user, p_count, avg_score in results:
+    for user in students:
         s_info = UserInfo.from_orm(user)
-        s_info.project_count = p_count or 0
-        s_info.average_score = round(avg_score or 0.0, 2)
+        s_info.project_count = project_counts.get(user.id, 0)
+        s_info.average_score = round(avg_scores.get(user.id) or 0.0, 2)
         response_data.append(s_info)
-        
+
+    total = None
+    if include_total:
+        total = get_count_cache().get(
+            f"students:{version}", lambda: db.query(func.count(User.id)).filter(User.role == 'student').scalar()
+        )
+    next_cursor = encode_cursor("students", id=students[-1].id) if has_more else None
+    _set_page_headers(response, next_cursor, total)
     return response_data
 
+def _check_roster(db: Session, rows: List[dict], class_room: Optional[str]):
+    """ตรวจไฟล์รายชื่อ + หาบัญชีที่ซ้ำกับในระบบ (Query เดียว) แล้วคืน Connection ก่อนเริ่ม Hash รหัสผ่าน"""
+    try:
+        valid, errors = roster_import.validate_rows(rows, class_room)
+        accepted, conflicts = roster_import.find_conflicts(db, valid)
+        return accepted, errors + conflicts
+    finally:
+        db.close()
+
+def _insert_roster(accepted, hashes) -> int:
+    session = SessionLocal()
+    try:
+        return roster_import.insert_rows(session, accepted, hashes)
+    finally:
+        session.close()
+
+@router.post("/teacher/students/import")
+async def import_students(
+    file: UploadFile = File(...),
+    class_room: Optional[str] = Form(None),
+    dry_run: bool = Form(False),
+    db: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    [NEW] นำเข้ารายชื่อนักเรียนทั้งห้องจากไฟล์ CSV/JSON
+    - คอลัมน์: email, student_id, first_name, last_name, class_room (ไม่บังคับ), password (ไม่บังคับ)
+    - class_room: ใช้กับแถวที่ไม่ได้ระบุห้อง
+    - dry_run=true: ตรวจไฟล์อย่างเดียว ไม่สร้างบัญชี
+    แถวที่ผิดจะถูกรายงานพร้อมเลขแถว แถวที่ถูกต้องจะถูกสร้างทั้งหมดในคำสั่ง Insert เดียว
+    """
+    if current_user.role != 'teacher':
+        raise HTTPException(status_code=403, detail="Access denied")
+
+    started = time.perf_counter()
+    filename = (file.filename or "").lower()
+    fmt = "json" if filename.endswith(".json") or file.content_type == "application/json" else "csv"
+    try:
+        rows = roster_import.parse_roster(await file.read(), fmt)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"อ่านไฟล์รายชื่อไม่สำเร็จ: {e}")
+
+    accepted, errors = await run_db(db, _check_roster, rows, class_room)
+
+    created = 0
+    if accepted and not dry_run:
+        # [OPTIMIZED] bcrypt ใช้ CPU ~0.2 วินาทีต่อคน: Hash แบบขนานหลาย Process นอก Event Loop
+        # (เดิมต้องสมัครทีละคน 40 คน ≈ 8 วินาทีบน Core เดียว และบล็อก Request อื่นทั้งหมด)
+        hashes = await asyncio.to_thread(
+            roster_import.hash_passwords,
+            [item.password or roster_import.DEFAULT_PASSWORD for _, item in accepted]
+        )
+        try:
+            created = await asyncio.to_thread(_insert_roster, accepted, hashes)
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+
+    return roster_import.build_report(len(rows), len(accepted), created, errors, started, dry_run)
+
 @router.patch("/teacher/students/{student_id}")
+@db_endpoint
 def update_student(
     student_id: int,
     update_data: StudentUpdate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
     if current_user.role != 'teacher':
@@ -126,20 +320,37 @@ def update_student(
     if update_data.student_id: student.student_id = update_data.student_id
     if update_data.class_room: student.class_room = update_data.class_room
     
+    invalidate_principal(db, student.id)
     db.commit()
     db.refresh(student)
     return {"message": "Student updated successfully"}
 
+def _lock_for_delete(db: Session, project_ids: List[int]):
+    """
+    ล็อกข้อมูลที่จะลบตามลำดับเดียวกับการส่งงาน/ตรวจงาน
+    (projects -> edp_steps -> grading_jobs -> data_versions -> project_progress)
+    แล้วจึงลบตามลำดับ Foreign Key ได้โดยไม่ Deadlock กับ Submit ที่เกิดพร้อมกันบน Postgres
+    """
+    db.query(Project.id).filter(Project.id.in_(project_ids)).order_by(Project.id).with_for_update().all()
+    step_ids = [step_id for (step_id,) in db.query(EdpStep.id).filter(
+        EdpStep.project_id.in_(project_ids)
+    ).order_by(EdpStep.id).with_for_update().all()]
+    if step_ids:
+        db.query(GradingJob.id).filter(GradingJob.step_id.in_(step_ids)).order_by(GradingJob.id).with_for_update().all()
+    bump_data_version(db)
+
 @router.delete("/teacher/students/{student_id}")
+@db_endpoint
 def delete_student(
     student_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
     if current_user.role != 'teacher':
         raise HTTPException(status_code=403, detail="Access denied: เฉพาะครูเท่านั้นที่สามารถลบข้อมูลนักเรียนได้")
         
-    student = db.query(User).filter(User.id == student_id, User.role == 'student').first()
+    # ล็อกแถวผู้ใช้ก่อน (การสร้างโปรเจกต์/ส่งแบบทดสอบของนักเรียนคนนี้จะรอจนลบเสร็จ)
+    student = db.query(User).filter(User.id == student_id, User.role == 'student').with_for_update().first()
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
         
@@ -150,9 +361,14 @@ def delete_student(
         project_ids = [p.id for p in projects]
         
         if project_ids:
+            _lock_for_delete(db, project_ids)
+            delete_progress(db, project_ids)
+            step_ids = db.query(EdpStep.id).filter(EdpStep.project_id.in_(project_ids))
+            db.query(GradingJob).filter(GradingJob.step_id.in_(step_ids)).delete(synchronize_session=False)
             db.query(EdpStep).filter(EdpStep.project_id.in_(project_ids)).delete(synchronize_session=False)
             db.query(Project).filter(Project.owner_id == student.id).delete(synchronize_session=False)
             
+        invalidate_principal(db, student.id)
         db.delete(student)
         db.commit()
         return {"message": "ลบบัญชีนักเรียนและข้อมูลที่เกี่ยวข้องทั้งหมดเรียบร้อยแล้ว"}
@@ -167,68 +383,90 @@ def delete_student(
 # ==========================================
 
 @router.get("/projects")
+@db_endpoint
 def get_user_projects(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
     projects = db.query(Project).filter(Project.owner_id == current_user.id).all()
     return projects
 
 @router.get("/teacher/projects", response_model=List[ProjectWithStudent])
+@db_endpoint
 def get_all_projects_for_teacher(
-    skip: int = 0,
-    limit: int = 1000,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = PAGINATION_DEFAULT_LIMIT,
+    include_total: bool = False,
+    db: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
+    """[OPTIMIZED] แบ่งหน้าแบบ Keyset บน (created_at, id) ล่าสุดก่อน ใช้ cursor/X-Next-Cursor เหมือน /teacher/students"""
     if current_user.role != 'teacher':
         raise HTTPException(status_code=403, detail="Access denied")
 
-    limit = min(limit, 1000)
+    version = get_data_version(db)
+    not_modified = conditional_response(request, response, make_etag("projects", version, request.url.query))
+    if not_modified is not None:
+        return not_modified
+
+    limit = _page_limit(limit)
 
     # 🚀 [BEST PRACTICE OPTIMIZATION] แตก Query ลดภาระ Database ป้องกันตารางค้าง
     
     # จังหวะที่ 1: ดึงเฉพาะ Project และข้อมูล User แบบจำกัดจำนวน (ดึงเร็วมาก)
-    projects_and_users = db.query(Project, User)\
-        .join(User, Project.owner_id == User.id)\
-        .order_by(Project.created_at.desc())\
-        .offset(skip).limit(limit)\
+    query = db.query(Project, User).join(User, Project.owner_id == User.id)
+    if cursor:
+        values = _decode_page_cursor("projects", cursor)
+        # เทียบกับ created_at ที่อยู่ใน DB ของแถว Cursor โดยตรง (ไม่แปลงเวลาไป-กลับ ซึ่งทำให้ค่าเท่ากันเทียบไม่ตรงใน SQLite)
+        # ถ้าแถวนั้นถูกลบไปแล้ว ใช้เวลาที่เก็บไว้ใน Cursor แทน
+        anchor = func.coalesce(
+            db.query(Project.created_at).filter(Project.id == values["id"]).scalar_subquery(),
+            _cursor_datetime(values.get("t"))
+        )
+        # เงื่อนไข created_at <= anchor ทำให้ DB กระโดดไปที่ตำแหน่ง Cursor ใน Index ได้ทันที (ไม่ต้องไล่ข้ามหน้าก่อน ๆ)
+        query = query.filter(
+            Project.created_at <= anchor,
+            or_(Project.created_at < anchor, Project.id < values["id"])
+        )
+    projects_and_users = query.order_by(Project.created_at.desc(), Project.id.desc())\
+        .limit(limit + 1)\
         .all()
 
+    has_more = len(projects_and_users) > limit
+    projects_and_users = projects_and_users[:limit]
+
+    total = None
+    if include_total:
+        total = get_count_cache().get(f"projects:{version}", lambda: db.query(func.count(Project.id)).scalar())
     if not projects_and_users:
+        _set_page_headers(response, None, total)
         return []
 
     # แยกเอาเฉพาะ ID ของ Project เพื่อเอาไปหา Step
     project_ids = [p.Project.id for p in projects_and_users]
 
-    # จังหวะที่ 2: ดึง Step ล่าสุด เฉพาะของ Project ID ชุดนี้เท่านั้น (ข้ามโปรเจกต์อื่นไปเลย)
-    latest_step_sub = db.query(
-        EdpStep.project_id,
-        func.max(EdpStep.id).label("max_step_id")
-    ).filter(EdpStep.project_id.in_(project_ids))\
-     .group_by(EdpStep.project_id).subquery()
-
-    latest_steps = db.query(EdpStep).join(
-        latest_step_sub,
-        EdpStep.id == latest_step_sub.c.max_step_id
+    # จังหวะที่ 2: [OPTIMIZED] อ่าน Step ปัจจุบันจาก project_progress (Index Lookup ไม่ต้อง GROUP BY edp_steps)
+    current_rows = db.query(ProjectProgress).filter(
+        ProjectProgress.project_id.in_(project_ids),
+        ProjectProgress.is_current.is_(True)
     ).all()
 
     # จังหวะที่ 3: นำ Step ที่ได้มาทำเป็น Dictionary เพื่อง่ายต่อการจับคู่ (หาเจอกระพริบตา O(1))
-    step_dict = {step.project_id: step for step in latest_steps}
+    progress_dict = {row.project_id: row for row in current_rows}
 
     # รวมร่างข้อมูลส่งให้ Frontend
     results = []
     for p, owner in projects_and_users:
-        edp_step = step_dict.get(p.id)
+        progress = progress_dict.get(p.id)
         
         status_text = "In Progress"
         step_num = 0
         
-        if edp_step:
-            step_num = edp_step.step_number
-            final_score = edp_step.teacher_score if edp_step.teacher_score is not None else edp_step.score
-            
-            if step_num == 6 and final_score is not None and final_score >= 60:
+        if progress:
+            step_num = progress.step_number
+            if progress.completed:
                 status_text = "Completed"
         else:
             status_text = "Not Started"
@@ -243,13 +481,19 @@ def get_all_projects_for_teacher(
             status=status_text
         )
         results.append(p_data)
-        
+
+    next_cursor = None
+    if has_more:
+        last = projects_and_users[-1].Project
+        next_cursor = encode_cursor("projects", id=last.id, t=last.created_at.isoformat() if last.created_at else None)
+    _set_page_headers(response, next_cursor, total)
     return results
 
 @router.post("/projects", status_code=201)
+@db_endpoint
 def create_project(
     project_in: ProjectCreate, 
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
     new_project = Project(
@@ -263,9 +507,10 @@ def create_project(
     return {"message": "Project created successfully", "id": new_project.id}
 
 @router.delete("/projects/{project_id}")
+@db_endpoint
 def delete_project(
     project_id: int, 
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
     project = db.query(Project).filter(Project.id == project_id).first()
@@ -277,6 +522,10 @@ def delete_project(
         raise HTTPException(status_code=403, detail="Access denied")
         
     try:
+        _lock_for_delete(db, [project.id])
+        delete_progress(db, [project.id])
+        step_ids = db.query(EdpStep.id).filter(EdpStep.project_id == project.id)
+        db.query(GradingJob).filter(GradingJob.step_id.in_(step_ids)).delete(synchronize_session=False)
         db.query(EdpStep).filter(EdpStep.project_id == project.id).delete(synchronize_session=False)
         db.delete(project)
         db.commit()
@@ -286,13 +535,33 @@ def delete_project(
         print(f"Error deleting project: {e}")
         raise HTTPException(status_code=500, detail="ไม่สามารถลบโครงงานได้")
 
-@router.post("/submit", response_model=StepResponse)
-async def submit_edp_step(
-    step: StepCreate, 
-    db: Session = Depends(get_db),
-    ai_service: GeminiService = Depends(get_ai_service),
-    current_user: User = Depends(get_current_user)
-):
+# [NEW] Admission Control: จำนวน Request ที่ถูกปฏิเสธด้วย 503 (แยกตามโหมด)
+_admission_rejected = {"sync": 0, "async": 0}
+
+async def _admit_grading(ai_service: GeminiService, grading_mode: str):
+    """
+    ปฏิเสธงานใหม่ด้วย 503 + Retry-After เมื่องานรอตรวจล้น
+    - sync/stream: นับ Request ที่รอผล AI อยู่ใน Worker นี้
+    - async: นับงานค้างในคิว grading_jobs ทั้งระบบ
+    ป้องกันไม่ให้ Request ค้างจนกิน Worker/Connection ของ API ส่วนอื่น
+    """
+    if grading_mode == "async":
+        overloaded = await get_grading_queue().cached_depth() >= AI_ADMISSION_MAX_QUEUE
+    else:
+        overloaded = ai_service.pending_calls() >= AI_ADMISSION_MAX_INFLIGHT
+    if not overloaded:
+        return
+
+    _admission_rejected[grading_mode] += 1
+    retry_after = max(AI_ADMISSION_RETRY_AFTER, int(ai_service.breaker.retry_after()))
+    raise HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="ขณะนี้มีงานรอตรวจจำนวนมาก กรุณาลองส่งใหม่อีกครั้งในภายหลัง",
+        headers={"Retry-After": str(retry_after)}
+    )
+
+def _prepare_submission(db: Session, step: StepCreate, current_user: User):
+    """ตรวจสิทธิ์/เงื่อนไขการส่งงาน แล้วคืน (EdpStep ใหม่ที่ยังไม่บันทึก, Project) ใช้ร่วมกันทุกโหมดการส่ง"""
     if step.step_number < 1 or step.step_number > 6:
         raise HTTPException(status_code=400, detail="Invalid step number. Must be between 1 and 6.")
 
@@ -307,11 +576,12 @@ async def submit_edp_step(
     last_step = db.query(EdpStep).filter(
         EdpStep.project_id == step.project_id,
         EdpStep.step_number == step.step_number
-    ).order_by(desc(EdpStep.created_at)).first()
+    ).order_by(desc(EdpStep.id)).first()
 
+    # [OPTIMIZED] เรียงด้วย id (เพิ่มขึ้นตามเวลาส่งเหมือน created_at) ให้ Index (project_id, step_number, id) ใช้ได้ทั้ง WHERE และ ORDER BY
     absolute_latest_step = db.query(EdpStep).filter(
         EdpStep.project_id == step.project_id
-    ).order_by(desc(EdpStep.created_at)).first()
+    ).order_by(desc(EdpStep.id)).first()
 
     if last_step:
         if last_step.content.strip() == step.content.strip():
@@ -331,8 +601,6 @@ async def submit_edp_step(
             if time_diff < 15:
                 raise HTTPException(status_code=429, detail=f"กรุณารออีก {15 - int(time_diff)} วินาที ก่อนส่งงานใหม่อีกครั้ง")
 
-    analysis = await ai_service.analyze_step(step.step_number, step.content)
-    
     if absolute_latest_step and absolute_latest_step.step_number != step.step_number:
         current_attempt = 1
     else:
@@ -342,34 +610,296 @@ async def submit_edp_step(
         project_id=step.project_id,
         step_number=step.step_number,
         content=step.content,
-        ai_feedback=analysis.get("feedback_th", "N/A"),
-        score=float(analysis.get("relevance_score", 0)),
-        
-        creativity_score=float(analysis.get("creativity_score", 0)),
         time_spent_seconds=step.time_spent_seconds, 
-        
-        score_breakdown=analysis.get("score_breakdown", []),
-        warning_flags=analysis.get("warning_flags", []),
-        sentiment=analysis.get("sentiment", "Neutral"),
-        competency_level=analysis.get("competency_level", "Novice"),
-        critical_thinking=analysis.get("critical_thinking", "Low"),
-        suggested_action=analysis.get("suggested_action", ""),
-        
-        status="submitted",
+        status="pending",
         word_count=len(step.content.split()) if step.content else 0,
         attempt_count=current_attempt 
     )
-    
-    db.add(new_step)
-    db.commit()
-    db.refresh(new_step)
-    
-    return new_step
+
+    return new_step, project
+
+def _check_similarity(db: Session, new_step: EdpStep, project: Project, current_user: User) -> Optional[dict]:
+    """
+    หางานของเพื่อนร่วมห้องที่เกือบเหมือนกัน (MinHash/LSH) ก่อนตรวจด้วย AI
+    ติด Flag 'similar_to_peer' และแนบรายการงานที่คล้ายไว้ใน new_step.similar_submissions
+    คืน Context สำหรับเพิ่มงานนี้เข้าดัชนีหลังบันทึกแล้ว
+    """
+    if not AI_SIMILARITY_ENABLED:
+        return None
+
+    index = get_similarity_index()
+    if project.owner_id == current_user.id:
+        class_room = current_user.class_room
+    else:
+        class_room = db.query(User.class_room).filter(User.id == project.owner_id).scalar()
+
+    signature = index.hasher.signature(new_step.content)
+    matches = index.query(class_room, new_step.step_number, project.owner_id, signature=signature)
+    new_step.similar_submissions = [{"step_id": m["step_id"], "similarity": m["similarity"]} for m in matches]
+    if matches:
+        new_step.warning_flags = ["similar_to_peer"]
+
+    return {"class_room": class_room, "owner_id": project.owner_id, "signature": signature, "matches": matches}
+
+def _reusable_analysis(db: Session, similarity: Optional[dict]) -> Optional[dict]:
+    """ถ้าเปิดใช้ และมีงานที่แทบเหมือนกันซึ่งตรวจเสร็จแล้ว คืนผลตรวจนั้นแทนการเรียก AI ใหม่"""
+    if not AI_SIMILARITY_REUSE_RESULT or not similarity or not similarity["matches"]:
+        return None
+
+    best = similarity["matches"][0]
+    if best["similarity"] < AI_SIMILARITY_REUSE_THRESHOLD:
+        return None
+
+    source = db.query(EdpStep).filter(EdpStep.id == best["step_id"]).first()
+    if not source or source.status in ("pending", "grading_failed"):
+        return None
+    if set(source.warning_flags or []) & {"quota_exceeded", "system_error"}:
+        return None
+
+    return {
+        "relevance_score": source.score,
+        "creativity_score": source.creativity_score,
+        "score_breakdown": source.score_breakdown or [],
+        "feedback_th": source.ai_feedback,
+        "critical_thinking": source.critical_thinking,
+        "sentiment": source.sentiment,
+        "competency_level": source.competency_level,
+        "suggested_action": source.suggested_action,
+        "warning_flags": [f for f in (source.warning_flags or []) if isinstance(f, str)]
+    }
+
+def _index_submission(new_step: EdpStep, similarity: Optional[dict]):
+    if similarity is None or new_step.id is None:
+        return
+    get_similarity_index().add(
+        new_step.id, similarity["class_room"], new_step.step_number, similarity["owner_id"],
+        signature=similarity["signature"]
+    )
+
+def _read_submission(db: Session, step: StepCreate, current_user: User, reuse: bool):
+    """
+    Phase อ่าน: ตรวจเงื่อนไข + หางานที่คล้าย (+ ผลตรวจที่นำกลับมาใช้ได้) แล้วคืน Connection ทันที
+    db เป็น Session เดียวกับที่ get_current_user ใช้ (Dependency ถูก Cache ต่อ Request)
+    การ close ตรงนี้จึงคืน Connection ของทั้ง Request ก่อนเริ่มรอ AI
+    """
+    try:
+        new_step, project = _prepare_submission(db, step, current_user)
+        similarity = _check_similarity(db, new_step, project, current_user)
+        reusable = _reusable_analysis(db, similarity) if reuse else None
+        return new_step, similarity, reusable
+    finally:
+        db.close()
+
+def _enqueue_submission(new_step: EdpStep, similarity: Optional[dict]) -> dict:
+    """Phase เขียน (โหมด async): บันทึกงาน pending + GradingJob ใน Transaction สั้น ๆ"""
+    session = SessionLocal()
+    try:
+        session.add(new_step)
+        session.flush()
+        record_step(session, new_step)
+        job = GradingJob(step_id=new_step.id, status="queued")
+        session.add(job)
+        session.commit()
+        _index_submission(new_step, similarity)
+        return {
+            "job_id": job.id,
+            "step_id": new_step.id,
+            "status": job.status,
+            "status_url": f"/edp/jobs/{job.id}",
+            "events_url": f"/edp/jobs/{job.id}/events",
+            "similar_submissions": new_step.similar_submissions
+        }
+    finally:
+        session.close()
+
+def _persist_graded_step(new_step: EdpStep, analysis: dict, similarity: Optional[dict]) -> dict:
+    """Phase เขียน (โหมด sync/stream): ใส่ผลตรวจแล้วบันทึกด้วย Session ใหม่ที่เปิดแค่ช่วงเขียน"""
+    session = SessionLocal()
+    try:
+        apply_analysis(new_step, analysis)
+        session.add(new_step)
+        session.flush()
+        record_step(session, new_step)
+        session.commit()
+        session.refresh(new_step)
+        _index_submission(new_step, similarity)
+        return StepResponse.model_validate(new_step).model_dump(mode="json")
+    finally:
+        session.close()
+
+@router.post("/submit", response_model=StepResponse, responses={202: {"description": "Queued for background grading (async mode)"}})
+async def submit_edp_step(
+    step: StepCreate, 
+    mode: Optional[str] = None,
+    db: Session = Depends(get_session),
+    ai_service: GeminiService = Depends(get_ai_service),
+    current_user: User = Depends(get_current_user)
+):
+    grading_mode = (mode or AI_GRADING_MODE).lower()
+    if grading_mode not in ("sync", "async"):
+        raise HTTPException(status_code=400, detail="mode must be 'sync' or 'async'")
+    await _admit_grading(ai_service, grading_mode)
+
+    # [OPTIMIZED] Query ทั้งหมดไม่บล็อก Event Loop (Thread Pool หรือ AsyncSession ตาม DB_MODE)
+    # และไม่มี Connection ใดถูกยืมค้างไว้ระหว่างรอ AI (เดิมยืมค้างหลายวินาที ทำให้ Pool หมดที่ ~20 Request)
+    new_step, similarity, analysis = await run_db(
+        db, _read_submission, step, current_user, grading_mode == "sync"
+    )
+
+    # [NEW] โหมด Async: บันทึกงานเป็น pending แล้วตอบ 202 ทันที ให้ Worker Pool ตรวจเบื้องหลัง
+    if grading_mode == "async":
+        payload = await asyncio.to_thread(_enqueue_submission, new_step, similarity)
+        get_grading_queue().notify()
+        return JSONResponse(status_code=202, content=payload)
+
+    if analysis is None:
+        analysis = await ai_service.analyze_step(step.step_number, step.content)
+    else:
+        print(f"♻️  Reused AI result of near-identical step {similarity['matches'][0]['step_id']}")
+
+    return await asyncio.to_thread(_persist_graded_step, new_step, analysis, similarity)
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/submit/stream")
+async def submit_edp_step_stream(
+    step: StepCreate,
+    db: Session = Depends(get_session),
+    ai_service: GeminiService = Depends(get_ai_service),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    ส่งงานแบบ Streaming (Server-Sent Events)
+    - event: feedback  ข้อความคำแนะนำ (feedback_th) ทีละส่วนระหว่างที่ AI กำลังตอบ
+    - event: result    ผลตรวจฉบับเต็ม (รูปแบบเดียวกับ StepResponse) หลังบันทึกลงฐานข้อมูลแล้ว
+    """
+    await _admit_grading(ai_service, "sync")
+    # คืน Connection ให้ Pool ก่อนเริ่ม Stream (การเขียนผลใช้ Session ใหม่ใน _persist_graded_step)
+    new_step, similarity, _ = await run_db(db, _read_submission, step, current_user, False)
+
+    async def event_stream():
+        analysis = None
+        async for kind, data in ai_service.analyze_step_stream(step.step_number, step.content):
+            if kind == "delta":
+                if data:
+                    yield _sse("feedback", {"text": data})
+            else:
+                analysis = data
+
+        try:
+            saved = await asyncio.to_thread(_persist_graded_step, new_step, analysis, similarity)
+            yield _sse("result", saved)
+        except Exception as e:
+            print(f"Error saving streamed step: {e}")
+            yield _sse("error", {"detail": "บันทึกผลการตรวจไม่สำเร็จ กรุณาลองใหม่อีกครั้ง"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _load_job_for_user(db: Session, job_id: int, current_user: User) -> GradingJob:
+    job = db.query(GradingJob).filter(GradingJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    owner_id = db.query(Project.owner_id).join(EdpStep, EdpStep.project_id == Project.id)\
+        .filter(EdpStep.id == job.step_id).scalar()
+    if owner_id != current_user.id and current_user.role != 'teacher':
+        raise HTTPException(status_code=403, detail="Access denied")
+    return job
+
+def _job_payload(db: Session, job_id: int) -> Optional[dict]:
+    job = db.query(GradingJob).filter(GradingJob.id == job_id).first()
+    if not job:
+        return None
+
+    payload = {
+        "job_id": job.id,
+        "step_id": job.step_id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "error": job.error,
+        "step": None
+    }
+    if job.status in ("done", "failed"):
+        step = db.query(EdpStep).filter(EdpStep.id == job.step_id).first()
+        if step:
+            payload["step"] = StepResponse.model_validate(step).model_dump(mode="json")
+    return payload
+
+@router.get("/jobs/{job_id}")
+@db_endpoint
+def get_grading_job(
+    job_id: int,
+    db: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """ดูสถานะงานตรวจแบบ Async (queued / running / done / failed) พร้อมผลเมื่อตรวจเสร็จ"""
+    _load_job_for_user(db, job_id, current_user)
+    return _job_payload(db, job_id)
+
+@router.get("/jobs/{job_id}/events")
+async def stream_grading_job(
+    job_id: int,
+    db: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """ส่งสถานะงานตรวจแบบ Server-Sent Events จนกว่างานจะเสร็จ"""
+    await run_db(db, _load_job_for_user, job_id, current_user)
+    # คืน Connection ให้ Pool ก่อนเริ่ม Stream ที่อาจยาวหลายวินาที
+    await run_db(db, Session.close)
+
+    queue = get_grading_queue()
+
+    def read_payload():
+        session = SessionLocal()
+        try:
+            return _job_payload(session, job_id)
+        finally:
+            session.close()
+
+    async def event_stream():
+        watcher = queue.watch(job_id)
+        last_status = None
+        try:
+            for _ in range(600):
+                payload = await asyncio.to_thread(read_payload)
+                if payload is None:
+                    yield _sse("error", {"detail": "Job not found"})
+                    return
+
+                if payload["status"] in ("done", "failed"):
+                    yield _sse("result", payload)
+                    return
+
+                if payload["status"] != last_status:
+                    last_status = payload["status"]
+                    yield _sse("status", payload)
+                else:
+                    yield ": keep-alive\n\n"
+
+                watcher.clear()
+                try:
+                    await asyncio.wait_for(watcher.wait(), timeout=AI_GRADING_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            queue.unwatch(job_id, watcher)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.get("/project/{project_id}", response_model=List[StepResponse])
+@db_endpoint
 def get_project_steps(
     project_id: int, 
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
     project = db.query(Project).filter(Project.id == project_id).first()
@@ -380,23 +910,20 @@ def get_project_steps(
     if project.owner_id != current_user.id and current_user.role != 'teacher':
         raise HTTPException(status_code=403, detail="Access denied")
 
-    subquery = db.query(
-        EdpStep.step_number,
-        func.max(EdpStep.id).label('max_id')
-    ).filter(EdpStep.project_id == project_id).group_by(EdpStep.step_number).subquery()
-
+    # [OPTIMIZED] งานล่าสุดของแต่ละ Step อ่านจาก project_progress (ไม่ขึ้นกับจำนวนครั้งที่ส่งงาน)
     steps = db.query(EdpStep).join(
-        subquery,
-        and_(EdpStep.id == subquery.c.max_id)
-    ).order_by(EdpStep.step_number.asc()).all()
+        ProjectProgress, EdpStep.id == ProjectProgress.latest_step_id
+    ).filter(ProjectProgress.project_id == project_id)\
+     .order_by(ProjectProgress.step_number.asc()).all()
 
     return steps or []
 
 @router.patch("/step/{step_id}/grade")
+@db_endpoint
 def grade_step(
     step_id: int,
     grade: TeacherGrade,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
     if current_user.role != 'teacher':
@@ -409,6 +936,7 @@ def grade_step(
     step.teacher_score = grade.teacher_score
     step.teacher_comment = grade.teacher_comment
     step.is_teacher_reviewed = True
+    refresh_score(db, step)
     
     db.commit()
     db.refresh(step)
@@ -417,9 +945,10 @@ def grade_step(
 # วางโค้ดนี้ไว้ล่างสุดของไฟล์ backend/app/routers/edp.py
 
 @router.get("/project-info/{project_id}")
+@db_endpoint
 def get_single_project_info(
     project_id: int, 
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
     """API สำหรับดึงชื่อโปรเจกต์และชื่อนักเรียนแค่ 1 รายการ (ลดภาระเซิร์ฟเวอร์)"""
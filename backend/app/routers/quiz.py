@@ -2,7 +2,7 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from app.database import get_db
+from app.database import get_session, db_endpoint
 from app.models.edp import QuizQuestion, QuizAttempt, User
 from app.routers.auth import get_current_user
 from pydantic import BaseModel
@@ -19,7 +19,8 @@ class QuizSubmission(BaseModel):
 # --- Endpoints (Student) ---
 
 @router.get("/questions")
-def get_quiz_questions(db: Session = Depends(get_db)):
+@db_endpoint
+def get_quiz_questions(db: Session = Depends(get_session)):
     questions = db.query(QuizQuestion).all()
     random.shuffle(questions)
     
@@ -38,9 +39,10 @@ def get_quiz_questions(db: Session = Depends(get_db)):
     return result
 
 @router.post("/submit")
+@db_endpoint
 def submit_quiz(
     submission: QuizSubmission, 
-    db: Session = Depends(get_db), 
+    db: Session = Depends(get_session), 
     current_user: User = Depends(get_current_user)
 ):
     questions = db.query(QuizQuestion).all()
@@ -93,8 +95,9 @@ def submit_quiz(
 
 # -------------------------------------------------------------------
 @router.get("/history")
+@db_endpoint
 def get_quiz_history(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
     attempts = db.query(QuizAttempt).filter(
@@ -115,9 +118,10 @@ def get_quiz_history(
     return history_list
 
 @router.get("/history/{attempt_id}")
+@db_endpoint
 def get_quiz_attempt_details(
     attempt_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
     attempt = db.query(QuizAttempt).filter(
@@ -134,7 +138,8 @@ def get_quiz_attempt_details(
     }
 
 @router.get("/leaderboard")
-def get_leaderboard(db: Session = Depends(get_db)):
+@db_endpoint
+def get_leaderboard(db: Session = Depends(get_session)):
     all_attempts = db.query(QuizAttempt, User).join(User, QuizAttempt.student_id == User.id).order_by(
         QuizAttempt.score.desc(),
         QuizAttempt.time_spent_seconds.asc(),
@@ -163,7 +168,8 @@ def get_leaderboard(db: Session = Depends(get_db)):
 # --- Endpoints (Teacher/Analytics) ---
 
 @router.get("/analytics/overview")
-def get_quiz_overview(db: Session = Depends(get_db)):
+@db_endpoint
+def get_quiz_overview(db: Session = Depends(get_session)):
     total_attempts = db.query(QuizAttempt).count()
     if total_attempts == 0:
         return {"total_attempts": 0, "average_score": 0, "pass_rate": 0, "max_score": 0}
@@ -181,7 +187,8 @@ def get_quiz_overview(db: Session = Depends(get_db)):
     }
 
 @router.get("/analytics/items")
-def get_item_analysis(db: Session = Depends(get_db)):
+@db_endpoint
+def get_item_analysis(db: Session = Depends(get_session)):
     attempts = db.query(QuizAttempt).all()
     questions = db.query(QuizQuestion).order_by(QuizQuestion.order).all()
     
@@ -220,7 +227,8 @@ def get_item_analysis(db: Session = Depends(get_db)):
     return sorted(result, key=lambda x: x['accuracy_percent'])
 
 @router.get("/analytics/students")
-def get_student_analytics(db: Session = Depends(get_db)):
+@db_endpoint
+def get_student_analytics(db: Session = Depends(get_session)):
     attempts = db.query(QuizAttempt, User).join(User).all()
     student_map = {}
 
@@ -280,8 +288,9 @@ def get_student_analytics(db: Session = Depends(get_db)):
     return sorted(results, key=lambda x: x['student_id'])
 
 @router.delete("/reset")
+@db_endpoint
 def reset_quiz_data(
-    db: Session = Depends(get_db), 
+    db: Session = Depends(get_session), 
     current_user: User = Depends(get_current_user)
 ):
     if current_user.role != 'teacher':
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, EmailStr
 from typing import Optional, List, Any, Dict
 from datetime import datetime
 
@@ -16,6 +16,18 @@ class ScoreItem(BaseModel):
     max_score: int
     comment: Optional[str] = None
 
+# [NEW] รูปแบบผลตรวจที่ AI ต้องตอบกลับ (ใช้ทั้งสร้าง Response Schema ให้ Gemini และ Validate คำตอบ)
+class AiEvaluation(BaseModel):
+    relevance_score: int = 0
+    creativity_score: int = 0
+    score_breakdown: List[ScoreItem] = []
+    feedback_th: str = "ระบบไม่สามารถสรุปคำแนะนำได้"
+    critical_thinking: Optional[str] = None
+    sentiment: Optional[str] = None
+    competency_level: Optional[str] = None
+    warning_flags: List[str] = []
+    suggested_action: Optional[str] = None
+
 class StepResponse(BaseModel):
     id: int
     step_number: int
@@ -39,6 +51,8 @@ class StepResponse(BaseModel):
     competency_level: Optional[str] = None
     suggested_action: Optional[str] = None
     warning_flags: Optional[List[Any]] = []
+    # [NEW] งานของเพื่อนที่คล้ายกันมาก (มีเฉพาะตอนส่งงาน) [{"step_id": ..., "similarity": 0.93}]
+    similar_submissions: Optional[List[Dict[str, Any]]] = None
     
     # Stats
     word_count: Optional[int] = 0
@@ -86,6 +100,15 @@ class StudentUpdate(BaseModel):
     student_id: Optional[str] = None
     class_room: Optional[str] = None
 
+# [NEW] 1 แถวของไฟล์รายชื่อนักเรียน (นำเข้าทั้งห้อง)
+class RosterRow(BaseModel):
+    email: EmailStr
+    student_id: str
+    first_name: str
+    last_name: str
+    class_room: Optional[str] = None
+    password: Optional[str] = None
+
 class ProjectWithStudent(ProjectBase):
     owner: UserInfo
     latest_step: Optional[int] = 0
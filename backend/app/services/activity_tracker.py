@@ -0,0 +1,150 @@
+# backend/app/services/activity_tracker.py
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Set
+
+from app.core.config import ACTIVITY_FLUSH_SECONDS, ACTIVITY_WINDOW_SECONDS
+from app.database import SessionLocal
+from app.models.edp import User
+
+
+class ActivityTracker:
+    """
+    เก็บการใช้งานล่าสุดของผู้ใช้ในหน่วยความจำ (Write-behind)
+    - touch() ถูกเรียกทุก Request ที่ Login แล้ว ไม่แตะฐานข้อมูล
+    - ทุก flush_seconds รวม last_active_at ที่ค้างเป็น UPDATE users ... WHERE id IN (...) ครั้งเดียว
+      แล้วอ่านรายชื่อนักเรียนที่ Active จาก Worker อื่นกลับมา (1 Query ต่อรอบ ไม่ใช่ต่อ Request)
+    - active_count() ตอบจำนวนผู้ใช้ที่ Active จากหน่วยความจำ
+    """
+
+    CHUNK_SIZE = 500
+
+    def __init__(self, flush_seconds: float = 10.0, window_seconds: float = 60.0, session_factory=SessionLocal):
+        self.flush_seconds = flush_seconds
+        self.window_seconds = window_seconds
+        self._session_factory = session_factory
+
+        self._lock = threading.Lock()
+        self._seen: Dict[int, tuple] = {}      # user_id -> (เวลาใช้งานล่าสุด, role) ของ Worker นี้
+        self._dirty: Set[int] = set()          # user_id ที่ยังไม่ได้เขียนลง DB
+        self._remote: Dict[int, datetime] = {}  # นักเรียนที่ Active จากทุก Worker (อ่านตอน Flush)
+        self._task: Optional[asyncio.Task] = None
+
+        self.touches = 0
+        self.flushes = 0
+        self.rows_flushed = 0
+        self.last_flush_ms = 0.0
+
+    def touch(self, user_id: int, role: Optional[str]):
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            self._seen[user_id] = (now, role)
+            self._dirty.add(user_id)
+            self.touches += 1
+
+    def active_count(self, role: str = "student") -> int:
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.window_seconds)
+        with self._lock:
+            active = {uid for uid, (seen_at, seen_role) in self._seen.items() if seen_at >= cutoff and seen_role == role}
+            if role == "student":
+                active.update(uid for uid, seen_at in self._remote.items() if seen_at >= cutoff)
+            return len(active)
+
+    # ---------------------------------------------------------
+    # Flush (Sync, รันผ่าน asyncio.to_thread)
+    # ---------------------------------------------------------
+    def flush_sync(self) -> int:
+        with self._lock:
+            dirty = list(self._dirty)
+            self._dirty.clear()
+            # ลบรายการที่เก่าเกินหน้าต่างเวลาออก กันหน่วยความจำโต
+            cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.window_seconds)
+            self._seen = {uid: v for uid, v in self._seen.items() if v[0] >= cutoff or uid in self._dirty}
+
+        started = time.perf_counter()
+        now = datetime.now(timezone.utc)
+        db = self._session_factory()
+        try:
+            for i in range(0, len(dirty), self.CHUNK_SIZE):
+                chunk = dirty[i:i + self.CHUNK_SIZE]
+                # last_active_at ไม่มีผลต่อข้อมูล Dashboard จึงไม่เพิ่มเวอร์ชันข้อมูล (ไม่ทำให้ ETag เปลี่ยนทุก 10 วินาที)
+                db.query(User).filter(User.id.in_(chunk))\
+                    .execution_options(data_version_exempt=True)\
+                    .update({"last_active_at": now}, synchronize_session=False)
+            if dirty:
+                db.commit()
+
+            rows = db.query(User.id, User.last_active_at).filter(
+                User.role == 'student',
+                User.last_active_at >= now - timedelta(seconds=self.window_seconds)
+            ).all()
+        except Exception:
+            db.rollback()
+            # เขียนไม่สำเร็จ คืนรายการกลับเข้าคิวไว้ Flush รอบหน้า
+            with self._lock:
+                self._dirty.update(dirty)
+            raise
+        finally:
+            db.close()
+
+        remote = {}
+        for uid, last_active in rows:
+            if last_active is not None and last_active.tzinfo is None:
+                last_active = last_active.replace(tzinfo=timezone.utc)
+            remote[uid] = last_active
+        with self._lock:
+            self._remote = remote
+            self.flushes += 1
+            self.rows_flushed += len(dirty)
+            self.last_flush_ms = round((time.perf_counter() - started) * 1000, 1)
+        return len(dirty)
+
+    # ---------------------------------------------------------
+    # Lifecycle
+    # ---------------------------------------------------------
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await asyncio.to_thread(self.flush_sync)
+            except Exception as e:
+                print(f"Activity flush error: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await asyncio.to_thread(self.flush_sync)
+        except Exception as e:
+            print(f"Activity flush error: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "tracked": len(self._seen),
+                "pending": len(self._dirty),
+                "touches": self.touches,
+                "flushes": self.flushes,
+                "rows_flushed": self.rows_flushed,
+                "last_flush_ms": self.last_flush_ms,
+            }
+
+
+_tracker_instance: Optional[ActivityTracker] = None
+
+def get_activity_tracker() -> ActivityTracker:
+    global _tracker_instance
+    if _tracker_instance is None:
+        _tracker_instance = ActivityTracker(
+            flush_seconds=ACTIVITY_FLUSH_SECONDS,
+            window_seconds=ACTIVITY_WINDOW_SECONDS,
+        )
+    return _tracker_instance
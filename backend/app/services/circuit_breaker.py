@@ -0,0 +1,100 @@
+# backend/app/services/circuit_breaker.py
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """ถูกโยนเมื่อวงจรเปิดอยู่ (AI ล่ม/โควตาเต็ม) ผู้เรียกควรคืนผล Fallback ทันทีแทนการรอ Retry"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"AI circuit is open, retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Circuit Breaker 3 สถานะ
+    - closed: เรียกได้ปกติ นับความล้มเหลวติดกัน ครบ failure_threshold ครั้งจะเปิดวงจร
+    - open: ปฏิเสธทันทีเป็นเวลา reset_seconds (ไม่ต้องรอ Retry 30 วินาทีทุก Request)
+    - half_open: ปล่อย Probe ทีละ 1 Request ถ้าสำเร็จปิดวงจร ถ้าล้มเหลวเปิดใหม่
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started = 0.0
+
+        self.opened = 0
+        self.rejected = 0
+        self.probes = 0
+
+    def _refresh(self, now: float):
+        if self._state == OPEN and now - self._opened_at >= self.reset_seconds:
+            self._state = HALF_OPEN
+            self._probe_started = 0.0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh(time.monotonic())
+            return self._state
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            self._refresh(now)
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN:
+                # Probe ที่ค้างเกิน reset_seconds (เช่นถูกยกเลิกกลางทาง) ถือว่าหลุด ปล่อย Probe ใหม่ได้
+                if not self._probe_started or now - self._probe_started >= self.reset_seconds:
+                    self._probe_started = now
+                    self.probes += 1
+                    return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                print("✅ AI circuit closed (probe succeeded)")
+            self._state = CLOSED
+            self._failures = 0
+            self._probe_started = 0.0
+
+    def record_failure(self):
+        now = time.monotonic()
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._state = OPEN
+                self._opened_at = now
+                self._probe_started = 0.0
+                self.opened += 1
+                print(f"🚫 AI circuit opened after {self._failures} consecutive failures")
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self.reset_seconds - (time.monotonic() - self._opened_at))
+
+    def stats(self) -> dict:
+        state = self.state
+        return {
+            "state": state,
+            "consecutive_failures": self._failures,
+            "retry_after": round(self.retry_after(), 1),
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "probes": self.probes,
+        }
@@ -0,0 +1,79 @@
+# backend/app/services/data_version.py
+# Hook ของ Session ถูกลงทะเบียนตอน import (app/models/__init__.py import ไฟล์นี้ จึงมีผลกับทุกที่ที่ใช้ Model)
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session
+
+from app.models.edp import DataVersion, EdpStep, Project, User
+
+# ตัวนับเดียวที่ครอบข้อมูลทั้งหมดที่หน้า Dashboard ครูแสดง
+DASHBOARD = "dashboard"
+
+TRACKED_MODELS = (User, Project, EdpStep)
+TRACKED_TABLES = {model.__tablename__ for model in TRACKED_MODELS}
+
+# คอลัมน์ที่ไม่มีผลต่อข้อมูลบน Dashboard (last_active_at ถูกเขียนทุกรอบของ Activity Tracker)
+IGNORED_ATTRIBUTES = {"last_active_at"}
+
+# Execution option สำหรับคำสั่ง Bulk ที่ไม่ต้องการให้ข้อมูล Dashboard เปลี่ยนเวอร์ชัน
+EXEMPT_OPTION = "data_version_exempt"
+
+_BUMP_SQL = text("UPDATE data_versions SET version = version + 1 WHERE name = :name")
+
+
+def _changes_dashboard(obj) -> bool:
+    state = inspect(obj)
+    for attr in state.mapper.column_attrs:
+        if attr.key in IGNORED_ATTRIBUTES:
+            continue
+        if state.attrs[attr.key].history.has_changes():
+            return True
+    return False
+
+
+@event.listens_for(Session, "before_flush")
+def _mark_dirty_session(session, flush_context, instances):
+    if session.info.get("data_version_bump"):
+        return
+    for obj in session.new | session.deleted:
+        if isinstance(obj, TRACKED_MODELS):
+            session.info["data_version_bump"] = True
+            return
+    for obj in session.dirty:
+        if isinstance(obj, TRACKED_MODELS) and _changes_dashboard(obj):
+            session.info["data_version_bump"] = True
+            return
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_after_flush(session, flush_context):
+    # เพิ่มเวอร์ชันใน Transaction เดียวกับข้อมูลที่เปลี่ยน (Rollback แล้วเวอร์ชันก็ไม่เปลี่ยน)
+    if session.info.pop("data_version_bump", False):
+        session.connection().execute(_BUMP_SQL, {"name": DASHBOARD})
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _bump_on_bulk_write(orm_execute_state):
+    """คำสั่ง Bulk (query.update/delete, insert(User) แบบ executemany) ไม่ผ่าน Flush จึงดักที่นี่"""
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert):
+        return
+    if orm_execute_state.execution_options.get(EXEMPT_OPTION):
+        return
+    table = getattr(orm_execute_state.statement, "table", None)
+    if getattr(table, "name", None) in TRACKED_TABLES:
+        orm_execute_state.session.connection().execute(_BUMP_SQL, {"name": DASHBOARD})
+
+
+def bump_data_version(db: Session, name: str = DASHBOARD):
+    """เพิ่มเวอร์ชันทันที (ล็อกแถวตัวนับไว้จนจบ Transaction) ใช้เมื่อต้องการกำหนดลำดับการล็อกเอง"""
+    db.connection().execute(_BUMP_SQL, {"name": name})
+
+
+def ensure_data_version(db: Session, name: str = DASHBOARD):
+    if db.get(DataVersion, name) is None:
+        db.add(DataVersion(name=name, version=0))
+        db.commit()
+
+
+def get_data_version(db: Session, name: str = DASHBOARD) -> int:
+    """อ่านด้วย Primary Key 1 แถว (Request ที่ข้อมูลไม่เปลี่ยนจ่ายแค่ Query นี้)"""
+    return db.query(DataVersion.version).filter(DataVersion.name == name).scalar() or 0
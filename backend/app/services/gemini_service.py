@@ -1,151 +1,252 @@
-import google.generativeai as genai
 import os
 import json
 import re
 import asyncio
 import hashlib  # [ADDED] สำหรับสร้าง Cache Key
-from collections import OrderedDict # [ADDED] สำหรับทำ LRU Cache อย่างง่าย
+import threading
+import time
+from contextlib import AsyncExitStack
+from typing import AsyncIterator, List, Optional, Tuple
 from dotenv import load_dotenv
 # นำเข้า Library สำหรับจัดการ Retry และ Error
 from tenacity import retry, stop_after_delay, wait_exponential, retry_if_exception_type, RetryError
 from google.api_core import exceptions
 
+from app.core.config import (
+    GEMINI_MODEL_NAME, GEMINI_LIGHT_MODEL_NAME, AI_CACHE_MAX_ENTRIES, AI_CACHE_MAX_BYTES, AI_CACHE_TTL_SECONDS,
+    AI_L2_CACHE_ENABLED, AI_L2_CACHE_TTL_SECONDS, AI_RUBRIC_VERSION,
+    AI_BATCH_ENABLED, AI_BATCH_WINDOW_MS, AI_BATCH_MAX_SIZE, AI_BATCH_LOAD_THRESHOLD,
+    AI_CONCURRENCY_INITIAL, AI_CONCURRENCY_MIN, AI_CONCURRENCY_MAX, AI_RPM_LIMIT, AI_TPM_LIMIT,
+    AI_GLOBAL_LIMITER, AI_GLOBAL_CONCURRENCY, AI_GLOBAL_RPM, AI_GLOBAL_LEASE_SECONDS,
+    AI_CONTENT_TOKEN_BUDGET, AI_PRESCREEN_ENABLED, AI_STRUCTURED_OUTPUT,
+    AI_LLM_BACKEND, AI_CASSETTE_PATH, AI_FAKE_LATENCY_MS, AI_FAKE_LATENCY_SIGMA, AI_FAKE_429_RATE,
+    AI_ROUTING_ENABLED, AI_ROUTING_LIGHT_STEPS, AI_ROUTING_LIGHT_MAX_TOKENS,
+    AI_PASS_THRESHOLD, AI_ROUTING_THRESHOLD_MARGIN,
+    AI_BREAKER_FAILURE_THRESHOLD, AI_BREAKER_RESET_SECONDS
+)
+from app.services.result_cache import ResultCache
+from app.services.persistent_cache import PersistentResultCache
+from app.services.micro_batcher import MicroBatcher
+from app.services.rate_limiter import AdaptiveLimiter
+from app.services.global_limiter import build_global_limiter
+from app.services.prompt_builder import PromptBuilder, BuiltPrompt
+from app.services.prescreen import PreScreener
+from app.services.llm_backends import build_llm_backend
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.services.model_router import ModelRouter, LIGHT, STRONG
+from app.services.structured_output import ResponseParser, evaluation_schema, batch_evaluation_schema
+
 load_dotenv()
 
-# [TUNING] ลดจำนวนคนเข้าพร้อมกัน (ปรับตาม Tier ที่ใช้)
-gemini_semaphore = asyncio.Semaphore(20)
+# [TUNING] จำกัดคนเข้าพร้อมกันแบบปรับตัวเอง (AIMD) + โควตา RPM/TPM ตาม Tier ที่ใช้
+gemini_limiter = AdaptiveLimiter(
+    initial_limit=AI_CONCURRENCY_INITIAL,
+    min_limit=AI_CONCURRENCY_MIN,
+    max_limit=AI_CONCURRENCY_MAX,
+    rpm=AI_RPM_LIMIT,
+    tpm=AI_TPM_LIMIT,
+    throttle_exceptions=(exceptions.ResourceExhausted, exceptions.TooManyRequests),
+)
+
+# [NEW] โควตารวมทั้ง Cluster (ทุก uvicorn Worker นับร่วมกัน) ไม่ว่าจะรันกี่ Worker ก็ไม่เกินค่าที่ตั้งไว้
+global_gemini_limiter = build_global_limiter(
+    AI_GLOBAL_LIMITER, AI_GLOBAL_CONCURRENCY, AI_GLOBAL_RPM, AI_GLOBAL_LEASE_SECONDS
+)
+
+# Error ที่แสดงว่าฝั่ง AI มีปัญหา (นับเข้า Circuit Breaker) ต่างจาก Error ของรูปแบบคำตอบ
+AI_OUTAGE_EXCEPTIONS = (exceptions.GoogleAPICallError, asyncio.TimeoutError, ConnectionError)
 
 class GeminiService:
     def __init__(self):
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            print("Warning: GEMINI_API_KEY not found in .env")
-        else:
-            genai.configure(api_key=api_key)
-            self.model = genai.GenerativeModel('gemini-2.5-flash')
+        # [NEW] Backend ของ LLM แยกเป็น Interface (ใช้ Fake / Record / Replay สำหรับ Load Test ได้)
+        self.backend = self._build_backend(GEMINI_MODEL_NAME)
+
+        # [NEW] Circuit Breaker: ตอน AI ล่มตอบ Fallback ทันทีแทนการรอ Retry จนหมดเวลา
+        self.breaker = CircuitBreaker(
+            failure_threshold=AI_BREAKER_FAILURE_THRESHOLD,
+            reset_seconds=AI_BREAKER_RESET_SECONDS,
+        )
+
+        # [NEW] Model Routing: โมเดลเล็กตรวจก่อน Escalate ไปโมเดลหลักเฉพาะเมื่อจำเป็น
+        self._router = ModelRouter(
+            light_steps=AI_ROUTING_LIGHT_STEPS,
+            light_max_tokens=AI_ROUTING_LIGHT_MAX_TOKENS,
+            pass_threshold=AI_PASS_THRESHOLD,
+            threshold_margin=AI_ROUTING_THRESHOLD_MARGIN,
+        ) if AI_ROUTING_ENABLED else None
+        self.light_backend = self._build_backend(GEMINI_LIGHT_MODEL_NAME) if AI_ROUTING_ENABLED else None
         
-        self._cache = OrderedDict()
-        self._cache_limit = 1000 
-        self._cache_lock = asyncio.Lock() # เพิ่ม Lock เพื่อให้ Thread-safe
+        # [NEW] ด่านคัดกรองงานขยะก่อนถึง AI (ประหยัด Gemini Call)
+        self._prescreener = PreScreener() if AI_PRESCREEN_ENABLED else None
+
+        # [NEW] Structured Output: ขอ JSON ตาม Schema + Parser ที่ซ่อม/Validate คำตอบก่อนใช้งาน
+        self._parser = ResponseParser()
+        self._schema = evaluation_schema() if AI_STRUCTURED_OUTPUT else None
+        self._batch_schema = batch_evaluation_schema() if AI_STRUCTURED_OUTPUT else None
+
+        # [OPTIMIZED] Prompt ส่วนคงที่ถูก Compile ครั้งเดียว + จำกัดความยาวงานนักเรียนตามงบ Token
+        self._prompts = PromptBuilder(content_token_budget=AI_CONTENT_TOKEN_BUDGET)
+
+        # [OPTIMIZED] Cache จำกัดทั้งจำนวน, ขนาด (byte) และอายุ (TTL) พร้อมตัวนับ hit/miss/eviction
+        self._cache = ResultCache(
+            max_entries=AI_CACHE_MAX_ENTRIES,
+            max_bytes=AI_CACHE_MAX_BYTES,
+            ttl_seconds=AI_CACHE_TTL_SECONDS,
+        )
+        # [NEW] Cache ระดับที่ 2 ในฐานข้อมูล ใช้ร่วมกันทุก Worker (ลำดับ: L1 Memory -> L2 DB -> Gemini)
+        self._l2_cache = PersistentResultCache(
+            rubric_version=AI_RUBRIC_VERSION,
+            ttl_seconds=AI_L2_CACHE_TTL_SECONDS,
+        ) if AI_L2_CACHE_ENABLED else None
+
+        # [NEW] Single-flight: Request ที่เนื้อหาเหมือนกันและกำลังประมวลผลอยู่ จะรอผลจากงานแรกแทนการเรียก Gemini ซ้ำ
+        self._inflight = {}  # cache_key -> asyncio.Task
+        self._inflight_lock = asyncio.Lock()
+        self._singleflight_leaders = 0
+        self._singleflight_coalesced = 0
+        self._waiting = 0  # Request ที่รอผลจาก AI อยู่ (รวมที่ถูก Coalesce และ Streaming)
+
+        # [NEW] Micro-batching: ตอนโหลดสูงรวมหลายงานของ Step เดียวกันเป็น 1 Call
+        self._active_calls = 0
+        self._batcher = MicroBatcher(
+            single_fn=self._grade_single,
+            batch_fn=self._grade_batch,
+            window_seconds=AI_BATCH_WINDOW_MS / 1000,
+            max_size=AI_BATCH_MAX_SIZE,
+        ) if AI_BATCH_ENABLED else None
+
+    @staticmethod
+    def _build_backend(model_name: str):
+        return build_llm_backend(
+            AI_LLM_BACKEND,
+            model_name=model_name,
+            api_key=os.getenv("GEMINI_API_KEY"),
+            cassette_path=AI_CASSETTE_PATH,
+            fake_latency_ms=AI_FAKE_LATENCY_MS,
+            fake_sigma=AI_FAKE_LATENCY_SIGMA,
+            fake_429_rate=AI_FAKE_429_RATE,
+        )
+
+    def _prescreen(self, step_number: int, content: str) -> Optional[dict]:
+        if self._prescreener is not None:
+            return self._prescreener.screen(step_number, content)
+        if not content or len(content.strip()) < 10:
+            return self._get_fallback_response(
+                "เนื้อหาสั้นเกินไป กรุณาอธิบายรายละเอียดให้ชัดเจนกว่านี้ (อย่างน้อย 1-2 ประโยค)", "too_short"
+            )
+        return None
 
     def _get_cache_key(self, step_number: int, content: str) -> str:
         """สร้าง Key สำหรับ Cache โดยใช้ MD5 Hash ของข้อความเพื่อประหยัดพื้นที่"""
         raw_data = f"{step_number}:{content.strip()}"
         return hashlib.md5(raw_data.encode('utf-8')).hexdigest()
 
+    # ---------------------------------------------------------
+    # Grading (Single / Micro-batch)
+    # ---------------------------------------------------------
+    async def _grade(self, step_number: int, content: str) -> dict:
+        # รวม Batch เฉพาะตอนที่มีงานค้างที่ Gemini มากพอ ตอนโหลดต่ำจะไม่ต้องรอ window
+        if self._batcher is not None and self._active_calls >= AI_BATCH_LOAD_THRESHOLD:
+            return await self._batcher.submit(step_number, content)
+        return await self._grade_single(step_number, content)
+
+    async def _grade_single(self, step_number: int, content: str) -> dict:
+        self._active_calls += 1
+        try:
+            prompt = self._prompts.build(step_number, content)
+            if self._router is None:
+                return await self._generate_with_retry_and_limit(prompt)
+            return await self._grade_routed(step_number, prompt)
+        finally:
+            self._active_calls -= 1
+
+    async def _grade_routed(self, step_number: int, prompt: BuiltPrompt) -> dict:
+        if self._router.choose(step_number, prompt) == LIGHT:
+            started = time.perf_counter()
+            try:
+                text = await self._generate_text_with_retry_and_limit(prompt, self._schema, backend=self.light_backend)
+                result, repaired = self._parser.parse_with_status(text)
+                reason = self._router.escalation_reason(result, repaired)
+            except ValueError:
+                reason = self._router.escalation_reason(None)
+            self._router.record_latency(LIGHT, time.perf_counter() - started)
+
+            if reason is None:
+                self._router.record_accepted()
+                return result
+            self._router.record_escalation(reason)
+            print(f"⤴️  Escalating Step {step_number} to {GEMINI_MODEL_NAME} ({reason})")
+
+        started = time.perf_counter()
+        result = await self._generate_with_retry_and_limit(prompt)
+        self._router.record_latency(STRONG, time.perf_counter() - started)
+        return result
+
+    async def _grade_batch(self, step_number: int, contents: List[str]) -> List[Optional[dict]]:
+        """คืน List ผลตรวจตามลำดับงาน รายการที่แปลงไม่ได้จะเป็น None (Batcher จะไปเรียกทีละรายการแทน)"""
+        self._active_calls += 1
+        try:
+            text = await self._generate_text_with_retry_and_limit(
+                self._prompts.build_batch(step_number, contents), self._batch_schema
+            )
+        finally:
+            self._active_calls -= 1
+
+        return self._parser.parse_batch(text, len(contents))
+
     async def analyze_step(self, step_number: int, content: str) -> dict:
-        # 1. Validation (ตรวจสอบความยาวข้อความ)
-        if not content or len(content.strip()) < 10:
-            return {
-                "relevance_score": 0,
-                "creativity_score": 0,
-                "score_breakdown": [],
-                "feedback_th": "เนื้อหาสั้นเกินไป กรุณาอธิบายรายละเอียดให้ชัดเจนกว่านี้ (อย่างน้อย 1-2 ประโยค)",
-                "warning_flags": ["too_short"]
-            }
+        # 1. Validation (ตรวจสอบความยาว + คัดกรองงานขยะในเครื่อง)
+        rejected = self._prescreen(step_number, content)
+        if rejected is not None:
+            return rejected
 
         cache_key = self._get_cache_key(step_number, content)
         
         # [FIX 1] Check Cache 
-        async with self._cache_lock:
-            if cache_key in self._cache:
-                self._cache.move_to_end(cache_key)
-                print(f"♻️  Gemini Cache Hit for Step {step_number}")
-                return self._cache[cache_key]
-
-        # 2. Rubric Definition (เกณฑ์การให้คะแนนฉบับเต็ม)
-        rubrics = {
-            1: [
-                "ความชัดเจนของปัญหา (Clarity) - ปัญหาคืออะไร เกิดกับใคร",
-                "ที่มาและความสำคัญ (Background) - ทำไมต้องแก้ปัญหานี้",
-                "กลุ่มเป้าหมาย (Target User) - ระบุผู้ใช้งานชัดเจน",
-                "ความเป็นไปได้ (Feasibility) - แก้ได้จริงหรือไม่"
-            ],
-            2: [
-                "ความน่าเชื่อถือ (Reliability) - ข้อมูลถูกต้อง อ้างอิงได้",
-                "ความหลากหลาย (Variety) - มาจากหลายแหล่งข้อมูล",
-                "ความเกี่ยวข้อง (Relevance) - ตรงกับหัวข้อปัญหา",
-                "การสรุปใจความ (Synthesis) - เรียบเรียงเป็นภาษาตนเอง"
-            ],
-            3: [
-                "ความคิดสร้างสรรค์ (Creativity) - วิธีการแปลกใหม่ น่าสนใจ",
-                "การเปรียบเทียบ (Comparison) - มีหลายทางเลือก",
-                "เหตุผลการเลือก (Justification) - ทำไมเลือกวิธีนี้",
-                "ความละเอียดแบบร่าง (Detail) - อธิบายลักษณะชิ้นงานชัดเจน"
-            ],
-            4: [
-                "ลำดับขั้นตอน (Process) - เป็นขั้นเป็นตอน เข้าใจง่าย",
-                "วัสดุอุปกรณ์ (Materials) - ระบุของที่ต้องใช้ครบถ้วน",
-                "ความปลอดภัย (Safety) - คำนึงถึงความปลอดภัย",
-                "ความเป็นไปได้จริง (Practicality) - ทำได้จริงในเวลาที่มี"
-            ],
-            5: [
-                "วิธีการทดสอบ (Testing Method) - วัดผลได้เป็นรูปธรรม",
-                "การบันทึกผล (Data Collection) - มีตัวเลข/ตารางชัดเจน",
-                "การวิเคราะห์ (Analysis) - อธิบายผลลัพธ์ว่าดี/ไม่ดี",
-                "ความซื่อสัตย์ (Integrity) - รายงานตามความเป็นจริง"
-            ],
-            6: [
-                "การสรุปผล (Conclusion) - ตอบโจทย์ปัญหาตั้งต้นไหม",
-                "จุดเด่น/ด้อย (Pros/Cons) - วิเคราะห์งานตัวเองได้",
-                "การพัฒนาต่อ (Future Work) - เสนอไอเดียต่อยอด",
-                "การสื่อสาร (Communication) - ภาษาเข้าใจง่าย น่าสนใจ"
-            ]
-        }
-        
-        current_rubric = rubrics.get(step_number, ["เกณฑ์ที่ 1", "เกณฑ์ที่ 2", "เกณฑ์ที่ 3", "เกณฑ์ที่ 4"])
-        
-        # 3. Prompt (คำสั่งที่ส่งให้ AI ฉบับเต็ม)
-        prompt = f"""
-        Act as a strict Senior Engineering Professor evaluating a student's EDP project submission (Step {step_number}).
-        Student Input: "{content}"
-
-        EVALUATION CRITERIA (Total 100 points, 25 points each):
-        1. {current_rubric[0]}
-        2. {current_rubric[1]}
-        3. {current_rubric[2]}
-        4. {current_rubric[3]}
-
-        INSTRUCTIONS:
-        - Rate each criteria STRICTLY from 0-25. (Give 0 if missing, 25 only for perfection).
-        - 'relevance_score' MUST be the sum of all breakdown scores.
-        - 'creativity_score': Rate the overall creativity and novelty of the solution from 0-100 independent of the rubric.
-        - Provide helpful feedback in Thai Language (ภาษาไทย).
-        - Check for warning flags (e.g., nonsense, copied text, off-topic).
-
-        RESPONSE JSON FORMAT ONLY:
-        {{
-            "relevance_score": (Integer 0-100),
-            "creativity_score": (Integer 0-100),
-            "score_breakdown": [
-                {{ "criteria": "{current_rubric[0]}", "score": (0-25), "max_score": 25, "comment": "(Short Thai comment explaining the score)" }},
-                {{ "criteria": "{current_rubric[1]}", "score": (0-25), "max_score": 25, "comment": "(Short Thai comment)" }},
-                {{ "criteria": "{current_rubric[2]}", "score": (0-25), "max_score": 25, "comment": "(Short Thai comment)" }},
-                {{ "criteria": "{current_rubric[3]}", "score": (0-25), "max_score": 25, "comment": "(Short Thai comment)" }}
-            ],
-            "feedback_th": "(Full constructive feedback in Thai, approx 2-3 sentences)",
-            "critical_thinking": "(Low/Medium/High)",
-            "sentiment": "(Neutral/Confident/Confused)",
-            "competency_level": "(Novice/Apprentice/Proficient/Distinguished)",
-            "warning_flags": [],
-            "suggested_action": "(Specific advice on what to do next)"
-        }}
-        """
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            print(f"♻️  Gemini Cache Hit for Step {step_number}")
+            return cached
+
+        # [NEW] Single-flight coalescing
+        async with self._inflight_lock:
+            task = self._inflight.get(cache_key)
+            if task is None:
+                task = asyncio.ensure_future(self._evaluate(step_number, content, cache_key))
+                self._inflight[cache_key] = task
+                task.add_done_callback(lambda _t, k=cache_key: self._inflight.pop(k, None))
+                self._singleflight_leaders += 1
+            else:
+                self._singleflight_coalesced += 1
+                print(f"🔗 Coalesced identical submission for Step {step_number}")
 
+        # shield: ถ้าผู้รอคนใดยกเลิก (เช่นปิดหน้าเว็บ) งานที่แชร์กันอยู่จะไม่ถูกยกเลิกไปด้วย
+        self._waiting += 1
         try:
-            # [FIX 2] ครอบ Lock ระหว่างการเรียก API ด้วย เพื่อป้องกัน Race condition สมบูรณ์แบบ
-            # และดักจับ Exception ทุกรูปแบบที่หลุดรอดมาจาก Tenacity
-            result = await self._generate_with_retry_and_limit(prompt)
-            
-            async with self._cache_lock:
-                # ตรวจสอบอีกครั้งเผื่อระหว่างรอ API มี request อื่นเอาใส่ cache ไปแล้ว
-                if cache_key not in self._cache:
-                    self._cache[cache_key] = result
-                    if len(self._cache) > self._cache_limit:
-                        self._cache.popitem(last=False)
-                
+            return await asyncio.shield(task)
+        finally:
+            self._waiting -= 1
+
+    async def _evaluate(self, step_number: int, content: str, cache_key: str) -> dict:
+        """ตรวจงานจริง (L2 Cache -> Gemini) ถูกเรียกเพียงครั้งเดียวต่อ cache_key ที่กำลังประมวลผล"""
+        if self._l2_cache is not None:
+            cached = await self._l2_cache.get(cache_key)
+            if cached is not None:
+                print(f"♻️  Gemini L2 Cache Hit for Step {step_number}")
+                self._cache.set(cache_key, cached)
+                return cached
+
+        try:
+            # [FIX 2] ดักจับ Exception ทุกรูปแบบที่หลุดรอดมาจาก Tenacity
+            result = await self._grade(step_number, content)
+            self._cache.set(cache_key, result)
+            if self._l2_cache is not None:
+                await self._l2_cache.set(cache_key, step_number, result)
             return result
 
+        except CircuitOpenError:
+            return self._get_fallback_response("⚠️ ระบบ AI ขัดข้องชั่วคราว กรุณารอ 1-2 นาทีแล้วกดส่งใหม่อีกครั้งครับ", "quota_exceeded")
+
         except RetryError:
             print("Gemini Quota Exceeded: Max retries reached.")
             return self._get_fallback_response("⚠️ ขณะนี้มีผู้ใช้งานจำนวนมาก ระบบ AI กำลังประมวลผลไม่ทัน กรุณารอ 1-2 นาทีแล้วกดส่งใหม่อีกครั้งครับ", "quota_exceeded")
@@ -159,6 +260,107 @@ class GeminiService:
             print(f"Unexpected Error in analyze_step: {e}")
             return self._get_fallback_response("เกิดข้อผิดพลาดทางเทคนิคในการประมวลผลคำตอบ กรุณาลองใหม่อีกครั้ง", "system_error")
 
+    # ---------------------------------------------------------
+    # Streaming (ส่ง feedback_th ทีละส่วนให้นักเรียนเห็นทันที)
+    # ---------------------------------------------------------
+    async def analyze_step_stream(self, step_number: int, content: str) -> AsyncIterator[Tuple[str, object]]:
+        """
+        Async Generator คืนค่า ("delta", ข้อความ feedback ส่วนใหม่) ระหว่างที่ AI กำลังตอบ
+        และจบด้วย ("result", dict ผลตรวจฉบับเต็ม) เสมอ 1 ครั้ง
+        """
+        rejected = self._prescreen(step_number, content)
+        if rejected is not None:
+            yield "delta", rejected["feedback_th"]
+            yield "result", rejected
+            return
+
+        cache_key = self._get_cache_key(step_number, content)
+        cached = self._cache.get(cache_key)
+        if cached is None and self._l2_cache is not None:
+            cached = await self._l2_cache.get(cache_key)
+            if cached is not None:
+                self._cache.set(cache_key, cached)
+        if cached is not None:
+            yield "delta", cached.get("feedback_th", "")
+            yield "result", cached
+            return
+
+        prompt = self._prompts.build(step_number, content, feedback_first=True)
+        buffer = ""
+        sent = ""
+        self._waiting += 1
+        try:
+            if not self.breaker.allow():
+                raise CircuitOpenError(self.breaker.retry_after())
+            self._active_calls += 1
+            try:
+                async with AsyncExitStack() as stack:
+                    await stack.enter_async_context(gemini_limiter.slot(prompt.prompt_tokens))
+                    if global_gemini_limiter is not None:
+                        await stack.enter_async_context(global_gemini_limiter.slot())
+
+                    async for chunk in self.backend.stream(prompt.text, self._schema):
+                        buffer += chunk
+                        partial = _extract_partial_string(buffer, "feedback_th")
+                        if len(partial) > len(sent):
+                            yield "delta", partial[len(sent):]
+                            sent = partial
+                self.breaker.record_success()
+            except AI_OUTAGE_EXCEPTIONS:
+                self.breaker.record_failure()
+                raise
+            finally:
+                self._active_calls -= 1
+
+            result = self._parser.parse(buffer)
+            self._cache.set(cache_key, result)
+            if self._l2_cache is not None:
+                await self._l2_cache.set(cache_key, step_number, result)
+
+        except CircuitOpenError:
+            result = self._get_fallback_response("⚠️ ระบบ AI ขัดข้องชั่วคราว กรุณารอ 1-2 นาทีแล้วกดส่งใหม่อีกครั้งครับ", "quota_exceeded")
+        except (exceptions.ResourceExhausted, exceptions.TooManyRequests):
+            print("Gemini Quota Exceeded during streaming.")
+            result = self._get_fallback_response("⚠️ โควตาการใช้งาน AI เต็มชั่วคราว กรุณารอ 1-2 นาทีครับ", "quota_exceeded")
+        except Exception as e:
+            print(f"Unexpected Error in analyze_step_stream: {e}")
+            result = self._get_fallback_response("เกิดข้อผิดพลาดทางเทคนิคในการประมวลผลคำตอบ กรุณาลองใหม่อีกครั้ง", "system_error")
+        finally:
+            self._waiting -= 1
+
+        yield "result", result
+
+    def get_stats(self) -> dict:
+        """สถิติการทำงานของ AI Service (ใช้ดูประสิทธิภาพ Cache บน Dashboard ครู)"""
+        return {
+            "cache": self._cache.stats(),
+            "l2_cache": self._l2_cache.stats() if self._l2_cache is not None else None,
+            "singleflight": {
+                "leaders": self._singleflight_leaders,
+                "coalesced": self._singleflight_coalesced,
+                "in_flight": len(self._inflight),
+            },
+            "batching": self._batcher.stats() if self._batcher is not None else None,
+            "active_calls": self._active_calls,
+            "waiting": self._waiting,
+            "breaker": self.breaker.stats(),
+            "limiter": gemini_limiter.stats(),
+            "global_limiter": global_gemini_limiter.stats() if global_gemini_limiter is not None else None,
+            "prompts": self._prompts.stats(),
+            "backend": self.backend.name,
+            "routing": self._router.stats() if self._router is not None else None,
+            "prescreen": self._prescreener.stats() if self._prescreener is not None else None,
+            "parser": self._parser.stats(),
+        }
+
+    def pending_calls(self) -> int:
+        """จำนวนงานที่กำลังรอผลจาก AI ใน Worker นี้ (ใช้ทำ Admission Control)"""
+        return self._waiting
+
+    def clear_local_cache(self):
+        """ล้าง Cache ในหน่วยความจำของ Worker นี้ (ใช้คู่กับการ Purge L2)"""
+        self._cache.clear()
+
     def _get_fallback_response(self, message: str, flag: str) -> dict:
         """Helper method คืนค่า Default เมื่อเกิด Error ป้องกัน Code ซ้ำซ้อน"""
         return {
@@ -177,27 +379,79 @@ class GeminiService:
         wait=wait_exponential(multiplier=1, min=1, max=10),
         retry=retry_if_exception_type(exceptions.ResourceExhausted)
     )
-    async def _generate_with_retry_and_limit(self, prompt: str):
-        # ใช้ Semaphore จำกัดคนเข้า
-        async with gemini_semaphore:
-            response = await self.model.generate_content_async(prompt)
-            
-            # Parsing Logic
-            clean_text = re.sub(r'```json\s*', '', response.text)
-            clean_text = re.sub(r'```\s*', '', clean_text)
-            match = re.search(r'\{.*\}', clean_text, re.DOTALL)
-            
-            if match:
-                result = json.loads(match.group())
-                # Recalculate Score for safety
-                if "score_breakdown" in result:
-                    result["relevance_score"] = sum(item.get("score", 0) for item in result["score_breakdown"])
-                
-                # Default values
-                result.setdefault("warning_flags", [])
-                result.setdefault("creativity_score", 0) 
-                result.setdefault("feedback_th", "ระบบไม่สามารถสรุปคำแนะนำได้")
-                return result
-            else:
-                # โยน ValueError เพื่อให้ block 'except Exception' ในตัวเรียกจัดการ
-                raise ValueError("AI ตอบกลับผิดรูปแบบ ไม่สามารถแปลงเป็น JSON ได้")
\ No newline at end of file
+    async def _generate_text_with_retry_and_limit(self, prompt: BuiltPrompt, response_schema: Optional[dict] = None,
+                                                  backend=None) -> str:
+        backend = backend or self.backend
+        # วงจรเปิดอยู่: ไม่เข้าคิว Limiter และไม่ Retry (CircuitOpenError ไม่อยู่ในเงื่อนไข retry ของ Tenacity)
+        if not self.breaker.allow():
+            raise CircuitOpenError(self.breaker.retry_after())
+
+        # ใช้ Adaptive Limiter จำกัดคนเข้า (โดน 429 จะลด limit อัตโนมัติ) โดยจอง TPM ตาม Token ที่ประเมินไว้
+        try:
+            async with gemini_limiter.slot(prompt.prompt_tokens):
+                if global_gemini_limiter is not None:
+                    async with global_gemini_limiter.slot():
+                        response = await backend.generate(prompt.text, response_schema)
+                else:
+                    response = await backend.generate(prompt.text, response_schema)
+        except AI_OUTAGE_EXCEPTIONS:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None and getattr(usage, "total_token_count", None):
+            gemini_limiter.record_usage(prompt.prompt_tokens, usage.total_token_count)
+            self._prompts.record_actual(usage.prompt_token_count)
+            print(f"🔢 Gemini tokens: prompt≈{prompt.prompt_tokens} (actual {usage.prompt_token_count}), total {usage.total_token_count}{' [truncated]' if prompt.truncated else ''}")
+        return response.text
+
+    async def _generate_with_retry_and_limit(self, prompt: BuiltPrompt):
+        text = await self._generate_text_with_retry_and_limit(prompt, self._schema)
+
+        # Parsing Logic: ซ่อม JSON ที่พังเล็กน้อย + Validate ตาม AiEvaluation
+        # ถ้าแปลงไม่ได้จะโยน ValueError เพื่อให้ block 'except Exception' ในตัวเรียกจัดการ
+        return self._parser.parse(text)
+
+
+def _extract_partial_string(buffer: str, field: str) -> str:
+    """ดึงค่า String ของ field จาก JSON ที่ยังตอบมาไม่ครบ (ใช้กับ Streaming)"""
+    match = re.search(r'"' + re.escape(field) + r'"\s*:\s*"', buffer)
+    if not match:
+        return ""
+
+    raw = []
+    escaped = False
+    for ch in buffer[match.end():]:
+        if escaped:
+            escaped = False
+        elif ch == "\\":
+            escaped = True
+        elif ch == '"':
+            break
+        raw.append(ch)
+
+    raw_text = "".join(raw)
+    # ตัด Escape ที่ยังมาไม่ครบท้ายข้อความออก (เช่น "\\" หรือ "\\u0E")
+    raw_text = re.sub(r'\\(u[0-9a-fA-F]{0,3})?$', '', raw_text)
+    try:
+        return json.loads(f'"{raw_text}"', strict=False)
+    except ValueError:
+        return ""
+
+
+# ---------------------------------------------------------
+# [OPTIMIZED] Singleton ต่อ 1 Worker
+# สร้าง GeminiService ครั้งเดียว ไม่ต้อง configure ใหม่และไม่ทิ้ง Cache ทุก Request
+# ---------------------------------------------------------
+_service_instance: Optional[GeminiService] = None
+# Endpoint แบบ Sync รันใน Threadpool เรียกพร้อมกันได้ ต้องล็อกไม่ให้สร้างซ้ำ (แต่ละตัวมี Limiter/Batcher แยกกัน)
+_service_lock = threading.Lock()
+
+def get_gemini_service() -> GeminiService:
+    global _service_instance
+    if _service_instance is None:
+        with _service_lock:
+            if _service_instance is None:
+                _service_instance = GeminiService()
+    return _service_instance
@@ -0,0 +1,236 @@
+# backend/app/services/global_limiter.py
+import asyncio
+import os
+import socket
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+
+from sqlalchemy import func, text
+
+from app.database import SessionLocal, engine
+from app.models.edp import AiRateLease
+
+try:
+    import fcntl  # มีเฉพาะ Linux/macOS (Production บน Railway)
+except ImportError:
+    fcntl = None
+
+
+class RateBackend:
+    """
+    Interface ของที่เก็บสถานะโควตากลาง
+    try_acquire คืน (lease_id, 0) ถ้าได้สิทธิ์ หรือ (None, วินาทีที่ควรรอ) ถ้าโควตาเต็ม
+    """
+
+    def try_acquire(self) -> Tuple[Optional[object], float]:
+        raise NotImplementedError
+
+    def release(self, lease_id: object):
+        raise NotImplementedError
+
+
+class InMemoryRateBackend(RateBackend):
+    """Backend ในหน่วยความจำ ใช้ได้เฉพาะ Process เดียว (สำหรับ Local/Test)"""
+
+    def __init__(self, concurrency: int, rpm: int, lease_seconds: float = 60):
+        self.concurrency = concurrency
+        self.rpm = rpm
+        self.lease_seconds = lease_seconds
+        self._active = {}            # lease_id -> expires_at
+        self._recent = deque()       # เวลาที่ได้ Lease ใน 60 วินาทีล่าสุด
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            while self._recent and self._recent[0] <= now - 60:
+                self._recent.popleft()
+            for lease_id, expires_at in list(self._active.items()):
+                if expires_at <= now:
+                    del self._active[lease_id]
+
+            if len(self._recent) >= self.rpm:
+                return None, self._recent[0] + 60 - now
+            if len(self._active) >= self.concurrency:
+                return None, 0.2
+
+            self._next_id += 1
+            self._active[self._next_id] = now + self.lease_seconds
+            self._recent.append(now)
+            return self._next_id, 0.0
+
+    def release(self, lease_id):
+        with self._lock:
+            self._active.pop(lease_id, None)
+
+
+class DatabaseRateBackend(RateBackend):
+    """
+    Backend ผ่านฐานข้อมูลที่ใช้อยู่แล้ว ทุก Worker นับโควตาจากตาราง ai_rate_leases ร่วมกัน
+    - Postgres: ใช้ pg_advisory_xact_lock ล็อกระหว่าง "นับ" กับ "จอง" ให้เป็น Atomic
+    - SQLite (Local): ใช้ File Lock แทน
+    """
+
+    ADVISORY_LOCK_KEY = 80420126
+
+    def __init__(self, concurrency: int, rpm: int, lease_seconds: float = 60, session_factory=SessionLocal):
+        self.concurrency = concurrency
+        self.rpm = rpm
+        self.lease_seconds = lease_seconds
+        self._session_factory = session_factory
+        self.holder = f"{socket.gethostname()}:{os.getpid()}"
+
+        self._is_postgres = engine.dialect.name == "postgresql"
+        self._lock_path = os.path.join(tempfile.gettempdir(), "edp_ai_rate_limiter.lock")
+        self._thread_lock = threading.Lock()
+        self._last_cleanup = 0.0
+
+    @contextmanager
+    def _local_lock(self):
+        with self._thread_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self._lock_path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _cleanup(self, db, now: datetime):
+        # ลบ Lease เก่าที่ไม่มีผลต่อการนับแล้ว (เกิน 2 นาที) ทำไม่บ่อยเพื่อลดภาระ DB
+        if time.monotonic() - self._last_cleanup < 30:
+            return
+        self._last_cleanup = time.monotonic()
+        db.query(AiRateLease).filter(
+            AiRateLease.acquired_at < now - timedelta(minutes=2)
+        ).delete(synchronize_session=False)
+
+    def _acquire_in_session(self, db):
+        now = datetime.now(timezone.utc)
+        window_start = now - timedelta(seconds=60)
+
+        active = db.query(func.count(AiRateLease.id)).filter(
+            AiRateLease.released_at.is_(None),
+            AiRateLease.expires_at > now
+        ).scalar()
+        if active >= self.concurrency:
+            return None, 0.2
+
+        recent = db.query(func.count(AiRateLease.id)).filter(AiRateLease.acquired_at > window_start).scalar()
+        if recent >= self.rpm:
+            oldest = db.query(func.min(AiRateLease.acquired_at)).filter(AiRateLease.acquired_at > window_start).scalar()
+            if oldest is not None and oldest.tzinfo is None:
+                oldest = oldest.replace(tzinfo=timezone.utc)
+            retry_after = (oldest + timedelta(seconds=60) - now).total_seconds() if oldest else 1.0
+            return None, max(retry_after, 0.1)
+
+        lease = AiRateLease(
+            holder=self.holder,
+            acquired_at=now,
+            expires_at=now + timedelta(seconds=self.lease_seconds)
+        )
+        db.add(lease)
+        self._cleanup(db, now)
+        db.commit()
+        return lease.id, 0.0
+
+    def try_acquire(self):
+        db = self._session_factory()
+        try:
+            if self._is_postgres:
+                db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": self.ADVISORY_LOCK_KEY})
+                result = self._acquire_in_session(db)
+                db.commit()  # ปล่อย Advisory Lock กรณีไม่ได้จอง
+                return result
+            with self._local_lock():
+                result = self._acquire_in_session(db)
+                db.commit()
+                return result
+        finally:
+            db.close()
+
+    def release(self, lease_id):
+        db = self._session_factory()
+        try:
+            db.query(AiRateLease).filter(AiRateLease.id == lease_id).update(
+                {"released_at": datetime.now(timezone.utc)}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+
+class GlobalLimiter:
+    """ตัวจำกัดโควตารวมทั้ง Cluster ครอบ RateBackend ใด ๆ ให้ใช้แบบ async ได้"""
+
+    def __init__(self, backend: RateBackend, max_poll_seconds: float = 2.0):
+        self.backend = backend
+        self.max_poll_seconds = max_poll_seconds
+
+        self.acquired = 0
+        self.waits = 0
+        self.errors = 0
+        self.total_wait_seconds = 0.0
+
+    async def acquire(self):
+        started = time.monotonic()
+        while True:
+            try:
+                lease_id, retry_after = await asyncio.to_thread(self.backend.try_acquire)
+            except Exception as e:
+                # Backend ใช้งานไม่ได้ ปล่อยผ่าน (ยังมี Local Limiter ป้องกันอยู่) ดีกว่าทำให้ตรวจงานไม่ได้ทั้งระบบ
+                self.errors += 1
+                print(f"Global limiter backend error: {e}")
+                return None
+
+            if lease_id is not None:
+                self.acquired += 1
+                self.total_wait_seconds += time.monotonic() - started
+                return lease_id
+
+            self.waits += 1
+            await asyncio.sleep(min(retry_after, self.max_poll_seconds))
+
+    async def release(self, lease_id):
+        if lease_id is None:
+            return
+        try:
+            await asyncio.to_thread(self.backend.release, lease_id)
+        except Exception as e:
+            self.errors += 1
+            print(f"Global limiter release error: {e}")
+
+    @asynccontextmanager
+    async def slot(self):
+        lease_id = await self.acquire()
+        try:
+            yield
+        finally:
+            await self.release(lease_id)
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "concurrency": getattr(self.backend, "concurrency", None),
+            "rpm": getattr(self.backend, "rpm", None),
+            "acquired": self.acquired,
+            "waits": self.waits,
+            "errors": self.errors,
+            "avg_wait_seconds": round(self.total_wait_seconds / self.acquired, 4) if self.acquired else 0.0,
+        }
+
+
+def build_global_limiter(kind: str, concurrency: int, rpm: int, lease_seconds: float) -> Optional[GlobalLimiter]:
+    if kind == "database":
+        return GlobalLimiter(DatabaseRateBackend(concurrency, rpm, lease_seconds))
+    if kind == "memory":
+        return GlobalLimiter(InMemoryRateBackend(concurrency, rpm, lease_seconds))
+    return None
@@ -0,0 +1,21 @@
+# backend/app/services/grading.py
+from app.models.edp import EdpStep
+
+
+def apply_analysis(step: EdpStep, analysis: dict):
+    """นำผลตรวจจาก AI มาใส่ใน EdpStep (ใช้ร่วมกันทั้งโหมด sync, async และ streaming)"""
+    step.ai_feedback = analysis.get("feedback_th", "N/A")
+    step.score = float(analysis.get("relevance_score", 0))
+    step.creativity_score = float(analysis.get("creativity_score", 0))
+
+    step.score_breakdown = analysis.get("score_breakdown", [])
+    # เก็บ Flag ที่ติดไว้ก่อนตรวจ (เช่น similar_to_peer จากดัชนีความคล้าย) ไว้ด้วย
+    flags = list(analysis.get("warning_flags", []))
+    flags += [flag for flag in (step.warning_flags or []) if flag not in flags]
+    step.warning_flags = flags
+    step.sentiment = analysis.get("sentiment", "Neutral")
+    step.competency_level = analysis.get("competency_level", "Novice")
+    step.critical_thinking = analysis.get("critical_thinking", "Low")
+    step.suggested_action = analysis.get("suggested_action", "")
+
+    step.status = "submitted"
@@ -0,0 +1,361 @@
+# backend/app/services/grading_queue.py
+import asyncio
+import os
+import socket
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from app.core.config import (
+    AI_GRADING_WORKERS, AI_GRADING_MAX_ATTEMPTS, AI_GRADING_LEASE_SECONDS, AI_GRADING_POLL_SECONDS
+)
+from app.database import SessionLocal
+from app.models.edp import EdpStep, GradingJob
+from app.services.circuit_breaker import OPEN
+from app.services.gemini_service import get_gemini_service
+from app.services.grading import apply_analysis
+from app.services.progress import refresh_score
+
+
+class GradingQueue:
+    """
+    คิวตรวจงานด้วย AI แบบเบื้องหลัง (Background Worker Pool)
+    - งานถูกเก็บในตาราง grading_jobs จึงไม่หายเมื่อ Worker Restart
+    - หยิบงานแบบ Atomic (UPDATE ... WHERE status='queued') หลาย Process แย่งกันได้อย่างปลอดภัย
+    - งานที่ถูกถือค้างเกิน Lease (Worker ตายกลางทาง) จะถูกคืนกลับเข้าคิวอัตโนมัติ
+    - ระหว่างตรวจ Worker ต่อ Lease เป็นระยะ และบันทึกผลเฉพาะเมื่อ Lease ยังเป็นของตัวเอง
+    """
+
+    def __init__(self, concurrency: int = AI_GRADING_WORKERS, session_factory=SessionLocal):
+        self.concurrency = concurrency
+        self._session_factory = session_factory
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._watchers: Dict[int, List[asyncio.Event]] = {}
+
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self.paused = 0
+        self.deferred = 0
+        self.lease_lost = 0
+
+        self._depth_value = 0
+        self._depth_at = 0.0
+
+    # ---------------------------------------------------------
+    # Lifecycle
+    # ---------------------------------------------------------
+    def start(self):
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker_loop(i)) for i in range(self.concurrency)]
+        print(f"🧵 Grading queue started ({self.concurrency} workers, id={self.worker_id})")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """ปลุก Worker ให้มาหยิบงานทันที (เรียกหลัง Enqueue)"""
+        self._wakeup.set()
+
+    # ---------------------------------------------------------
+    # Job Status Watchers (ใช้กับ SSE)
+    # ---------------------------------------------------------
+    def watch(self, job_id: int) -> asyncio.Event:
+        event = asyncio.Event()
+        self._watchers.setdefault(job_id, []).append(event)
+        return event
+
+    def unwatch(self, job_id: int, event: asyncio.Event):
+        events = self._watchers.get(job_id, [])
+        if event in events:
+            events.remove(event)
+        if not events:
+            self._watchers.pop(job_id, None)
+
+    def _publish(self, job_id: int):
+        for event in self._watchers.get(job_id, []):
+            event.set()
+
+    # ---------------------------------------------------------
+    # DB Operations (Sync, รันผ่าน asyncio.to_thread)
+    # ---------------------------------------------------------
+    def _requeue_stale_sync(self) -> int:
+        lease_cutoff = datetime.now(timezone.utc) - timedelta(seconds=AI_GRADING_LEASE_SECONDS)
+        db = self._session_factory()
+        try:
+            requeued = db.query(GradingJob).filter(
+                GradingJob.status == "running",
+                GradingJob.locked_at < lease_cutoff
+            ).update({"status": "queued", "worker_id": None, "locked_at": None}, synchronize_session=False)
+            db.commit()
+            return requeued
+        finally:
+            db.close()
+
+    def _claim_sync(self) -> Optional[tuple]:
+        db = self._session_factory()
+        try:
+            candidates = db.query(GradingJob.id).filter(
+                GradingJob.status == "queued"
+            ).order_by(GradingJob.id.asc()).limit(self.concurrency).all()
+
+            for (job_id,) in candidates:
+                claimed = db.query(GradingJob).filter(
+                    GradingJob.id == job_id,
+                    GradingJob.status == "queued"
+                ).update({
+                    "status": "running",
+                    "worker_id": self.worker_id,
+                    "locked_at": datetime.now(timezone.utc),
+                    "attempts": GradingJob.attempts + 1,
+                }, synchronize_session=False)
+                db.commit()
+
+                if claimed:
+                    job = db.query(GradingJob).filter(GradingJob.id == job_id).first()
+                    step = db.query(EdpStep).filter(EdpStep.id == job.step_id).first()
+                    if step is None:
+                        job.status = "failed"
+                        job.error = "Step not found"
+                        job.finished_at = datetime.now(timezone.utc)
+                        db.commit()
+                        continue
+                    return job.id, job.attempts, step.step_number, step.content
+            return None
+        finally:
+            db.close()
+
+    def _lease_query(self, db, job_id: int, attempts: int):
+        # Lease ของเรา = status running, worker_id และ attempts ตรงกับตอนหยิบ (หยิบซ้ำแล้ว attempts จะเปลี่ยน)
+        return db.query(GradingJob).filter(
+            GradingJob.id == job_id,
+            GradingJob.status == "running",
+            GradingJob.worker_id == self.worker_id,
+            GradingJob.attempts == attempts,
+        )
+
+    def _lock_owned(self, db, job_id: int, attempts: int):
+        """
+        ล็อก Step แล้วจึงล็อกงาน (ลำดับเดียวกับการลบ: edp_steps -> grading_jobs)
+        คืน (None, None) ถ้า Lease หลุดไปแล้ว (ถูก Requeue/หยิบซ้ำ) เพื่อไม่เขียนผลซ้ำกับ Worker อื่น
+        """
+        step_id = db.query(GradingJob.step_id).filter(GradingJob.id == job_id).scalar()
+        step = None
+        if step_id is not None:
+            step = db.query(EdpStep).filter(EdpStep.id == step_id).with_for_update().first()
+        job = self._lease_query(db, job_id, attempts).with_for_update().first()
+        if job is None:
+            return None, None
+        return job, step
+
+    def _heartbeat_sync(self, job_id: int, attempts: int) -> bool:
+        """ต่อ Lease ของงานที่กำลังตรวจ คืนค่า False ถ้า Lease ไม่ใช่ของเราแล้ว"""
+        db = self._session_factory()
+        try:
+            extended = self._lease_query(db, job_id, attempts).update(
+                {"locked_at": datetime.now(timezone.utc)}, synchronize_session=False
+            )
+            db.commit()
+            return bool(extended)
+        finally:
+            db.close()
+
+    def _finish_sync(self, job_id: int, attempts: int, analysis: dict) -> bool:
+        """คืนค่า False ถ้า Lease หลุดไปแล้ว (ไม่บันทึกผล)"""
+        db = self._session_factory()
+        try:
+            job, step = self._lock_owned(db, job_id, attempts)
+            if job is None:
+                db.rollback()
+                return False
+            if step is not None:
+                apply_analysis(step, analysis)
+                refresh_score(db, step)
+            job.status = "done"
+            job.error = None
+            job.finished_at = datetime.now(timezone.utc)
+            db.commit()
+            return True
+        finally:
+            db.close()
+
+    def _fail_sync(self, job_id: int, attempts: int, error: str) -> Optional[bool]:
+        """คืนค่า True ถ้างานถูกส่งกลับเข้าคิวเพื่อลองใหม่, None ถ้า Lease หลุดไปแล้ว (ไม่แตะงาน)"""
+        db = self._session_factory()
+        try:
+            job, step = self._lock_owned(db, job_id, attempts)
+            if job is None:
+                db.rollback()
+                return None
+            job.error = error[:500]
+            job.worker_id = None
+            job.locked_at = None
+
+            if attempts < AI_GRADING_MAX_ATTEMPTS:
+                job.status = "queued"
+                db.commit()
+                return True
+
+            job.status = "failed"
+            job.finished_at = datetime.now(timezone.utc)
+            if step is not None:
+                step.status = "grading_failed"
+                step.ai_feedback = "เกิดข้อผิดพลาดทางเทคนิคในการประมวลผลคำตอบ กรุณาลองใหม่อีกครั้ง"
+            db.commit()
+            return False
+        finally:
+            db.close()
+
+    def _defer_sync(self, job_id: int, attempts: int):
+        db = self._session_factory()
+        try:
+            self._lease_query(db, job_id, attempts).update({
+                "status": "queued",
+                "worker_id": None,
+                "locked_at": None,
+                "attempts": GradingJob.attempts - 1,
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _depth_sync(self) -> int:
+        db = self._session_factory()
+        try:
+            return db.query(GradingJob).filter(GradingJob.status.in_(["queued", "running"])).count()
+        finally:
+            db.close()
+
+    # ---------------------------------------------------------
+    # Worker Loop
+    # ---------------------------------------------------------
+    async def _worker_loop(self, index: int):
+        ai_service = get_gemini_service()
+
+        if index == 0:
+            try:
+                requeued = await asyncio.to_thread(self._requeue_stale_sync)
+                if requeued:
+                    print(f"♻️  Requeued {requeued} stale grading jobs")
+            except Exception as e:
+                print(f"Grading queue recovery error: {e}")
+
+        while True:
+            # [NEW] วงจร AI เปิดอยู่: ยังไม่หยิบงาน ปล่อยไว้ในคิว ดีกว่าตรวจแล้วได้ผล Fallback คะแนน 0
+            if ai_service.breaker.state == OPEN:
+                self.paused += 1
+                await asyncio.sleep(max(ai_service.breaker.retry_after(), AI_GRADING_POLL_SECONDS))
+                continue
+
+            try:
+                claimed = await asyncio.to_thread(self._claim_sync)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Grading queue claim error: {e}")
+                claimed = None
+
+            if claimed is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=AI_GRADING_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    # ไม่มีงานใหม่ในเครื่องนี้ ถือโอกาสคืนงานที่ค้างจาก Worker อื่น
+                    if index == 0:
+                        try:
+                            await asyncio.to_thread(self._requeue_stale_sync)
+                        except Exception as e:
+                            print(f"Grading queue recovery error: {e}")
+                continue
+
+            job_id, attempts, step_number, content = claimed
+            # [NEW] ต่อ Lease ระหว่างตรวจ: รอ Limiter/Retry นานเกิน Lease ได้ ไม่งั้นงานถูก Requeue แล้วตรวจซ้ำ
+            heartbeat = asyncio.create_task(self._heartbeat_loop(job_id, attempts))
+            try:
+                analysis = await ai_service.analyze_step(step_number, content)
+                heartbeat.cancel()
+                flags = analysis.get("warning_flags", [])
+                if "system_error" in flags:
+                    # analyze_step ไม่ Raise แต่คืนผล Fallback คะแนน 0 มาแทน ต้องนับเป็นความล้มเหลวเพื่อให้ถูก Retry
+                    raise RuntimeError("AI grading returned system_error fallback")
+                if "quota_exceeded" in flags:
+                    # AI ไม่พร้อม (โควตาเต็ม/วงจรเปิด) คืนงานเข้าคิวโดยไม่นับเป็นความพยายาม
+                    await asyncio.to_thread(self._defer_sync, job_id, attempts)
+                    self.deferred += 1
+                    await asyncio.sleep(AI_GRADING_POLL_SECONDS)
+                else:
+                    if await asyncio.to_thread(self._finish_sync, job_id, attempts, analysis):
+                        self.completed += 1
+                    else:
+                        self.lease_lost += 1
+            except asyncio.CancelledError:
+                # Worker กำลังปิด งานนี้จะถูกคืนเข้าคิวเมื่อ Lease หมดอายุ
+                raise
+            except Exception as e:
+                print(f"Grading job {job_id} failed: {e}")
+                heartbeat.cancel()
+                requeued = await asyncio.to_thread(self._fail_sync, job_id, attempts, str(e))
+                if requeued is None:
+                    self.lease_lost += 1
+                elif requeued:
+                    self.retried += 1
+                    self.notify()
+                else:
+                    self.failed += 1
+            finally:
+                heartbeat.cancel()
+
+            self._publish(job_id)
+
+    async def _heartbeat_loop(self, job_id: int, attempts: int):
+        interval = max(AI_GRADING_LEASE_SECONDS / 3, 1.0)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if not await asyncio.to_thread(self._heartbeat_sync, job_id, attempts):
+                    return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # ต่อไม่สำเร็จครั้งเดียวไม่เป็นไร ยังเหลือเวลาอีก 2 ใน 3 ของ Lease
+                print(f"Grading job {job_id} heartbeat error: {e}")
+
+    async def depth(self) -> int:
+        return await asyncio.to_thread(self._depth_sync)
+
+    async def cached_depth(self, max_age: float = 2.0) -> int:
+        """ความยาวคิวแบบ Cache สั้น ๆ (Admission Control เรียกทุก Submit ไม่ควร COUNT ทุกครั้ง)"""
+        now = time.monotonic()
+        if now - self._depth_at > max_age:
+            self._depth_value = await self.depth()
+            self._depth_at = now
+        return self._depth_value
+
+    def stats(self) -> dict:
+        return {
+            "worker_id": self.worker_id,
+            "concurrency": self.concurrency,
+            "running": bool(self._tasks),
+            "completed": self.completed,
+            "failed": self.failed,
+            "retried": self.retried,
+            "paused": self.paused,
+            "deferred": self.deferred,
+            "lease_lost": self.lease_lost,
+        }
+
+
+_queue_instance: Optional[GradingQueue] = None
+
+def get_grading_queue() -> GradingQueue:
+    global _queue_instance
+    if _queue_instance is None:
+        _queue_instance = GradingQueue()
+    return _queue_instance
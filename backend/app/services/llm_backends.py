@@ -0,0 +1,266 @@
+# backend/app/services/llm_backends.py
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+from collections import namedtuple
+from typing import AsyncIterator, Dict, List, Optional
+
+import google.generativeai as genai
+from google.api_core import exceptions
+
+# รูปแบบเดียวกับ response.usage_metadata ของ Gemini เพื่อให้โค้ดฝั่ง Service ใช้ได้เหมือนกันทุก Backend
+Usage = namedtuple("Usage", ["prompt_token_count", "candidates_token_count", "total_token_count"])
+
+
+class LLMResponse:
+    def __init__(self, text: str, usage_metadata: Optional[Usage] = None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class LLMBackend:
+    """Interface ของผู้ให้บริการ LLM ที่ GeminiService เรียกใช้"""
+
+    name = "base"
+
+    async def generate(self, prompt: str, response_schema: Optional[dict] = None) -> LLMResponse:
+        """response_schema: ขอให้ตอบเป็น JSON ตาม Schema (Backend ที่ไม่รองรับจะไม่สนใจค่านี้)"""
+        raise NotImplementedError
+
+    async def stream(self, prompt: str, response_schema: Optional[dict] = None) -> AsyncIterator[str]:
+        """คืนข้อความทีละส่วน (ค่าเริ่มต้น: ส่งทั้งก้อนครั้งเดียว)"""
+        response = await self.generate(prompt, response_schema)
+        yield response.text
+
+
+def _prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+# ---------------------------------------------------------
+# 1. Gemini จริง
+# ---------------------------------------------------------
+class GeminiBackend(LLMBackend):
+    name = "gemini"
+
+    def __init__(self, model_name: str, api_key: Optional[str]):
+        self.model = None
+        if not api_key:
+            print("Warning: GEMINI_API_KEY not found in .env")
+        else:
+            genai.configure(api_key=api_key)
+            self.model = genai.GenerativeModel(model_name)
+
+    def _require_model(self):
+        if self.model is None:
+            raise RuntimeError("Gemini model is not configured (missing GEMINI_API_KEY)")
+        return self.model
+
+    @staticmethod
+    def _generation_config(response_schema: Optional[dict]) -> Optional[dict]:
+        # [NEW] Structured Output: บังคับให้ Gemini ตอบเป็น JSON ตาม Schema ตั้งแต่ต้นทาง
+        if response_schema is None:
+            return None
+        return {"response_mime_type": "application/json", "response_schema": response_schema}
+
+    async def generate(self, prompt: str, response_schema: Optional[dict] = None) -> LLMResponse:
+        response = await self._require_model().generate_content_async(
+            prompt, generation_config=self._generation_config(response_schema)
+        )
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            usage = Usage(usage.prompt_token_count, usage.candidates_token_count, usage.total_token_count)
+        return LLMResponse(response.text, usage)
+
+    async def stream(self, prompt: str, response_schema: Optional[dict] = None) -> AsyncIterator[str]:
+        response = await self._require_model().generate_content_async(
+            prompt, generation_config=self._generation_config(response_schema), stream=True
+        )
+        async for chunk in response:
+            text = self._chunk_text(chunk)
+            if text:
+                yield text
+
+    @staticmethod
+    def _chunk_text(chunk) -> str:
+        """
+        ข้อความของ Chunk จาก parts โดยตรง
+        (chunk.text โยน ValueError เมื่อ Chunk ไม่มีข้อความ เช่นถูก Safety Block หรือมีแค่ finish_reason)
+        """
+        candidates = getattr(chunk, "candidates", None) or []
+        if not candidates:
+            return ""
+        content = getattr(candidates[0], "content", None)
+        parts = getattr(content, "parts", None) or []
+        return "".join(getattr(part, "text", "") or "" for part in parts)
+
+
+# ---------------------------------------------------------
+# 2. Fake (สำหรับ Load Test แบบไม่เสียโควตา)
+# ---------------------------------------------------------
+class FakeBackend(LLMBackend):
+    """
+    คืนผลตรวจที่ถูกต้องตาม Schema โดยไม่เรียกเครือข่าย
+    - latency: กระจายแบบ Log-normal รอบค่า median (ms) ปรับความกว้างด้วย sigma
+    - rate_429: สัดส่วนการโยน ResourceExhausted เพื่อทดสอบ Retry / Limiter / Circuit Breaker
+    - ผลลัพธ์ Deterministic ตามเนื้อหา Prompt (Prompt เดิมได้คะแนนเดิมเสมอ)
+    """
+
+    name = "fake"
+
+    _CRITERIA_LINE = re.compile(r"^\s*[1-4]\.\s+(.+)$", re.MULTILINE)
+    _BATCH_COUNT = re.compile(r"Return exactly (\d+) objects")
+
+    def __init__(self, latency_ms: float = 1500, sigma: float = 0.5, rate_429: float = 0.0, seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.sigma = sigma
+        self.rate_429 = rate_429
+        self._rng = random.Random(seed)
+        self.calls = 0
+
+    def _latency(self) -> float:
+        if self.latency_ms <= 0:
+            return 0.0
+        return self._rng.lognormvariate(0, self.sigma) * self.latency_ms / 1000
+
+    def _evaluation(self, prompt: str, index: int) -> dict:
+        digest = hashlib.md5(f"{index}:{prompt}".encode("utf-8")).digest()
+        criteria = self._CRITERIA_LINE.findall(prompt)[:4] or [f"เกณฑ์ที่ {i}" for i in range(1, 5)]
+        breakdown = [
+            {"criteria": name, "score": digest[i] % 26, "max_score": 25, "comment": "ผลตรวจจำลอง (Fake Backend)"}
+            for i, name in enumerate(criteria)
+        ]
+        total = sum(item["score"] for item in breakdown)
+        return {
+            "relevance_score": total,
+            "creativity_score": digest[5] % 101,
+            "score_breakdown": breakdown,
+            "feedback_th": "นี่คือคำแนะนำจำลองสำหรับการทดสอบระบบ ไม่ได้มาจาก AI จริง",
+            "critical_thinking": ["Low", "Medium", "High"][digest[6] % 3],
+            "sentiment": ["Neutral", "Confident", "Confused"][digest[7] % 3],
+            "competency_level": ["Novice", "Apprentice", "Proficient", "Distinguished"][digest[8] % 4],
+            "warning_flags": [],
+            "suggested_action": "ทดสอบระบบต่อได้เลย"
+        }
+
+    def _render(self, prompt: str) -> str:
+        match = self._BATCH_COUNT.search(prompt)
+        if match:
+            items = []
+            for i in range(1, int(match.group(1)) + 1):
+                item = self._evaluation(prompt, i)
+                item["id"] = i
+                items.append(item)
+            return json.dumps(items, ensure_ascii=False)
+        return json.dumps(self._evaluation(prompt, 0), ensure_ascii=False)
+
+    async def generate(self, prompt: str, response_schema: Optional[dict] = None) -> LLMResponse:
+        self.calls += 1
+        await asyncio.sleep(self._latency())
+        if self.rate_429 and self._rng.random() < self.rate_429:
+            raise exceptions.ResourceExhausted("Fake backend: simulated 429")
+
+        text = self._render(prompt)
+        prompt_tokens = len(prompt) // 3
+        output_tokens = len(text) // 3
+        return LLMResponse(text, Usage(prompt_tokens, output_tokens, prompt_tokens + output_tokens))
+
+    async def stream(self, prompt: str, response_schema: Optional[dict] = None) -> AsyncIterator[str]:
+        response = await self.generate(prompt, response_schema)
+        for i in range(0, len(response.text), 40):
+            await asyncio.sleep(0.01)
+            yield response.text[i:i + 40]
+
+
+# ---------------------------------------------------------
+# 3. Recorder / 4. Replayer (Cassette แบบ JSON Lines)
+# ---------------------------------------------------------
+class RecordingBackend(LLMBackend):
+    """เรียก Backend จริงแล้วบันทึกคำตอบลง Cassette (1 บรรทัดต่อ 1 Prompt)"""
+
+    name = "record"
+
+    def __init__(self, inner: LLMBackend, cassette_path: str):
+        self.inner = inner
+        self.cassette_path = cassette_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(cassette_path)), exist_ok=True)
+
+    def _save(self, prompt: str, response: LLMResponse):
+        record = {
+            "prompt_sha256": _prompt_hash(prompt),
+            "text": response.text,
+            "usage": list(response.usage_metadata) if response.usage_metadata else None,
+        }
+        with self._lock, open(self.cassette_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    async def generate(self, prompt: str, response_schema: Optional[dict] = None) -> LLMResponse:
+        response = await self.inner.generate(prompt, response_schema)
+        await asyncio.to_thread(self._save, prompt, response)
+        return response
+
+    async def stream(self, prompt: str, response_schema: Optional[dict] = None) -> AsyncIterator[str]:
+        chunks: List[str] = []
+        async for chunk in self.inner.stream(prompt, response_schema):
+            chunks.append(chunk)
+            yield chunk
+        await asyncio.to_thread(self._save, prompt, LLMResponse("".join(chunks)))
+
+
+class ReplayBackend(LLMBackend):
+    """
+    เล่นคำตอบจาก Cassette ที่บันทึกไว้ (จับคู่ด้วย SHA-256 ของ Prompt)
+    Prompt ที่ไม่มีใน Cassette จะส่งต่อให้ fallback (ถ้ามี) หรือโยน KeyError
+    """
+
+    name = "replay"
+
+    def __init__(self, cassette_path: str, fallback: Optional[LLMBackend] = None, latency_ms: float = 0):
+        self.cassette_path = cassette_path
+        self.fallback = fallback
+        self.latency_ms = latency_ms
+        self._records: Dict[str, dict] = {}
+        self.hits = 0
+        self.misses = 0
+
+        if os.path.exists(cassette_path):
+            with open(cassette_path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        record = json.loads(line)
+                        self._records[record["prompt_sha256"]] = record
+        print(f"📼 Loaded {len(self._records)} recorded responses from {cassette_path}")
+
+    async def generate(self, prompt: str, response_schema: Optional[dict] = None) -> LLMResponse:
+        record = self._records.get(_prompt_hash(prompt))
+        if record is None:
+            self.misses += 1
+            if self.fallback is not None:
+                return await self.fallback.generate(prompt, response_schema)
+            raise KeyError("Prompt not found in cassette")
+
+        self.hits += 1
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        usage = Usage(*record["usage"]) if record.get("usage") else None
+        return LLMResponse(record["text"], usage)
+
+
+def build_llm_backend(kind: str, model_name: str, api_key: Optional[str], cassette_path: str,
+                      fake_latency_ms: float, fake_sigma: float, fake_429_rate: float) -> LLMBackend:
+    if kind == "fake":
+        return FakeBackend(latency_ms=fake_latency_ms, sigma=fake_sigma, rate_429=fake_429_rate)
+    if kind == "record":
+        return RecordingBackend(GeminiBackend(model_name, api_key), cassette_path)
+    if kind == "replay":
+        return ReplayBackend(
+            cassette_path,
+            fallback=FakeBackend(latency_ms=fake_latency_ms, sigma=fake_sigma, rate_429=fake_429_rate)
+        )
+    return GeminiBackend(model_name, api_key)
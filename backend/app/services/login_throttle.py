@@ -0,0 +1,261 @@
+# backend/app/services/login_throttle.py
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+
+from app.database import SessionLocal
+from app.models.edp import LoginAttempt
+from app.core.config import (
+    LOGIN_THROTTLE_BACKEND, LOGIN_THROTTLE_WINDOW_SECONDS,
+    LOGIN_MAX_FAILURES_PER_ACCOUNT, LOGIN_MAX_FAILURES_PER_IP, TRUSTED_PROXY_HOPS
+)
+
+
+class ThrottleBackend:
+    """
+    Interface ของที่เก็บจำนวน Login ที่ล้มเหลว
+    retry_after คืนวินาทีที่ต้องรอของ Key ที่เกินเพดาน (0 = ผ่าน)
+    """
+
+    def retry_after(self, limits: Dict[str, int], window: float) -> float:
+        raise NotImplementedError
+
+    def record(self, keys: List[str]):
+        raise NotImplementedError
+
+    def reset(self, key: str):
+        raise NotImplementedError
+
+
+class InMemoryThrottleBackend(ThrottleBackend):
+    """Sliding Window ในหน่วยความจำ (ต่อ Worker) จำกัดจำนวน Key กันหน่วยความจำบวมจากการสุ่มอีเมล"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._hits: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def _prune(self, key: str, now: float, window: float) -> Optional[deque]:
+        hits = self._hits.get(key)
+        if hits is None:
+            return None
+        while hits and hits[0] <= now - window:
+            hits.popleft()
+        if not hits:
+            del self._hits[key]
+            return None
+        return hits
+
+    def retry_after(self, limits, window):
+        with self._lock:
+            now = time.monotonic()
+            wait = 0.0
+            for key, limit in limits.items():
+                hits = self._prune(key, now, window)
+                if hits is not None and len(hits) >= limit:
+                    # ต้องรอจนครั้งที่เก่าที่สุดที่ยังนับอยู่หลุดออกจาก Window
+                    wait = max(wait, hits[-limit] + window - now)
+            return wait
+
+    def record(self, keys):
+        with self._lock:
+            now = time.monotonic()
+            if len(self._hits) >= self.max_keys:
+                # ทิ้ง Key ที่ไม่มีการเคลื่อนไหวนานที่สุดก่อน (dict เรียงตามลำดับที่ใส่)
+                for stale in list(self._hits)[: self.max_keys // 10]:
+                    del self._hits[stale]
+            for key in keys:
+                hits = self._hits.pop(key, None) or deque()
+                hits.append(now)
+                self._hits[key] = hits
+
+    def reset(self, key):
+        with self._lock:
+            self._hits.pop(key, None)
+
+
+class DatabaseThrottleBackend(ThrottleBackend):
+    """นับจากตาราง login_attempts ร่วมกันทุก Worker (เพดานไม่หลุดเมื่อ Load Balancer กระจาย Request)"""
+
+    def __init__(self, session_factory=SessionLocal):
+        self._session_factory = session_factory
+        self._last_cleanup = 0.0
+
+    def retry_after(self, limits, window):
+        now = datetime.now(timezone.utc)
+        db = self._session_factory()
+        try:
+            rows = db.query(
+                LoginAttempt.key, func.count(LoginAttempt.id), func.min(LoginAttempt.created_at)
+            ).filter(
+                LoginAttempt.key.in_(list(limits)),
+                LoginAttempt.created_at > now - timedelta(seconds=window)
+            ).group_by(LoginAttempt.key).all()
+        finally:
+            db.close()
+
+        wait = 0.0
+        for key, count, oldest in rows:
+            if count >= limits[key]:
+                if oldest is not None and oldest.tzinfo is None:
+                    oldest = oldest.replace(tzinfo=timezone.utc)
+                # ใช้ครั้งที่เก่าที่สุดเป็นค่าประมาณ (Retry-After ต่ำไปเล็กน้อย แต่ Query เดียว)
+                wait = max(wait, (oldest + timedelta(seconds=window) - now).total_seconds() if oldest else window)
+        return max(wait, 1.0) if wait else 0.0
+
+    def record(self, keys):
+        now = datetime.now(timezone.utc)
+        db = self._session_factory()
+        try:
+            db.add_all([LoginAttempt(key=key, created_at=now) for key in keys])
+            if time.monotonic() - self._last_cleanup > 60:
+                self._last_cleanup = time.monotonic()
+                db.query(LoginAttempt).filter(
+                    LoginAttempt.created_at < now - timedelta(days=1)
+                ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def reset(self, key):
+        db = self._session_factory()
+        try:
+            db.query(LoginAttempt).filter(LoginAttempt.key == key).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+
+class LoginThrottle:
+    """
+    จำกัดจำนวน Login ที่ล้มเหลวต่อบัญชีและต่อ IP ภายใน Sliding Window
+    - ตรวจก่อนค้นผู้ใช้และก่อน bcrypt: ครั้งที่เกินเพดานไม่กิน CPU เลย
+    - อีเมลที่ไม่มีในระบบก็ถูกนับ (กันการสุ่มอีเมลไปเรื่อย ๆ เพื่อหลบเพดานต่อบัญชี)
+    - Backend ใช้งานไม่ได้ = ปล่อยผ่าน (ไม่ทำให้ Login ไม่ได้ทั้งระบบ)
+    """
+
+    def __init__(self, backend: Optional[ThrottleBackend], window: float, max_per_account: int, max_per_ip: int):
+        self.backend = backend
+        self.window = window
+        self.max_per_account = max_per_account
+        self.max_per_ip = max_per_ip
+
+        self.allowed = 0
+        self.throttled = 0
+        self.hashed = 0
+        self.failures = 0
+        self.unknown_accounts = 0
+        self.errors = 0
+
+    @staticmethod
+    def _account_key(email: str) -> str:
+        return f"account:{(email or '').strip().lower()}"
+
+    @staticmethod
+    def _ip_key(ip: Optional[str]) -> str:
+        return f"ip:{ip or 'unknown'}"
+
+    def retry_after(self, email: str, ip: Optional[str]) -> float:
+        if self.backend is None:
+            self.allowed += 1
+            return 0.0
+        try:
+            wait = self.backend.retry_after(
+                {self._account_key(email): self.max_per_account, self._ip_key(ip): self.max_per_ip}, self.window
+            )
+        except Exception as e:
+            self.errors += 1
+            print(f"Login throttle backend error: {e}")
+            return 0.0
+        if wait > 0:
+            self.throttled += 1
+        else:
+            self.allowed += 1
+        return wait
+
+    def record_hash(self):
+        self.hashed += 1
+
+    def record_failure(self, email: str, ip: Optional[str], known_account: bool = True):
+        self.failures += 1
+        if not known_account:
+            self.unknown_accounts += 1
+        if self.backend is None:
+            return
+        try:
+            self.backend.record([self._account_key(email), self._ip_key(ip)])
+        except Exception as e:
+            self.errors += 1
+            print(f"Login throttle backend error: {e}")
+
+    def record_success(self, email: str):
+        # Login สำเร็จล้างตัวนับของบัญชี (ตัวนับของ IP ยังอยู่ กันการเดาข้ามบัญชีจากเครื่องเดียว)
+        if self.backend is None:
+            return
+        try:
+            self.backend.reset(self._account_key(email))
+        except Exception as e:
+            self.errors += 1
+            print(f"Login throttle backend error: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__ if self.backend else None,
+            "window_seconds": self.window,
+            "max_failures_per_account": self.max_per_account,
+            "max_failures_per_ip": self.max_per_ip,
+            "allowed": self.allowed,
+            "throttled": self.throttled,
+            "hashed": self.hashed,
+            "failures": self.failures,
+            "unknown_accounts": self.unknown_accounts,
+            "errors": self.errors,
+        }
+
+
+def client_ip(request, trusted_hops: int = TRUSTED_PROXY_HOPS) -> Optional[str]:
+    """
+    IP ของผู้ใช้สำหรับนับ Login ที่ล้มเหลว
+    - Proxy แต่ละชั้นต่อท้าย X-Forwarded-For ด้วย IP ที่ตัวเองเห็น จึงใช้รายการที่ trusted_hops นับจากขวา
+    - รายการทางซ้ายกว่านั้นผู้ใช้ส่งมาเองได้ (สุ่มเปลี่ยนเพื่อหลบเพดานต่อ IP) จึงไม่ใช้
+    - trusted_hops = 0 หรือ Header สั้นกว่าจำนวน Proxy: ใช้ IP ของ Connection ตรง
+    """
+    peer = request.client.host if request.client else None
+    if trusted_hops <= 0:
+        return peer
+    forwarded = [
+        part.strip()
+        for header in request.headers.getlist("x-forwarded-for")
+        for part in header.split(",")
+        if part.strip()
+    ]
+    if len(forwarded) < trusted_hops:
+        return peer
+    return forwarded[-trusted_hops]
+
+
+def build_throttle_backend(kind: str) -> Optional[ThrottleBackend]:
+    if kind == "database":
+        return DatabaseThrottleBackend()
+    if kind == "memory":
+        return InMemoryThrottleBackend()
+    return None
+
+
+_login_throttle: Optional[LoginThrottle] = None
+
+
+def get_login_throttle() -> LoginThrottle:
+    global _login_throttle
+    if _login_throttle is None:
+        _login_throttle = LoginThrottle(
+            build_throttle_backend(LOGIN_THROTTLE_BACKEND),
+            window=LOGIN_THROTTLE_WINDOW_SECONDS,
+            max_per_account=LOGIN_MAX_FAILURES_PER_ACCOUNT,
+            max_per_ip=LOGIN_MAX_FAILURES_PER_IP,
+        )
+    return _login_throttle
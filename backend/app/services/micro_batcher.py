@@ -0,0 +1,124 @@
+# backend/app/services/micro_batcher.py
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+SingleFn = Callable[[int, str], Awaitable[dict]]
+BatchFn = Callable[[int, List[str]], Awaitable[List[Optional[dict]]]]
+
+
+class MicroBatcher:
+    """
+    รวมงานของ Step เดียวกันที่เข้ามาในช่วงเวลาสั้น ๆ (window) ให้เป็น Prompt เดียว
+    - ส่ง Batch เมื่อครบ max_size หรือครบ window_seconds (แล้วแต่อย่างไหนถึงก่อน)
+    - ผลลัพธ์ของแต่ละงานถูกส่งกลับไปยัง Request ที่รออยู่ผ่าน Future
+    - ถ้าแปลงผล Batch ไม่ได้ (ทั้งก้อนหรือบางรายการ) จะถอยไปเรียกทีละรายการแทน
+    - ถ้าเรียก AI ไม่สำเร็จ (โควตาเต็ม/API ล่ม) ส่ง Exception ให้ทุกงานใน Batch โดยไม่เรียกซ้ำ
+    """
+
+    def __init__(self, single_fn: SingleFn, batch_fn: BatchFn, window_seconds: float = 0.2, max_size: int = 8):
+        self._single_fn = single_fn
+        self._batch_fn = batch_fn
+        self.window_seconds = window_seconds
+        self.max_size = max_size
+
+        # step_number -> [(content, future), ...]
+        self._pending: Dict[int, List[Tuple[str, asyncio.Future]]] = {}
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        # อ้างอิง Task ที่กำลังส่งไว้ กัน GC เก็บกลางทาง (Event Loop ถือแค่ Weak Reference)
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.batches_sent = 0
+        self.items_batched = 0
+        self.single_calls = 0
+        self.fallback_items = 0
+
+    def submit(self, step_number: int, content: str) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        queue = self._pending.setdefault(step_number, [])
+        queue.append((content, future))
+
+        if len(queue) >= self.max_size:
+            self._flush(step_number)
+        elif step_number not in self._timers:
+            self._timers[step_number] = loop.call_later(self.window_seconds, self._flush, step_number)
+        return future
+
+    def _flush(self, step_number: int):
+        timer = self._timers.pop(step_number, None)
+        if timer is not None:
+            timer.cancel()
+        items = self._pending.pop(step_number, [])
+        if items:
+            task = asyncio.ensure_future(self._dispatch(step_number, items))
+            self._tasks.add(task)
+            task.add_done_callback(lambda t, i=items: self._dispatch_done(t, i))
+
+    def _dispatch_done(self, task: asyncio.Task, items: List[Tuple[str, asyncio.Future]]):
+        self._tasks.discard(task)
+        error = None if task.cancelled() else task.exception()
+        if error is not None:
+            print(f"Micro-batch dispatch crashed ({len(items)} items): {error}")
+        # ไม่ปล่อยให้ Request ที่รอผลค้างตลอดไป (Task ถูกยกเลิก/พังก่อนส่งผลครบ)
+        for _, future in items:
+            if future.done():
+                continue
+            if error is None:
+                future.cancel()
+            else:
+                future.set_exception(error)
+
+    async def _run_single(self, step_number: int, content: str, future: asyncio.Future):
+        self.single_calls += 1
+        try:
+            result = await self._single_fn(step_number, content)
+            if not future.done():
+                future.set_result(result)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+
+    async def _dispatch(self, step_number: int, items: List[Tuple[str, asyncio.Future]]):
+        if len(items) == 1:
+            content, future = items[0]
+            await self._run_single(step_number, content, future)
+            return
+
+        self.batches_sent += 1
+        self.items_batched += len(items)
+        try:
+            results = await self._batch_fn(step_number, [content for content, _ in items])
+        except ValueError as e:
+            print(f"Batch grading response unparseable ({len(items)} items), falling back to single calls: {e}")
+            results = [None] * len(items)
+        except Exception as e:
+            # โควตาเต็ม/API ล่ม: ถ้าถอยไปเรียกทีละรายการจะยิงเพิ่มอีก N ครั้งในช่วงที่ AI ไม่พร้อมอยู่แล้ว
+            print(f"Batch grading failed ({len(items)} items): {e}")
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        fallbacks = []
+        for (content, future), result in zip(items, results):
+            if result is None:
+                fallbacks.append(self._run_single(step_number, content, future))
+            elif not future.done():
+                future.set_result(result)
+
+        if fallbacks:
+            self.fallback_items += len(fallbacks)
+            await asyncio.gather(*fallbacks)
+
+    def stats(self) -> dict:
+        return {
+            "window_seconds": self.window_seconds,
+            "max_size": self.max_size,
+            "batches_sent": self.batches_sent,
+            "items_batched": self.items_batched,
+            "avg_batch_size": round(self.items_batched / self.batches_sent, 2) if self.batches_sent else 0.0,
+            "single_calls": self.single_calls,
+            "fallback_items": self.fallback_items,
+            "pending": sum(len(q) for q in self._pending.values()),
+            "in_flight": len(self._tasks),
+        }
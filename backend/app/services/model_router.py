@@ -0,0 +1,100 @@
+# backend/app/services/model_router.py
+import threading
+from collections import deque
+from typing import Dict, Iterable, Optional
+
+from app.services.prompt_builder import BuiltPrompt
+
+LIGHT = "light"
+STRONG = "strong"
+
+
+def _percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class ModelRouter:
+    """
+    เลือกโมเดลตรวจงาน 2 ระดับ
+    - light: โมเดลเล็ก/เร็ว สำหรับงานสั้น หรือขั้นตอนต้น ๆ (Step ที่กำหนด)
+    - strong: โมเดลหลัก ใช้กับงานยาว และเมื่อผลจาก light ไม่น่าเชื่อถือ (Escalate)
+
+    เหตุผลที่ Escalate:
+    - invalid_output: แปลง/Validate คำตอบไม่ได้
+    - repaired_output: JSON ต้องซ่อมก่อนใช้
+    - incomplete: ให้คะแนนไม่ครบทุกเกณฑ์ หรือไม่มี feedback
+    - near_threshold: คะแนนรวมอยู่ใกล้เกณฑ์ผ่าน (ผลกระทบต่อนักเรียนสูง ควรให้โมเดลหลักตัดสิน)
+    """
+
+    def __init__(self, light_steps: Iterable[int], light_max_tokens: int, pass_threshold: float,
+                 threshold_margin: float, expected_criteria: int = 4, latency_window: int = 500):
+        self.light_steps = set(light_steps)
+        self.light_max_tokens = light_max_tokens
+        self.pass_threshold = pass_threshold
+        self.threshold_margin = threshold_margin
+        self.expected_criteria = expected_criteria
+
+        self._lock = threading.Lock()
+        self.routed = {LIGHT: 0, STRONG: 0}
+        self.accepted_light = 0
+        self.escalations: Dict[str, int] = {}
+        self._latency = {LIGHT: deque(maxlen=latency_window), STRONG: deque(maxlen=latency_window)}
+
+    def choose(self, step_number: int, prompt: BuiltPrompt) -> str:
+        if prompt.truncated:
+            return STRONG
+        if step_number in self.light_steps or prompt.content_tokens <= self.light_max_tokens:
+            tier = LIGHT
+        else:
+            tier = STRONG
+        with self._lock:
+            self.routed[tier] += 1
+        return tier
+
+    def escalation_reason(self, result: Optional[dict], repaired: bool = False) -> Optional[str]:
+        """คืนเหตุผลที่ต้องส่งต่อให้โมเดลหลัก หรือ None ถ้าใช้ผลจากโมเดลเล็กได้"""
+        if result is None:
+            return "invalid_output"
+        if repaired:
+            return "repaired_output"
+        breakdown = result.get("score_breakdown") or []
+        if len(breakdown) < self.expected_criteria or not str(result.get("feedback_th", "")).strip():
+            return "incomplete"
+        if abs(float(result.get("relevance_score", 0)) - self.pass_threshold) <= self.threshold_margin:
+            return "near_threshold"
+        return None
+
+    def record_accepted(self):
+        with self._lock:
+            self.accepted_light += 1
+
+    def record_escalation(self, reason: str):
+        with self._lock:
+            self.escalations[reason] = self.escalations.get(reason, 0) + 1
+
+    def record_latency(self, tier: str, seconds: float):
+        with self._lock:
+            self._latency[tier].append(seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            latency = {}
+            for tier, samples in self._latency.items():
+                ordered = sorted(samples)
+                latency[tier] = {
+                    "samples": len(ordered),
+                    "p50_ms": round(_percentile(ordered, 0.5) * 1000, 1),
+                    "p95_ms": round(_percentile(ordered, 0.95) * 1000, 1),
+                }
+            escalated = sum(self.escalations.values())
+            return {
+                "routed": dict(self.routed),
+                "accepted_light": self.accepted_light,
+                "escalated": escalated,
+                "escalation_rate": round(escalated / self.routed[LIGHT], 4) if self.routed[LIGHT] else 0.0,
+                "escalation_reasons": dict(self.escalations),
+                "latency": latency,
+            }
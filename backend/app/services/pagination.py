@@ -0,0 +1,80 @@
+# backend/app/services/pagination.py
+import base64
+import json
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from app.core.config import PAGINATION_COUNT_TTL_SECONDS
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(kind: str, **values) -> str:
+    """Cursor แบบทึบ (Base64 ของ JSON) ผูกกับชนิดรายการ เพื่อไม่ให้ใช้ Cursor ข้าม Endpoint"""
+    raw = json.dumps({"k": kind, **values}, separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(kind: str, cursor: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeError) as e:
+        raise InvalidCursor("cursor ไม่ถูกต้อง") from e
+    if not isinstance(values, dict) or values.pop("k", None) != kind:
+        raise InvalidCursor("cursor ไม่ถูกต้อง")
+    return values
+
+
+class CountCache:
+    """
+    Cache จำนวนรวม (X-Total-Count) ต่อ Worker
+    หน้าถัด ๆ ไปไม่ต้อง COUNT(*) ทั้งตารางซ้ำ Key ใส่เวอร์ชันข้อมูลไว้ จึงนับใหม่ทันทีเมื่อมีการเขียน
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._values: Dict[str, Tuple[float, int]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, loader: Callable[[], int]) -> int:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._values.get(key)
+            if cached is not None and cached[0] > now:
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        value = int(loader() or 0)
+        with self._lock:
+            if len(self._values) >= 64:
+                # Key ผูกกับเวอร์ชันข้อมูล เวอร์ชันเก่าที่หมดอายุแล้วไม่ถูกใช้อีก
+                self._values = {k: v for k, v in self._values.items() if v[0] > now}
+            self._values[key] = (now + self.ttl_seconds, value)
+        return value
+
+    def invalidate(self, key: Optional[str] = None):
+        with self._lock:
+            if key is None:
+                self._values.clear()
+            else:
+                self._values.pop(key, None)
+
+    def stats(self) -> dict:
+        return {"ttl_seconds": self.ttl_seconds, "keys": len(self._values), "hits": self.hits, "misses": self.misses}
+
+
+_count_cache: Optional[CountCache] = None
+
+
+def get_count_cache() -> CountCache:
+    global _count_cache
+    if _count_cache is None:
+        _count_cache = CountCache(PAGINATION_COUNT_TTL_SECONDS)
+    return _count_cache
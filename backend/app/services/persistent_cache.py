@@ -0,0 +1,134 @@
+# backend/app/services/persistent_cache.py
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from app.database import SessionLocal
+from app.models.edp import AiResultCache
+
+
+class PersistentResultCache:
+    """
+    Cache ผลตรวจระดับที่ 2 (L2) เก็บในตาราง ai_result_cache
+    - ใช้ร่วมกันได้ทุก Worker และยังอยู่หลัง Restart/Deploy
+    - Key = (cache_key, rubric_version) เปลี่ยนเกณฑ์เมื่อไหร่ ผลเก่าจะไม่ถูกใช้อัตโนมัติ
+    - ทุกคำสั่ง DB รันใน Thread แยก (asyncio.to_thread) เพื่อไม่ให้ Event Loop ค้าง
+    """
+
+    def __init__(self, rubric_version: str, ttl_seconds: float, session_factory=SessionLocal):
+        self.rubric_version = rubric_version
+        self.ttl_seconds = ttl_seconds
+        self._session_factory = session_factory
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+
+    # ---------------------------------------------------------
+    # Sync Implementation (รันใน Thread)
+    # ---------------------------------------------------------
+    def _get_sync(self, cache_key: str) -> Optional[Any]:
+        db = self._session_factory()
+        try:
+            row = db.query(AiResultCache).filter(
+                AiResultCache.cache_key == cache_key,
+                AiResultCache.rubric_version == self.rubric_version
+            ).first()
+            if row is None:
+                return None
+
+            expires_at = row.expires_at
+            if expires_at is not None and expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            if expires_at is not None and expires_at <= datetime.now(timezone.utc):
+                return None
+
+            row.hit_count = (row.hit_count or 0) + 1
+            db.commit()
+            return row.result
+        finally:
+            db.close()
+
+    def _set_sync(self, cache_key: str, step_number: int, result: Any):
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds)
+        db = self._session_factory()
+        try:
+            row = db.query(AiResultCache).filter(
+                AiResultCache.cache_key == cache_key,
+                AiResultCache.rubric_version == self.rubric_version
+            ).first()
+            if row:
+                row.result = result
+                row.expires_at = expires_at
+            else:
+                db.add(AiResultCache(
+                    cache_key=cache_key,
+                    rubric_version=self.rubric_version,
+                    step_number=step_number,
+                    result=result,
+                    expires_at=expires_at
+                ))
+            db.commit()
+        except IntegrityError:
+            # อีก Worker บันทึก Key เดียวกันไปก่อนแล้ว ใช้ของเขาได้เลย
+            db.rollback()
+        finally:
+            db.close()
+
+    # ---------------------------------------------------------
+    # Async API
+    # ---------------------------------------------------------
+    async def get(self, cache_key: str) -> Optional[Any]:
+        try:
+            result = await asyncio.to_thread(self._get_sync, cache_key)
+        except Exception as e:
+            # Cache พังต้องไม่ทำให้การตรวจงานพัง
+            self.errors += 1
+            print(f"L2 Cache read error: {e}")
+            return None
+
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    async def set(self, cache_key: str, step_number: int, result: Any):
+        try:
+            await asyncio.to_thread(self._set_sync, cache_key, step_number, result)
+            self.writes += 1
+        except Exception as e:
+            self.errors += 1
+            print(f"L2 Cache write error: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "rubric_version": self.rubric_version,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "errors": self.errors,
+        }
+
+
+def purge_ai_result_cache(db, keep_version: Optional[str] = None, expired_only: bool = False) -> int:
+    """
+    ลบ Cache ผลตรวจแบบ Bulk
+    - expired_only=True: ลบเฉพาะรายการที่หมดอายุแล้ว
+    - keep_version: ลบทุกเวอร์ชันยกเว้นเวอร์ชันนี้ (ใช้ตอนเปลี่ยน Rubric)
+    - ไม่ระบุอะไรเลย: ล้างทั้งตาราง
+    คืนค่าจำนวนแถวที่ถูกลบ
+    """
+    query = db.query(AiResultCache)
+    if expired_only:
+        query = query.filter(AiResultCache.expires_at <= datetime.now(timezone.utc))
+    elif keep_version is not None:
+        query = query.filter(AiResultCache.rubric_version != keep_version)
+
+    deleted = query.delete(synchronize_session=False)
+    db.commit()
+    return deleted
@@ -0,0 +1,171 @@
+# backend/app/services/prescreen.py
+import math
+import re
+import threading
+from collections import Counter
+from typing import Dict, Optional, Set
+
+from app.services.prompt_builder import RUBRICS
+
+# คำถามนำและภารกิจของแต่ละขั้นตอน (ตรงกับ STEP_CONTENT ในหน้า ProjectDetail ของ Frontend)
+# ใช้ตรวจว่านักเรียนคัดลอกโจทย์มาส่งแทนคำตอบหรือไม่
+STEP_PROMPTS = {
+    1: [
+        "ระบุปัญหา (Problem Identification)", "ทำความเข้าใจปัญหาให้ถ่องแท้",
+        "ปัญหาที่เกิดขึ้นคืออะไร? (What)", "ปัญหานี้เกิดกับใคร? (Who)",
+        "เกิดขึ้นที่ไหนและเมื่อไหร่? (Where/When)", "ทำไมปัญหานี้ถึงสำคัญและควรได้รับการแก้ไข? (Why)",
+        "เขียนอธิบายสภาพปัญหา และระบุขอบเขตของปัญหาให้ชัดเจน",
+    ],
+    2: [
+        "รวบรวมข้อมูล (Related Information Search)", "ค้นหาความรู้เพื่อใช้แก้ปัญหา",
+        "มีความรู้ทางวิทยาศาสตร์ คณิตศาสตร์ หรือเทคโนโลยีใดที่เกี่ยวข้องบ้าง?",
+        "มีใครเคยแก้ปัญหานี้มาก่อนไหม? เขาทำอย่างไร?", "วัสดุหรืออุปกรณ์อะไรบ้างที่น่าจะนำมาใช้ได้?",
+        "สรุปความรู้ ทฤษฎี หรือหลักการที่หามาได้ และบอกแหล่งที่มาของข้อมูล",
+    ],
+    3: [
+        "ออกแบบวิธีการแก้ปัญหา (Solution Design)", "คิดค้นและเลือกวิธีที่ดีที่สุด",
+        "มีแนวทางแก้ปัญหาที่เป็นไปได้กี่วิธี? (ลองคิดออกมาหลายๆ แบบ)", "แต่ละวิธีมีข้อดี-ข้อเสียอย่างไร?",
+        "วิธีไหนเหมาะสมที่สุดภายใต้เงื่อนไขที่มี (เวลา, งบประมาณ, ความสามารถ)?",
+        "อธิบายแนวคิดที่เลือก หรือวาดภาพร่าง (Sketch) ของชิ้นงาน พร้อมระบุส่วนประกอบสำคัญ",
+    ],
+    4: [
+        "วางแผนและดำเนินการ (Planning and Development)", "ลงมือสร้างชิ้นงานจริง",
+        "ต้องใช้วัสดุอุปกรณ์อะไรบ้าง? จำนวนเท่าไหร่?", "ลำดับขั้นตอนการสร้างเป็นอย่างไร? (ทำอะไรก่อน-หลัง)",
+        "ต้องคำนึงถึงความปลอดภัยในขั้นตอนไหนบ้าง?",
+        "เขียนแผนการปฏิบัติงาน หรือบันทึกขั้นตอนการสร้างชิ้นงานต้นแบบ (Prototype)",
+    ],
+    5: [
+        "ทดสอบ ประเมินผล และปรับปรุง (Testing & Evaluation)", "ตรวจสอบประสิทธิภาพและแก้ไขจุดบกพร่อง",
+        "จะทดสอบชิ้นงานอย่างไรให้เห็นผลชัดเจน? (กำหนดเกณฑ์การทดสอบ)", "ผลการทดสอบเป็นไปตามเป้าหมายไหม?",
+        "พบจุดบกพร่องอะไร? และได้ทำการแก้ไขอย่างไร?",
+        "บันทึกผลการทดสอบ (เป็นตัวเลขหรือตาราง) และอธิบายสิ่งที่ได้ปรับปรุงแก้ไข",
+    ],
+    6: [
+        "นำเสนอผลงาน (Presentation)", "สื่อสารสิ่งที่ทำมาทั้งหมดให้ผู้อื่นเข้าใจ",
+        "จุดเด่นของผลงานนี้คืออะไร?", "ผลงานนี้แก้ปัญหาได้จริงหรือไม่?", "ถ้ามีเวลาเพิ่ม จะพัฒนาอะไรต่อในอนาคต?",
+        "สรุปภาพรวมของโครงงาน จุดเด่น ข้อจำกัด และข้อเสนอแนะสำหรับการพัฒนาต่อ",
+    ],
+}
+
+MESSAGES = {
+    "too_short": "เนื้อหาสั้นเกินไป กรุณาอธิบายรายละเอียดให้ชัดเจนกว่านี้ (อย่างน้อย 1-2 ประโยค)",
+    "repetitive": "เนื้อหามีการพิมพ์ตัวอักษรหรือคำซ้ำ ๆ กรุณาเขียนคำตอบที่สื่อความหมายจริงเกี่ยวกับโครงงานของคุณ",
+    "gibberish": "ระบบไม่สามารถอ่านเนื้อหานี้ได้ กรุณาเขียนคำตอบเป็นภาษาไทยหรือภาษาอังกฤษที่อ่านเข้าใจได้",
+    "copied_prompt": "เนื้อหาที่ส่งมาเหมือนกับคำถาม/โจทย์ของขั้นตอนนี้ กรุณาตอบคำถามด้วยข้อมูลโครงงานของคุณเอง",
+}
+
+_WHITESPACE = re.compile(r"\s+")
+_LATIN_WORD = re.compile(r"[A-Za-z]{4,}")
+_LATIN_VOWELS = set("aeiouyAEIOUY")
+
+
+def _is_readable_char(ch: str) -> bool:
+    """อักษรที่คาดว่าจะเจอในคำตอบปกติ: ไทย, อังกฤษ, ตัวเลข, เครื่องหมายวรรคตอนพื้นฐาน"""
+    code = ord(ch)
+    return (
+        0x0E00 <= code <= 0x0E7F
+        or ch.isascii()
+        or ch in "“”‘’–—…•°×÷"
+    )
+
+
+def _trigrams(text: str) -> Set[str]:
+    compact = _WHITESPACE.sub("", text.lower())
+    return {compact[i:i + 3] for i in range(len(compact) - 2)}
+
+
+def char_entropy(text: str) -> float:
+    """Shannon Entropy (bits/ตัวอักษร) ข้อความปกติภาษาไทย/อังกฤษจะอยู่ราว 4-5 bits"""
+    if not text:
+        return 0.0
+    counts = Counter(text)
+    total = len(text)
+    return -sum((c / total) * math.log2(c / total) for c in counts.values())
+
+
+class PreScreener:
+    """
+    ด่านคัดกรองงานขยะในเครื่อง (ไม่เรียก AI) ใช้เวลาระดับไมโครวินาที
+    คืนผลในรูปแบบเดียวกับ GeminiService.analyze_step (คะแนน 0 + warning_flags)
+    """
+
+    def __init__(self, min_length: int = 10, min_entropy: float = 2.0):
+        self.min_length = min_length
+        self.min_entropy = min_entropy
+        self._prompt_trigrams: Dict[int, Set[str]] = {
+            step: _trigrams(" ".join(STEP_PROMPTS.get(step, []) + RUBRICS.get(step, [])))
+            for step in set(STEP_PROMPTS) | set(RUBRICS)
+        }
+
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.rejected: Counter = Counter()
+
+    def _classify(self, step_number: int, content: str) -> Optional[str]:
+        text = (content or "").strip()
+        if len(text) < self.min_length:
+            return "too_short"
+
+        compact = _WHITESPACE.sub("", text)
+
+        # 1. ตัวอักษรซ้ำ ๆ / Entropy ต่ำ (เช่น "ๆๆๆๆๆๆ", "aaaaaaaaaa", "5555555555")
+        if len(set(compact)) <= 3 or char_entropy(compact) < self.min_entropy:
+            return "repetitive"
+        most_common_count = Counter(compact).most_common(1)[0][1]
+        if most_common_count / len(compact) > 0.5:
+            return "repetitive"
+
+        # 2. คำเดิมซ้ำ ๆ (เช่น "ดี ดี ดี ดี ดี ดี")
+        words = text.split()
+        if len(words) >= 6 and len(set(words)) / len(words) < 0.25:
+            return "repetitive"
+
+        # 3. ไม่ใช่ภาษาไทย/อังกฤษ (อักษรแปลก ๆ เกินครึ่ง)
+        readable = sum(1 for ch in compact if _is_readable_char(ch))
+        if readable / len(compact) < 0.6:
+            return "gibberish"
+
+        # 4. พิมพ์มั่วบนแป้นภาษาอังกฤษ (คำยาวที่ไม่มีสระเลยเป็นส่วนใหญ่ เช่น "sdfghjkl qwrtyp")
+        latin_words = _LATIN_WORD.findall(text)
+        thai_chars = sum(1 for ch in compact if 0x0E00 <= ord(ch) <= 0x0E7F)
+        if len(latin_words) >= 3 and thai_chars < len(compact) * 0.2:
+            no_vowel = sum(1 for w in latin_words if not (set(w) & _LATIN_VOWELS))
+            if no_vowel / len(latin_words) > 0.5:
+                return "gibberish"
+
+        # 5. คัดลอกคำถาม/เกณฑ์ของขั้นตอนมาส่ง
+        prompt_grams = self._prompt_trigrams.get(step_number)
+        content_grams = _trigrams(text)
+        if prompt_grams and content_grams:
+            overlap = len(content_grams & prompt_grams) / len(content_grams)
+            if overlap >= 0.85:
+                return "copied_prompt"
+
+        return None
+
+    def screen(self, step_number: int, content: str) -> Optional[dict]:
+        """คืน dict ผลตรวจ (คะแนน 0) ถ้าไม่ผ่านการคัดกรอง หรือ None ถ้าควรส่งให้ AI ตรวจต่อ"""
+        reason = self._classify(step_number, content)
+        with self._lock:
+            self.checked += 1
+            if reason:
+                self.rejected[reason] += 1
+
+        if reason is None:
+            return None
+        return {
+            "relevance_score": 0,
+            "creativity_score": 0,
+            "score_breakdown": [],
+            "feedback_th": MESSAGES[reason],
+            "warning_flags": [reason]
+        }
+
+    def stats(self) -> dict:
+        saved = sum(self.rejected.values())
+        return {
+            "checked": self.checked,
+            "saved_calls": saved,
+            "saved_ratio": round(saved / self.checked, 4) if self.checked else 0.0,
+            "by_reason": dict(self.rejected),
+        }
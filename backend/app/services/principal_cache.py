@@ -0,0 +1,155 @@
+# backend/app/services/principal_cache.py
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.config import (
+    AUTH_PRINCIPAL_CACHE_TTL_SECONDS, AUTH_PRINCIPAL_CACHE_MAX_ENTRIES, AUTH_PRINCIPAL_SYNC_SECONDS
+)
+from app.models.edp import User, PrincipalInvalidation
+
+# เก็บเฉพาะข้อมูลที่ Endpoint อ่าน (ไม่เก็บ hashed_password ไว้ในหน่วยความจำ)
+PRINCIPAL_FIELDS = ("id", "email", "student_id", "first_name", "last_name", "class_room", "role", "created_at")
+
+
+class PrincipalCache:
+    """
+    Cache ผู้ใช้ที่ยืนยันตัวตนแล้ว (ต่อ 1 Worker) Key = user id จาก JWT
+    - หมดอายุตาม TTL และจำกัดจำนวน (LRU)
+    - การแก้ไขผู้ใช้ (โปรไฟล์/สิทธิ์/รหัสผ่าน) บันทึกลง principal_invalidations
+      ทุก Worker อ่านตารางนี้ทุก sync_seconds (1 Query ต่อรอบ ไม่ใช่ต่อ Request) แล้วล้างรายการที่เกี่ยวข้อง
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int, sync_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.sync_seconds = sync_seconds
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()  # user_id -> (expires_at, snapshot)
+        self._last_invalidation_id: Optional[int] = None
+        self._next_sync = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.syncs = 0
+
+    # ---------------------------------------------------------
+    # Lookup
+    # ---------------------------------------------------------
+    def get(self, user_id: int, email: str) -> Optional[dict]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] <= now or entry[1]["email"] != email:
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user: User):
+        snapshot = {field: getattr(user, field) for field in PRINCIPAL_FIELDS}
+        with self._lock:
+            self._entries[user.id] = (time.monotonic() + self.ttl_seconds, snapshot)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def materialize(snapshot: dict) -> User:
+        """สร้าง User แบบ Transient (ไม่ผูกกับ Session) จาก Snapshot ใช้อ่านค่าได้เหมือนเดิม แต่ห้ามแก้ไขแล้ว Commit"""
+        return User(**snapshot)
+
+    # ---------------------------------------------------------
+    # Invalidation
+    # ---------------------------------------------------------
+    def invalidate(self, user_id: int):
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def claim_sync(self) -> bool:
+        """
+        คืน True ให้ผู้เรียกเพียงรายเดียวต่อรอบ (ผู้เรียกคนนั้นต้องเรียก sync_invalidations ต่อ)
+        Request อื่นใช้ Cache ต่อไประหว่างนั้น ไม่วิ่งไปที่ DB พร้อมกันทั้งหมด
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self._next_sync:
+                return False
+            self._next_sync = now + self.sync_seconds
+            return True
+
+    def sync_invalidations(self, db: Session):
+        """อ่านการ Invalidate ใหม่จาก Worker/Script อื่น (เรียกหลัง claim_sync ได้ True, รันใน Thread)"""
+        with self._lock:
+            last_id = self._last_invalidation_id
+
+        if last_id is None:
+            # ครั้งแรก: ยังไม่มีอะไรใน Cache เริ่มนับจากรายการล่าสุด
+            latest = db.query(func.max(PrincipalInvalidation.id)).scalar()
+            with self._lock:
+                self._last_invalidation_id = latest or 0
+            return
+
+        rows = db.query(PrincipalInvalidation.id, PrincipalInvalidation.user_id)\
+            .filter(PrincipalInvalidation.id > last_id)\
+            .order_by(PrincipalInvalidation.id.asc()).all()
+        with self._lock:
+            self.syncs += 1
+            for row_id, user_id in rows:
+                if self._entries.pop(user_id, None) is not None:
+                    self.invalidations += 1
+                self._last_invalidation_id = max(self._last_invalidation_id, row_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "invalidations": self.invalidations,
+                "syncs": self.syncs,
+            }
+
+
+def invalidate_principal(db: Session, user_id: int):
+    """
+    เรียกทุกครั้งที่แก้ข้อมูลผู้ใช้ (ใน Transaction เดียวกับการแก้ไข ผู้เรียกเป็นคน Commit)
+    ล้าง Cache ของ Worker นี้ทันที และบันทึกให้ Worker อื่นล้างตามในรอบ Sync ถัดไป
+    """
+    get_principal_cache().invalidate(user_id)
+    db.add(PrincipalInvalidation(user_id=user_id))
+    # เก็บประวัติแค่ 1 วันก็พอ (Worker ทุกตัว Sync ทุกไม่กี่วินาที)
+    cutoff = datetime.now(timezone.utc) - timedelta(days=1)
+    db.query(PrincipalInvalidation).filter(PrincipalInvalidation.created_at < cutoff).delete(synchronize_session=False)
+
+
+_cache_instance: Optional[PrincipalCache] = None
+
+def get_principal_cache() -> PrincipalCache:
+    global _cache_instance
+    if _cache_instance is None:
+        _cache_instance = PrincipalCache(
+            ttl_seconds=AUTH_PRINCIPAL_CACHE_TTL_SECONDS,
+            max_entries=AUTH_PRINCIPAL_CACHE_MAX_ENTRIES,
+            sync_seconds=AUTH_PRINCIPAL_SYNC_SECONDS,
+        )
+    return _cache_instance
@@ -0,0 +1,119 @@
+# backend/app/services/progress.py
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models.edp import EdpStep, ProjectProgress
+
+FINAL_STEP = 6
+PASS_SCORE = 60
+
+
+def effective_score(step: EdpStep) -> Optional[float]:
+    """คะแนนที่ใช้จริง: คะแนนครูถ้ามี ไม่งั้นใช้คะแนน AI (เหมือน coalesce(teacher_score, score) ที่ใช้ทั่วระบบ)"""
+    return step.teacher_score if step.teacher_score is not None else step.score
+
+
+def _is_completed(step_number: int, score: Optional[float]) -> bool:
+    return step_number == FINAL_STEP and score is not None and score >= PASS_SCORE
+
+
+def record_step(db: Session, step: EdpStep):
+    """
+    เรียกหลัง flush งานที่เพิ่งส่ง (ต้องมี step.id แล้ว) ภายใน Transaction เดียวกับการบันทึกงาน
+    งานที่ id น้อยกว่าของเดิม (Transaction ที่ Commit ช้ากว่า) จะไม่ทับงานที่ใหม่กว่า
+    """
+    score = effective_score(step)
+    completed = _is_completed(step.step_number, score)
+    row = db.get(ProjectProgress, (step.project_id, step.step_number))
+    if row is not None and row.latest_step_id is not None and row.latest_step_id > step.id:
+        if completed:
+            row.ever_completed = True
+        return
+
+    current = db.query(ProjectProgress).filter(
+        ProjectProgress.project_id == step.project_id,
+        ProjectProgress.is_current.is_(True),
+        ProjectProgress.step_number != step.step_number
+    ).all()
+    if any(other.latest_step_id > step.id for other in current):
+        is_current = False
+    else:
+        is_current = True
+        for other in current:
+            other.is_current = False
+
+    if row is None:
+        row = ProjectProgress(project_id=step.project_id, step_number=step.step_number)
+        db.add(row)
+    row.latest_step_id = step.id
+    row.effective_score = score
+    row.completed = completed
+    row.ever_completed = bool(row.ever_completed or completed)
+    row.is_current = is_current
+
+
+def refresh_score(db: Session, step: EdpStep):
+    """
+    เรียกเมื่อคะแนนของงานเปลี่ยน (AI ตรวจเสร็จ/ครูให้คะแนน) มีผลเฉพาะเมื่อเป็นงานล่าสุดของ Step นั้น
+    ยกเว้น ever_completed ที่ถูกตั้งจากงาน Step 6 ครั้งใดก็ได้ที่ผ่าน (เหมือนการนับโปรเจกต์ที่เสร็จแบบเดิม)
+    """
+    # Flush งานก่อน (edp_steps แล้ว data_versions) ให้ลำดับการล็อกตรงกับการส่งงานและการลบ ก่อนแตะ project_progress
+    db.flush()
+    score = effective_score(step)
+    completed = _is_completed(step.step_number, score)
+    db.query(ProjectProgress).filter(ProjectProgress.latest_step_id == step.id).update({
+        "effective_score": score,
+        "completed": completed,
+    }, synchronize_session=False)
+    if completed:
+        db.query(ProjectProgress).filter(
+            ProjectProgress.project_id == step.project_id,
+            ProjectProgress.step_number == FINAL_STEP
+        ).update({"ever_completed": True}, synchronize_session=False)
+
+
+def delete_progress(db: Session, project_ids):
+    """ต้องลบก่อน edp_steps เพราะ latest_step_id อ้างถึงตารางนั้น"""
+    db.query(ProjectProgress).filter(ProjectProgress.project_id.in_(project_ids)).delete(synchronize_session=False)
+
+
+def rebuild_progress(db: Session) -> int:
+    """สร้างตาราง project_progress ใหม่ทั้งหมดจาก edp_steps (ใช้ครั้งแรกหลังเพิ่มตาราง หรือเมื่อข้อมูลเพี้ยน)"""
+    db.query(ProjectProgress).delete(synchronize_session=False)
+
+    latest_ids = db.query(func.max(EdpStep.id)).group_by(EdpStep.project_id, EdpStep.step_number)
+    steps = db.query(EdpStep).filter(EdpStep.id.in_(latest_ids)).all()
+    current_ids = {
+        step_id for (step_id,) in db.query(func.max(EdpStep.id)).group_by(EdpStep.project_id).all()
+    }
+    passed_ids = {
+        project_id for (project_id,) in db.query(EdpStep.project_id).filter(
+            EdpStep.step_number == FINAL_STEP,
+            func.coalesce(EdpStep.teacher_score, EdpStep.score) >= PASS_SCORE
+        ).distinct().all()
+    }
+
+    for step in steps:
+        score = effective_score(step)
+        db.add(ProjectProgress(
+            project_id=step.project_id,
+            step_number=step.step_number,
+            latest_step_id=step.id,
+            effective_score=score,
+            is_current=step.id in current_ids,
+            completed=_is_completed(step.step_number, score),
+            ever_completed=step.step_number == FINAL_STEP and step.project_id in passed_ids,
+        ))
+    db.commit()
+    return len(steps)
+
+
+def ensure_progress(db: Session) -> int:
+    """เติมข้อมูลให้ตารางที่เพิ่งสร้าง (ว่างอยู่แต่มีงานใน edp_steps แล้ว) คืนจำนวนแถวที่สร้าง"""
+    if db.query(ProjectProgress.project_id).first() is not None:
+        return 0
+    if db.query(EdpStep.id).first() is None:
+        return 0
+    return rebuild_progress(db)
@@ -0,0 +1,263 @@
+# backend/app/services/prompt_builder.py
+import math
+import re
+import textwrap
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+# เกณฑ์การให้คะแนนฉบับเต็ม (Rubric) ของแต่ละขั้นตอน EDP
+RUBRICS = {
+    1: [
+        "ความชัดเจนของปัญหา (Clarity) - ปัญหาคืออะไร เกิดกับใคร",
+        "ที่มาและความสำคัญ (Background) - ทำไมต้องแก้ปัญหานี้",
+        "กลุ่มเป้าหมาย (Target User) - ระบุผู้ใช้งานชัดเจน",
+        "ความเป็นไปได้ (Feasibility) - แก้ได้จริงหรือไม่"
+    ],
+    2: [
+        "ความน่าเชื่อถือ (Reliability) - ข้อมูลถูกต้อง อ้างอิงได้",
+        "ความหลากหลาย (Variety) - มาจากหลายแหล่งข้อมูล",
+        "ความเกี่ยวข้อง (Relevance) - ตรงกับหัวข้อปัญหา",
+        "การสรุปใจความ (Synthesis) - เรียบเรียงเป็นภาษาตนเอง"
+    ],
+    3: [
+        "ความคิดสร้างสรรค์ (Creativity) - วิธีการแปลกใหม่ น่าสนใจ",
+        "การเปรียบเทียบ (Comparison) - มีหลายทางเลือก",
+        "เหตุผลการเลือก (Justification) - ทำไมเลือกวิธีนี้",
+        "ความละเอียดแบบร่าง (Detail) - อธิบายลักษณะชิ้นงานชัดเจน"
+    ],
+    4: [
+        "ลำดับขั้นตอน (Process) - เป็นขั้นเป็นตอน เข้าใจง่าย",
+        "วัสดุอุปกรณ์ (Materials) - ระบุของที่ต้องใช้ครบถ้วน",
+        "ความปลอดภัย (Safety) - คำนึงถึงความปลอดภัย",
+        "ความเป็นไปได้จริง (Practicality) - ทำได้จริงในเวลาที่มี"
+    ],
+    5: [
+        "วิธีการทดสอบ (Testing Method) - วัดผลได้เป็นรูปธรรม",
+        "การบันทึกผล (Data Collection) - มีตัวเลข/ตารางชัดเจน",
+        "การวิเคราะห์ (Analysis) - อธิบายผลลัพธ์ว่าดี/ไม่ดี",
+        "ความซื่อสัตย์ (Integrity) - รายงานตามความเป็นจริง"
+    ],
+    6: [
+        "การสรุปผล (Conclusion) - ตอบโจทย์ปัญหาตั้งต้นไหม",
+        "จุดเด่น/ด้อย (Pros/Cons) - วิเคราะห์งานตัวเองได้",
+        "การพัฒนาต่อ (Future Work) - เสนอไอเดียต่อยอด",
+        "การสื่อสาร (Communication) - ภาษาเข้าใจง่าย น่าสนใจ"
+    ]
+}
+
+DEFAULT_RUBRIC = ["เกณฑ์ที่ 1", "เกณฑ์ที่ 2", "เกณฑ์ที่ 3", "เกณฑ์ที่ 4"]
+
+# ส่วนคำสั่งที่ไม่เปลี่ยนตามงานของนักเรียน (Compile ครั้งเดียวต่อ Step)
+_SINGLE_TEMPLATE = textwrap.dedent("""
+    Act as a strict Senior Engineering Professor evaluating a student's EDP project submission (Step {step_number}).
+
+    EVALUATION CRITERIA (Total 100 points, 25 points each):
+    1. {r0}
+    2. {r1}
+    3. {r2}
+    4. {r3}
+
+    INSTRUCTIONS:
+    - Rate each criteria STRICTLY from 0-25. (Give 0 if missing, 25 only for perfection).
+    - 'relevance_score' MUST be the sum of all breakdown scores.
+    - 'creativity_score': Rate the overall creativity and novelty of the solution from 0-100 independent of the rubric.
+    - Provide helpful feedback in Thai Language (ภาษาไทย).
+    - Check for warning flags (e.g., nonsense, copied text, off-topic).
+
+    RESPONSE JSON FORMAT ONLY:
+    {result_format}
+""").strip()
+
+_BATCH_TEMPLATE = textwrap.dedent("""
+    Act as a strict Senior Engineering Professor evaluating several independent student EDP project submissions (Step {step_number}).
+    Evaluate EACH submission separately. Never let one submission influence another.
+
+    EVALUATION CRITERIA (Total 100 points, 25 points each):
+    1. {r0}
+    2. {r1}
+    3. {r2}
+    4. {r3}
+
+    INSTRUCTIONS:
+    - Rate each criteria STRICTLY from 0-25. (Give 0 if missing, 25 only for perfection).
+    - 'relevance_score' MUST be the sum of all breakdown scores.
+    - 'creativity_score': Rate the overall creativity and novelty of the solution from 0-100 independent of the rubric.
+    - Provide helpful feedback in Thai Language (ภาษาไทย).
+    - Check for warning flags (e.g., nonsense, copied text, off-topic).
+
+    RESPONSE JSON ARRAY ONLY, one object per submission, each object has an "id" (the submission number) plus:
+    {result_format}
+""").strip()
+
+_RESULT_FORMAT = textwrap.dedent("""
+    {{
+        "relevance_score": (Integer 0-100),
+        "creativity_score": (Integer 0-100),
+        "score_breakdown": [
+            {{ "criteria": "{r0}", "score": (0-25), "max_score": 25, "comment": "(Short Thai comment explaining the score)" }},
+            {{ "criteria": "{r1}", "score": (0-25), "max_score": 25, "comment": "(Short Thai comment)" }},
+            {{ "criteria": "{r2}", "score": (0-25), "max_score": 25, "comment": "(Short Thai comment)" }},
+            {{ "criteria": "{r3}", "score": (0-25), "max_score": 25, "comment": "(Short Thai comment)" }}
+        ],
+        "feedback_th": "(Full constructive feedback in Thai, approx 2-3 sentences)",
+        "critical_thinking": "(Low/Medium/High)",
+        "sentiment": "(Neutral/Confident/Confused)",
+        "competency_level": "(Novice/Apprentice/Proficient/Distinguished)",
+        "warning_flags": [],
+        "suggested_action": "(Specific advice on what to do next)"
+    }}
+""").strip()
+
+TRUNCATION_MARKER = "\n[... ตัดเนื้อหาบางส่วนออกเนื่องจากยาวเกินกำหนด ...]\n"
+
+_THAI_RANGE = re.compile(r"[\u0e00-\u0e7f]")
+_BLANK_LINES = re.compile(r"\n\s*\n+")
+_SPACES = re.compile(r"[ \t\u00a0]+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    ประเมินจำนวน Token แบบเร็ว (ไม่เรียก API)
+    - อักษรละติน/ตัวเลข ประมาณ 4 ตัวอักษรต่อ Token
+    - อักษรไทยและอักษรอื่น ๆ ประมาณ 2 ตัวอักษรต่อ Token
+    """
+    if not text:
+        return 0
+    thai_chars = len(_THAI_RANGE.findall(text))
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    other_chars = len(text) - thai_chars - ascii_chars
+    return math.ceil(ascii_chars / 4 + (thai_chars + other_chars) / 2)
+
+
+def condense_content(content: str, token_budget: int) -> Tuple[str, bool]:
+    """
+    ย่องานของนักเรียนให้อยู่ในงบ Token
+    1. ตัดช่องว่าง/บรรทัดว่างซ้ำ และบรรทัดที่ซ้ำกันทั้งบรรทัด
+    2. ถ้ายังยาวเกิน เก็บส่วนต้น (~70%) และส่วนท้าย (~30%) ไว้ ตัดตรงกลางออก
+    คืนค่า (ข้อความ, ถูกตัดหรือไม่)
+    """
+    if estimate_tokens(content) <= token_budget:
+        return content, False
+
+    text = _SPACES.sub(" ", content.strip())
+    text = _BLANK_LINES.sub("\n", text)
+    seen = set()
+    lines = []
+    for line in text.split("\n"):
+        key = line.strip()
+        if key and key in seen:
+            continue
+        seen.add(key)
+        lines.append(line)
+    text = "\n".join(lines)
+
+    if estimate_tokens(text) <= token_budget:
+        return text, True
+
+    # สัดส่วนตัวอักษรต่อ Token ของข้อความนี้ ใช้แปลงงบ Token เป็นจำนวนตัวอักษร
+    chars_per_token = len(text) / max(estimate_tokens(text), 1)
+    char_budget = max(int(token_budget * chars_per_token) - len(TRUNCATION_MARKER), 0)
+    head = int(char_budget * 0.7)
+    tail = char_budget - head
+    return text[:head] + TRUNCATION_MARKER + (text[-tail:] if tail else ""), True
+
+
+@dataclass
+class BuiltPrompt:
+    text: str
+    prompt_tokens: int      # Token ที่ประเมินไว้ของ Prompt ทั้งก้อน
+    content_tokens: int     # Token ของงานนักเรียน (หลังย่อแล้ว)
+    truncated: bool
+
+
+class PromptBuilder:
+    """
+    สร้าง Prompt ตรวจงานจากส่วนคงที่ที่ Compile ไว้ล่วงหน้าต่อ Step
+    พร้อมจำกัดความยาวงานนักเรียนตามงบ Token และเก็บสถิติการใช้ Token
+    """
+
+    def __init__(self, content_token_budget: int = 2000):
+        self.content_token_budget = content_token_budget
+
+        self._single_prefix: Dict[int, str] = {}
+        self._batch_prefix: Dict[int, str] = {}
+        self._prefix_tokens: Dict[int, int] = {}
+        self._batch_prefix_tokens: Dict[int, int] = {}
+        for step_number in list(RUBRICS.keys()) + [0]:
+            self._compile(step_number)
+
+        self._lock = threading.Lock()
+        self.prompts_built = 0
+        self.truncated = 0
+        self.estimated_tokens_total = 0
+        self.actual_tokens_total = 0
+        self.actual_samples = 0
+        self.max_prompt_tokens = 0
+
+    def _compile(self, step_number: int):
+        rubric = RUBRICS.get(step_number, DEFAULT_RUBRIC)
+        names = {f"r{i}": rubric[i] for i in range(4)}
+        result_format = _RESULT_FORMAT.format(**names)
+
+        single = _SINGLE_TEMPLATE.format(step_number=step_number, result_format=result_format, **names)
+        batch = _BATCH_TEMPLATE.format(step_number=step_number, result_format=result_format, **names)
+        self._single_prefix[step_number] = single
+        self._batch_prefix[step_number] = batch
+        self._prefix_tokens[step_number] = estimate_tokens(single)
+        self._batch_prefix_tokens[step_number] = estimate_tokens(batch)
+
+    def _key(self, step_number: int) -> int:
+        return step_number if step_number in self._single_prefix else 0
+
+    def _record(self, built: BuiltPrompt):
+        with self._lock:
+            self.prompts_built += 1
+            self.truncated += int(built.truncated)
+            self.estimated_tokens_total += built.prompt_tokens
+            self.max_prompt_tokens = max(self.max_prompt_tokens, built.prompt_tokens)
+
+    def record_actual(self, prompt_token_count: int):
+        """บันทึกจำนวน Token จริงจาก usage_metadata เพื่อเทียบกับค่าที่ประเมินไว้"""
+        with self._lock:
+            self.actual_tokens_total += prompt_token_count
+            self.actual_samples += 1
+
+    def build(self, step_number: int, content: str, feedback_first: bool = False) -> BuiltPrompt:
+        key = self._key(step_number)
+        body, truncated = condense_content(content, self.content_token_budget)
+        content_tokens = estimate_tokens(body)
+
+        text = f'{self._single_prefix[key]}\n\nStudent Input: "{body}"'
+        if feedback_first:
+            # โหมด Streaming: ให้ AI เขียน feedback_th ก่อน เพื่อส่งข้อความถึงนักเรียนได้เร็วที่สุด
+            text += '\n\nWrite the "feedback_th" field FIRST in the JSON object, before all other fields.'
+        built = BuiltPrompt(text, self._prefix_tokens[key] + content_tokens + 8, content_tokens, truncated)
+        self._record(built)
+        return built
+
+    def build_batch(self, step_number: int, contents: List[str]) -> BuiltPrompt:
+        key = self._key(step_number)
+        bodies = []
+        any_truncated = False
+        for content in contents:
+            body, truncated = condense_content(content, self.content_token_budget)
+            any_truncated = any_truncated or truncated
+            bodies.append(body)
+
+        submissions = "\n".join(f'Submission #{i}: "{body}"' for i, body in enumerate(bodies, start=1))
+        content_tokens = estimate_tokens(submissions)
+        text = f"{self._batch_prefix[key]}\n\nReturn exactly {len(bodies)} objects.\n\n{submissions}"
+        built = BuiltPrompt(text, self._batch_prefix_tokens[key] + content_tokens + 12, content_tokens, any_truncated)
+        self._record(built)
+        return built
+
+    def stats(self) -> dict:
+        return {
+            "content_token_budget": self.content_token_budget,
+            "prompts_built": self.prompts_built,
+            "truncated": self.truncated,
+            "avg_estimated_tokens": round(self.estimated_tokens_total / self.prompts_built, 1) if self.prompts_built else 0.0,
+            "max_estimated_tokens": self.max_prompt_tokens,
+            "avg_actual_prompt_tokens": round(self.actual_tokens_total / self.actual_samples, 1) if self.actual_samples else 0.0,
+        }
@@ -0,0 +1,155 @@
+# backend/app/services/rate_limiter.py
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Tuple, Type
+
+
+class TokenBucket:
+    """Token Bucket แบบเติมต่อเนื่อง กำหนดอัตราเป็น "ต่อนาที" ให้ตรงกับโควตาของ API"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.refill_per_second = float(per_minute) / 60.0
+        self._updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated_at) * self.refill_per_second)
+        self._updated_at = now
+
+    def time_until(self, amount: float) -> float:
+        """วินาทีที่ต้องรอจนกว่าจะมี Token พอ (0 = ใช้ได้ทันที)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_second
+
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta: float):
+        """ปรับยอดหลังรู้จำนวน Token จริง (delta > 0 = ใช้เกินที่ประเมินไว้)"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class AdaptiveLimiter:
+    """
+    ตัวจำกัดการเรียก Gemini แบบปรับตัวเอง (AIMD) แทน Semaphore ค่าคงที่
+    - สำเร็จ: เพิ่ม limit ทีละน้อย (Additive Increase, ประมาณ +1 ต่อรอบของ limit)
+    - โดน 429 / ResourceExhausted: ลด limit ลงครึ่งหนึ่ง (Multiplicative Decrease)
+    - มี Token Bucket สำหรับ Requests/นาที และ Tokens/นาที ตาม Tier ของ API
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 20,
+        min_limit: int = 1,
+        max_limit: int = 50,
+        rpm: float = 1000,
+        tpm: float = 1_000_000,
+        decrease_factor: float = 0.5,
+        decrease_cooldown_seconds: float = 2.0,
+        throttle_exceptions: Tuple[Type[BaseException], ...] = (),
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown_seconds = decrease_cooldown_seconds
+        self.throttle_exceptions = throttle_exceptions
+
+        self._limit = float(initial_limit)
+        self._in_use = 0
+        self._waiting = 0
+        self._last_decrease = 0.0
+        self._cond = asyncio.Condition()
+
+        self.rpm_bucket = TokenBucket(rpm)
+        self.tpm_bucket = TokenBucket(tpm)
+
+        self.acquired = 0
+        self.throttled = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self._limit))
+
+    async def acquire(self, tokens: int = 0) -> float:
+        started = time.monotonic()
+        self._waiting += 1
+        try:
+            async with self._cond:
+                while True:
+                    if self._in_use < self.limit:
+                        delay = max(self.rpm_bucket.time_until(1), self.tpm_bucket.time_until(tokens))
+                        if delay <= 0:
+                            self.rpm_bucket.consume(1)
+                            self.tpm_bucket.consume(tokens)
+                            self._in_use += 1
+                            break
+                        # โควตาต่อนาทีเต็ม รอจน Bucket เติม (หรือมีคนปล่อยช่องแล้วปลุก)
+                        try:
+                            await asyncio.wait_for(self._cond.wait(), timeout=delay)
+                        except asyncio.TimeoutError:
+                            pass
+                    else:
+                        await self._cond.wait()
+        finally:
+            self._waiting -= 1
+
+        waited = time.monotonic() - started
+        self.acquired += 1
+        self.total_wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        return waited
+
+    async def release(self, throttled: bool = False, success: bool = True):
+        async with self._cond:
+            self._in_use -= 1
+            if throttled:
+                self.throttled += 1
+                now = time.monotonic()
+                # 429 หลายตัวในช่วงเดียวกันนับเป็นสัญญาณเดียว ไม่ลดซ้ำจนเหลือ min ทันที
+                if now - self._last_decrease >= self.decrease_cooldown_seconds:
+                    self._limit = max(float(self.min_limit), self._limit * self.decrease_factor)
+                    self._last_decrease = now
+            elif success:
+                self._limit = min(float(self.max_limit), self._limit + 1.0 / max(self._limit, 1.0))
+            self._cond.notify_all()
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int):
+        """แก้ยอด TPM ด้วยจำนวน Token จริงจาก usage_metadata ของคำตอบ"""
+        self.tpm_bucket.adjust(actual_tokens - estimated_tokens)
+
+    @asynccontextmanager
+    async def slot(self, tokens: int = 0):
+        await self.acquire(tokens)
+        try:
+            yield self
+        except self.throttle_exceptions:
+            await self.release(throttled=True)
+            raise
+        except BaseException:
+            await self.release(success=False)
+            raise
+        else:
+            await self.release(success=True)
+
+    def stats(self) -> dict:
+        return {
+            "current_limit": self.limit,
+            "in_use": self._in_use,
+            "queue_depth": self._waiting,
+            "acquired": self.acquired,
+            "throttled": self.throttled,
+            "avg_wait_seconds": round(self.total_wait_seconds / self.acquired, 4) if self.acquired else 0.0,
+            "max_wait_seconds": round(self.max_wait_seconds, 4),
+            "rpm_available": int(self.rpm_bucket.tokens),
+            "tpm_available": int(self.tpm_bucket.tokens),
+        }
@@ -0,0 +1,103 @@
+# backend/app/services/result_cache.py
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+class ResultCache:
+    """
+    LRU Cache สำหรับผลตรวจจาก AI จำกัดด้วย 3 เงื่อนไข:
+    - จำนวนรายการสูงสุด (max_entries)
+    - ขนาดรวมเป็น byte (max_bytes) วัดจาก JSON ที่ serialize แล้ว
+    - อายุของข้อมูล (ttl_seconds) เกินแล้วถือว่าหมดอายุ
+    """
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 8 * 1024 * 1024, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        # key -> (expires_at, size_bytes, value)
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._total_bytes = 0
+        # ทุก operation สั้นและไม่มี await จึงใช้ threading.Lock ได้ (ปลอดภัยทั้ง thread และ event loop)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _sizeof(value: Any) -> int:
+        return len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+
+    def _drop(self, key: str):
+        _, size, _ = self._data.pop(key)
+        self._total_bytes -= size
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, _, value = entry
+            if expires_at <= time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any):
+        size = self._sizeof(value)
+        # รายการเดียวใหญ่กว่าทั้ง Cache ก็ไม่ต้องเก็บ
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+
+            self._data[key] = (time.monotonic() + self.ttl_seconds, size, value)
+            self._total_bytes += size
+
+            while self._data and (len(self._data) > self.max_entries or self._total_bytes > self.max_bytes):
+                oldest_key = next(iter(self._data))
+                self._drop(oldest_key)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._total_bytes = 0
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[0] > time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self._total_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
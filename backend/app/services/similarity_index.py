@@ -0,0 +1,263 @@
+# backend/app/services/similarity_index.py
+import asyncio
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.core.config import AI_SIMILARITY_THRESHOLD, AI_SIMILARITY_MAX_ENTRIES, AI_SIMILARITY_SYNC_SECONDS
+from app.database import SessionLocal
+from app.models.edp import EdpStep, Project, User
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WHITESPACE = re.compile(r"\s+")
+
+
+class MinHasher:
+    """MinHash Signature จาก Shingle ระดับตัวอักษร (เหมาะกับภาษาไทยที่ไม่มีการเว้นวรรคระหว่างคำ)"""
+
+    def __init__(self, num_perm: int = 32, shingle_size: int = 5, seed: int = 2026):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = random.Random(seed)
+        self._perms = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+
+    def shingles(self, text: str) -> Set[int]:
+        compact = _WHITESPACE.sub("", (text or "").lower())
+        k = self.shingle_size
+        if len(compact) <= k:
+            return {hash(compact) & _MAX_HASH} if compact else set()
+        return {hash(compact[i:i + k]) & _MAX_HASH for i in range(len(compact) - k + 1)}
+
+    def signature(self, text: str) -> Optional[Tuple[int, ...]]:
+        shingles = self.shingles(text)
+        if not shingles:
+            return None
+        return tuple(
+            min(((a * s + b) % _MERSENNE_PRIME) & _MAX_HASH for s in shingles)
+            for a, b in self._perms
+        )
+
+
+def estimate_similarity(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+class SimilarityIndex:
+    """
+    ดัชนีหางานที่คล้ายกันข้ามนักเรียน (MinHash + LSH) แยกตาม (ห้องเรียน, ขั้นตอน)
+    - เพิ่มงานทีละชิ้นตอน Submit (Incremental) ค้นหาด้วยการเปิด Bucket ไม่กี่ช่อง (O(1) ต่องาน)
+    - ไม่นับงานของเจ้าของเดียวกัน (การส่งแก้ไขของตัวเองไม่ใช่การลอก)
+    - จำกัดจำนวนรายการสูงสุด ลบงานเก่าสุดออกก่อน
+    - ดัชนีอยู่ในหน่วยความจำของแต่ละ Worker จึงดึงงานใหม่จาก Worker อื่น (id > last_seen_id) ทุก sync_seconds
+    """
+
+    # ย้อนดู id ก่อนหน้าเล็กน้อยทุกรอบ เผื่อแถวที่ได้ id ก่อนแต่ Commit ทีหลัง
+    SYNC_LOOKBACK_IDS = 200
+    SYNC_BATCH_SIZE = 2000
+
+    def __init__(self, num_perm: int = 32, bands: int = 8, threshold: float = 0.8, max_entries: int = 50000,
+                 sync_seconds: float = 30.0, session_factory=SessionLocal):
+        assert num_perm % bands == 0
+        self.hasher = MinHasher(num_perm=num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.max_entries = max_entries
+
+        # step_id -> (group, signature, owner_id, band_keys)
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        # (group, band_index, band_hash) -> {step_id, ...}
+        self._buckets: Dict[tuple, Set[int]] = {}
+        self._lock = threading.Lock()
+        self._session_factory = session_factory
+        self.sync_seconds = sync_seconds
+        self._task: Optional[asyncio.Task] = None
+
+        self.ready = False
+        self.last_seen_id = 0
+        self.queries = 0
+        self.matches_found = 0
+        self.rebuild_seconds = 0.0
+        self.synced_rows = 0
+
+    @staticmethod
+    def _group(class_room: Optional[str], step_number: int) -> tuple:
+        return (class_room or "", step_number)
+
+    def _band_keys(self, group: tuple, signature: Tuple[int, ...]) -> List[tuple]:
+        return [
+            (group, band, hash(signature[band * self.rows:(band + 1) * self.rows]))
+            for band in range(self.bands)
+        ]
+
+    def _remove(self, step_id: int):
+        _, _, _, band_keys = self._entries.pop(step_id)
+        for key in band_keys:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(step_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def add(self, step_id: int, class_room: Optional[str], step_number: int, owner_id: int,
+            content: str = None, signature: Tuple[int, ...] = None):
+        signature = signature or self.hasher.signature(content)
+        if signature is None:
+            return
+        group = self._group(class_room, step_number)
+        band_keys = self._band_keys(group, signature)
+
+        with self._lock:
+            if step_id in self._entries:
+                self._remove(step_id)
+            self._entries[step_id] = (group, signature, owner_id, band_keys)
+            for key in band_keys:
+                self._buckets.setdefault(key, set()).add(step_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def query(self, class_room: Optional[str], step_number: int, exclude_owner_id: int,
+              content: str = None, signature: Tuple[int, ...] = None, limit: int = 3) -> List[dict]:
+        """คืนงานที่คล้ายที่สุด (ความคล้าย >= threshold) เรียงจากมากไปน้อย"""
+        signature = signature or self.hasher.signature(content)
+        if signature is None:
+            return []
+        group = self._group(class_room, step_number)
+
+        with self._lock:
+            candidates: Set[int] = set()
+            for key in self._band_keys(group, signature):
+                candidates |= self._buckets.get(key, set())
+
+            matches = []
+            for step_id in candidates:
+                _, other_sig, owner_id, _ = self._entries[step_id]
+                if owner_id == exclude_owner_id:
+                    continue
+                similarity = estimate_similarity(signature, other_sig)
+                if similarity >= self.threshold:
+                    matches.append({"step_id": step_id, "owner_id": owner_id, "similarity": round(similarity, 3)})
+
+            self.queries += 1
+            if matches:
+                self.matches_found += 1
+
+        matches.sort(key=lambda m: (-m["similarity"], -m["step_id"]))
+        return matches[:limit]
+
+    def _step_rows(self, db):
+        return db.query(
+            EdpStep.id, EdpStep.step_number, EdpStep.content, Project.owner_id, User.class_room
+        ).join(Project, EdpStep.project_id == Project.id)\
+         .join(User, Project.owner_id == User.id)
+
+    def rebuild_from_db(self, limit: int = 20000, time_budget_seconds: float = 20.0, session_factory=None):
+        """สร้างดัชนีใหม่จากตาราง edp_steps (งานล่าสุดก่อน) หยุดเมื่อครบจำนวนหรือหมดเวลาที่กำหนด"""
+        started = time.monotonic()
+        loaded = 0
+        db = (session_factory or self._session_factory)()
+        try:
+            rows = self._step_rows(db)\
+             .order_by(EdpStep.id.desc())\
+             .limit(limit)\
+             .yield_per(1000)
+
+            for step_id, step_number, content, owner_id, class_room in rows:
+                self.add(step_id, class_room, step_number, owner_id, content=content)
+                self.last_seen_id = max(self.last_seen_id, step_id)
+                loaded += 1
+                if time.monotonic() - started > time_budget_seconds:
+                    print(f"⏱️  Similarity index rebuild stopped at time budget ({loaded} rows)")
+                    break
+        finally:
+            db.close()
+
+        self.ready = True
+        self.rebuild_seconds = round(time.monotonic() - started, 3)
+        print(f"🔎 Similarity index ready: {loaded} submissions in {self.rebuild_seconds}s")
+        return loaded
+
+    def sync_from_db(self) -> int:
+        """ดึงงานที่ Worker อื่นบันทึกไว้หลังรอบก่อน (id > last_seen_id) เข้าดัชนีของ Worker นี้"""
+        loaded = 0
+        db = self._session_factory()
+        try:
+            while True:
+                rows = self._step_rows(db)\
+                    .filter(EdpStep.id > self.last_seen_id - self.SYNC_LOOKBACK_IDS)\
+                    .order_by(EdpStep.id.asc())\
+                    .limit(self.SYNC_BATCH_SIZE + self.SYNC_LOOKBACK_IDS)\
+                    .all()
+
+                advanced = False
+                for step_id, step_number, content, owner_id, class_room in rows:
+                    if step_id > self.last_seen_id:
+                        self.last_seen_id = step_id
+                        advanced = True
+                    if step_id in self._entries:
+                        continue
+                    self.add(step_id, class_room, step_number, owner_id, content=content)
+                    loaded += 1
+                if not advanced or len(rows) < self.SYNC_BATCH_SIZE + self.SYNC_LOOKBACK_IDS:
+                    break
+        finally:
+            db.close()
+
+        self.synced_rows += loaded
+        return loaded
+
+    # ---------------------------------------------------------
+    # Lifecycle
+    # ---------------------------------------------------------
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.sync_seconds)
+            if not self.ready:
+                continue
+            try:
+                await asyncio.to_thread(self.sync_from_db)
+            except Exception as e:
+                print(f"Similarity index sync error: {e}")
+
+    def start(self):
+        if self._task is None and self.sync_seconds > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "entries": len(self._entries),
+            "buckets": len(self._buckets),
+            "threshold": self.threshold,
+            "queries": self.queries,
+            "queries_with_matches": self.matches_found,
+            "rebuild_seconds": self.rebuild_seconds,
+            "last_seen_id": self.last_seen_id,
+            "synced_rows": self.synced_rows,
+        }
+
+
+_index_instance: Optional[SimilarityIndex] = None
+
+def get_similarity_index() -> SimilarityIndex:
+    global _index_instance
+    if _index_instance is None:
+        _index_instance = SimilarityIndex(
+            threshold=AI_SIMILARITY_THRESHOLD,
+            max_entries=AI_SIMILARITY_MAX_ENTRIES,
+            sync_seconds=AI_SIMILARITY_SYNC_SECONDS,
+        )
+    return _index_instance
@@ -0,0 +1,201 @@
+# backend/app/services/structured_output.py
+import json
+import re
+import threading
+from typing import Any, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from app.schemas.edp import AiEvaluation
+
+_FENCE = re.compile(r"```(?:json)?\s*", re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+
+def evaluation_schema(with_id: bool = False) -> dict:
+    """
+    Response Schema (OpenAPI subset ที่ Gemini รองรับ) สร้างตามรูปแบบ AiEvaluation / ScoreItem
+    Gemini ไม่รองรับ $ref จึงต้องเขียนแบบ inline
+    ลำดับ Property ใน Schema ไม่มีผลกับลำดับที่ Gemini เขียน (SDK ไม่มีฟิลด์กำหนดลำดับ) ถ้าต้องการลำดับให้กำหนดใน Prompt
+    """
+    score_item = {
+        "type": "object",
+        "properties": {
+            "criteria": {"type": "string"},
+            "score": {"type": "integer"},
+            "max_score": {"type": "integer"},
+            "comment": {"type": "string"},
+        },
+        "required": ["criteria", "score", "max_score", "comment"],
+    }
+    properties = {
+        "relevance_score": {"type": "integer"},
+        "creativity_score": {"type": "integer"},
+        "score_breakdown": {"type": "array", "items": score_item},
+        "feedback_th": {"type": "string"},
+        "critical_thinking": {"type": "string", "format": "enum", "enum": ["Low", "Medium", "High"]},
+        "sentiment": {"type": "string", "format": "enum", "enum": ["Neutral", "Confident", "Confused"]},
+        "competency_level": {"type": "string", "format": "enum", "enum": ["Novice", "Apprentice", "Proficient", "Distinguished"]},
+        "warning_flags": {"type": "array", "items": {"type": "string"}},
+        "suggested_action": {"type": "string"},
+    }
+    if with_id:
+        properties = {"id": {"type": "integer"}, **properties}
+
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties.keys()),
+    }
+
+
+def batch_evaluation_schema() -> dict:
+    return {"type": "array", "items": evaluation_schema(with_id=True)}
+
+
+def _extract_json_region(text: str, opener: str) -> Optional[str]:
+    start = text.find(opener)
+    return text[start:] if start != -1 else None
+
+
+def repair_json(text: str) -> str:
+    """
+    ซ่อม JSON ที่พังแบบที่เจอบ่อยจาก LLM
+    - ตัดข้อความที่ตามหลัง JSON ก้อนแรกทิ้ง
+    - ลบ Comma เกินก่อน } หรือ ]
+    - ปิด String / Array / Object ที่ถูกตัดกลางคัน (คำตอบโดนตัดเพราะ Token หมด)
+    """
+    stack = []
+    in_string = False
+    escaped = False
+    end = len(text)
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                end = i + 1
+                break
+
+    repaired = text[:end]
+    if stack:
+        if in_string:
+            if escaped:
+                repaired = repaired[:-1]
+            repaired += '"'
+        # ตัดส่วนที่ค้างครึ่ง ๆ (เช่น "key": หรือ , ท้ายสุด) ก่อนปิดวงเล็บ
+        repaired = re.sub(r'(,\s*"[^"]*"\s*:?\s*|,\s*|:\s*)$', "", repaired.rstrip())
+        repaired += "".join(reversed(stack))
+
+    return _TRAILING_COMMA.sub(r"\1", repaired)
+
+
+class ResponseParser:
+    """แปลงคำตอบของ AI เป็นผลตรวจที่ผ่าน Validation (AiEvaluation) พร้อมนับสถิติการซ่อม/ล้มเหลว"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.parsed = 0
+        self.repaired = 0
+        self.failed = 0
+
+    def _count(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def _load(self, text: str, opener: str) -> Tuple[Any, bool]:
+        """คืน (ข้อมูล JSON, ต้องซ่อมหรือไม่)"""
+        clean_text = _FENCE.sub("", text or "").strip()
+        try:
+            data = json.loads(clean_text, strict=False)
+            self._count("parsed")
+            return data, False
+        except ValueError:
+            pass
+
+        region = _extract_json_region(clean_text, opener)
+        if region is None:
+            self._count("failed")
+            raise ValueError("AI ตอบกลับผิดรูปแบบ ไม่สามารถแปลงเป็น JSON ได้")
+        try:
+            data = json.loads(repair_json(region), strict=False)
+        except ValueError:
+            self._count("failed")
+            raise ValueError("AI ตอบกลับผิดรูปแบบ ไม่สามารถแปลงเป็น JSON ได้")
+        self._count("repaired")
+        return data, True
+
+    @staticmethod
+    def validate(data: dict) -> dict:
+        """Validate เป็น AiEvaluation แล้วบังคับช่วงคะแนนและคำนวณคะแนนรวมใหม่"""
+        evaluation = AiEvaluation.model_validate(data)
+        for item in evaluation.score_breakdown:
+            item.max_score = item.max_score or 25
+            item.score = max(0, min(item.score, item.max_score))
+        if evaluation.score_breakdown:
+            evaluation.relevance_score = sum(item.score for item in evaluation.score_breakdown)
+        evaluation.creativity_score = max(0, min(evaluation.creativity_score, 100))
+        return evaluation.model_dump(exclude_none=True)
+
+    def parse(self, text: str) -> dict:
+        return self.parse_with_status(text)[0]
+
+    def parse_with_status(self, text: str) -> Tuple[dict, bool]:
+        """เหมือน parse แต่คืนด้วยว่าคำตอบต้องซ่อมก่อนใช้ (ใช้ประเมินความน่าเชื่อถือของโมเดลเล็ก)"""
+        data, repaired = self._load(text, "{")
+        if isinstance(data, list) and data and isinstance(data[0], dict):
+            data = data[0]
+        if not isinstance(data, dict):
+            self._count("failed")
+            raise ValueError("AI ตอบกลับผิดรูปแบบ ไม่ใช่ JSON Object")
+        try:
+            return self.validate(data), repaired
+        except ValidationError as e:
+            self._count("failed")
+            raise ValueError(f"ผลตรวจจาก AI ไม่ตรงตาม Schema: {e.error_count()} errors")
+
+    def parse_batch(self, text: str, expected: int) -> List[Optional[dict]]:
+        """คืน List ตามลำดับงาน รายการที่หาย/ไม่ผ่าน Validation จะเป็น None"""
+        data, _ = self._load(text, "[")
+        if isinstance(data, dict):
+            data = [data]
+        if not isinstance(data, list):
+            self._count("failed")
+            raise ValueError("AI ตอบกลับ Batch ผิดรูปแบบ ไม่พบ JSON Array")
+
+        results: List[Optional[dict]] = [None] * expected
+        for position, item in enumerate(data):
+            if not isinstance(item, dict) or "score_breakdown" not in item:
+                continue
+            index = item.pop("id", position + 1)
+            try:
+                index = int(index) - 1
+            except (TypeError, ValueError):
+                continue
+            if 0 <= index < expected and results[index] is None:
+                try:
+                    results[index] = self.validate(item)
+                except ValidationError:
+                    self._count("failed")
+        return results
+
+    def stats(self) -> dict:
+        total = self.parsed + self.repaired + self.failed
+        return {
+            "parsed": self.parsed,
+            "repaired": self.repaired,
+            "failed": self.failed,
+            "failure_rate": round(self.failed / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,61 @@
+# backend/bench_api.py
+# วัด Throughput ของ Endpoint ที่ต้อง Login (ผ่าน get_current_user) เพื่อเทียบ DB_MODE=sync กับ DB_MODE=async ภายใต้โหลดเดียวกัน
+#   DB_MODE=sync  python bench_api.py --token <JWT> --concurrency 50 --requests 2000
+#   DB_MODE=async python bench_api.py --token <JWT> --concurrency 50 --requests 2000
+# ระบุ --base-url เพื่อยิงไปที่ Server ที่รันอยู่ (เช่น uvicorn --workers 4) ถ้าไม่ระบุจะรัน App ใน Process นี้ (ต้องมี httpx)
+import argparse
+import asyncio
+import time
+
+import httpx
+
+parser = argparse.ArgumentParser(description="Load test endpoint ที่ต้อง Login")
+parser.add_argument("--token", required=True, help="JWT ของผู้ใช้ที่มีอยู่จริง (จาก /auth/login)")
+parser.add_argument("--paths", default="/auth/me,/edp/projects", help="Endpoint ที่ยิงสลับกัน คั่นด้วย ,")
+parser.add_argument("--requests", type=int, default=1000)
+parser.add_argument("--concurrency", type=int, default=50)
+parser.add_argument("--base-url", default=None)
+args = parser.parse_args()
+
+
+async def main():
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=60)
+        mode = args.base_url
+    else:
+        from app.database import DB_MODE
+        from app.main import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+        mode = f"in-process, DB_MODE={DB_MODE}"
+
+    paths = [p.strip() for p in args.paths.split(",") if p.strip()]
+    headers = {"Authorization": f"Bearer {args.token}"}
+    latencies = []
+    errors = 0
+    counter = iter(range(args.requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                response = await client.get(paths[i % len(paths)], headers=headers)
+                if response.status_code != 200:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    async with client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    pct = lambda p: latencies[min(int(len(latencies) * p), len(latencies) - 1)]
+    print(f"✅ {args.requests} requests ({mode}) in {elapsed:.2f}s = {args.requests / elapsed:.1f} req/s, errors={errors}")
+    print(f"   p50={pct(0.5) * 1000:.1f}ms  p95={pct(0.95) * 1000:.1f}ms  p99={pct(0.99) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
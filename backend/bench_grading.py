@@ -0,0 +1,54 @@
+# backend/bench_grading.py
+# Load Test เส้นทางการตรวจงาน (Cache / Single-flight / Batching / Limiter / Retry) แบบไม่ใช้โควตาจริง
+#   python bench_grading.py --requests 300 --unique 120 --backend fake --rate-429 0.05
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+parser = argparse.ArgumentParser(description="Offline benchmark ของ GeminiService.analyze_step")
+parser.add_argument("--requests", type=int, default=200, help="จำนวนงานที่ส่งทั้งหมด")
+parser.add_argument("--unique", type=int, default=100, help="จำนวนเนื้อหาที่ไม่ซ้ำกัน (ที่เหลือเป็นงานซ้ำ)")
+parser.add_argument("--backend", default="fake", choices=["fake", "replay"], help="Backend ที่ใช้ทดสอบ")
+parser.add_argument("--latency-ms", type=float, default=1500)
+parser.add_argument("--rate-429", type=float, default=0.0)
+args = parser.parse_args()
+
+# ต้องตั้ง Env ก่อน import Service เพราะ Config ถูกอ่านตอน import
+os.environ["AI_LLM_BACKEND"] = args.backend
+os.environ["AI_FAKE_LATENCY_MS"] = str(args.latency_ms)
+os.environ["AI_FAKE_429_RATE"] = str(args.rate_429)
+os.environ.setdefault("AI_L2_CACHE_ENABLED", "false")
+os.environ.setdefault("AI_GLOBAL_LIMITER", "memory")
+
+from app.services.gemini_service import get_gemini_service  # noqa: E402
+
+SAMPLE = "นักเรียนออกแบบถังขยะแยกประเภทอัตโนมัติสำหรับโรงอาหาร โดยใช้เซนเซอร์ตรวจจับวัสดุ ครั้งที่ {n}"
+
+
+async def main():
+    service = get_gemini_service()
+    contents = [SAMPLE.format(n=i) for i in range(args.unique)]
+    jobs = [(random.randint(1, 6), random.choice(contents)) for _ in range(args.requests)]
+    latencies = []
+
+    async def submit(step_number, content):
+        started = time.perf_counter()
+        await service.analyze_step(step_number, content)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(submit(s, c) for s, c in jobs))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    pct = lambda p: latencies[min(int(len(latencies) * p), len(latencies) - 1)]
+    print(f"✅ {args.requests} requests in {elapsed:.2f}s ({args.requests / elapsed:.1f} req/s)")
+    print(f"   p50={pct(0.5):.3f}s  p95={pct(0.95):.3f}s  p99={pct(0.99):.3f}s  max={latencies[-1]:.3f}s")
+    print(json.dumps(service.get_stats(), ensure_ascii=False, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
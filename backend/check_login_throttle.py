@@ -0,0 +1,85 @@
+# backend/check_login_throttle.py
+# ตรวจว่าเพดาน Login ผิดต่อ IP หลบไม่ได้ด้วยการปลอม X-Forwarded-For
+#   python check_login_throttle.py --hops 1 --max-per-ip 5
+# จำลอง Proxy 1 ชั้นที่ต่อท้าย IP จริงของผู้ใช้ ส่วนรายการซ้ายสุดผู้ใช้สุ่มเปลี่ยนทุกครั้ง
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+parser = argparse.ArgumentParser(description="Spoofed X-Forwarded-For check ของ Login Throttle")
+parser.add_argument("--hops", type=int, default=1, help="จำนวน Proxy ที่เชื่อถือ (TRUSTED_PROXY_HOPS)")
+parser.add_argument("--max-per-ip", type=int, default=5)
+args = parser.parse_args()
+
+# ต้องตั้ง Env ก่อน import app เพราะ Config ถูกอ่านตอน import
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'throttle_check.db')}"
+# Key ใช้ทิ้งสำหรับการตรวจนี้เท่านั้น (Config บังคับให้มี SECRET_KEY ตอน import)
+os.environ.setdefault("SECRET_KEY", "throttle-check-throwaway-key")
+os.environ["TRUSTED_PROXY_HOPS"] = str(args.hops)
+os.environ["LOGIN_THROTTLE_BACKEND"] = "memory"
+os.environ["LOGIN_MAX_FAILURES_PER_IP"] = str(args.max_per_ip)
+os.environ["LOGIN_MAX_FAILURES_PER_ACCOUNT"] = str(args.max_per_ip * 100)
+os.environ["AI_SIMILARITY_ENABLED"] = "false"
+
+import httpx  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+
+from app.main import app  # noqa: E402
+from app.services.login_throttle import client_ip  # noqa: E402
+
+REAL_IP = "203.0.113.7"
+PROXY_IP = "10.0.0.2"
+
+
+def forwarded_for(spoofed: str) -> str:
+    # ผู้ใช้ส่ง X-Forwarded-For มาเอง แล้ว Proxy แต่ละชั้นต่อท้ายด้วย IP ที่ตัวเองเห็น
+    hops = [REAL_IP] + [f"10.0.1.{i}" for i in range(1, args.hops)]
+    return ", ".join([spoofed] + hops)
+
+
+def key_check() -> int:
+    keys = set()
+    for i in range(50):
+        scope = {
+            "type": "http", "method": "POST", "path": "/auth/login",
+            "headers": [(b"x-forwarded-for", forwarded_for(f"198.51.100.{i}").encode())],
+            "client": (PROXY_IP, 443),
+        }
+        keys.add(client_ip(Request(scope), args.hops))
+    print(f"Throttle keys for 50 spoofed X-Forwarded-For values: {sorted(keys)}")
+    if keys != {REAL_IP}:
+        print("❌ FAIL: spoofed X-Forwarded-For changed the throttle key")
+        return 1
+    return 0
+
+
+async def login_check() -> int:
+    transport = httpx.ASGITransport(app=app, client=(PROXY_IP, 443))
+    async with httpx.AsyncClient(transport=transport, base_url="http://check") as client:
+        statuses = []
+        for i in range(args.max_per_ip + 1):
+            response = await client.post(
+                "/auth/login",
+                data={"username": f"nobody-{i}@example.com", "password": "wrong"},
+                headers={"X-Forwarded-For": forwarded_for(f"198.51.100.{i}")},
+            )
+            statuses.append(response.status_code)
+    print(f"Login statuses with a new spoofed IP each attempt: {statuses}")
+    if statuses[-1] != 429:
+        print(f"❌ FAIL: attempt {args.max_per_ip + 1} was not throttled")
+        return 1
+    return 0
+
+
+def main() -> int:
+    failures = key_check() + asyncio.run(login_check())
+    if failures:
+        return 1
+    print("✅ PASS: the per-IP limit follows the proxy-appended address, not the client-supplied one")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+# backend/check_pool_starvation.py
+# ตรวจว่า /edp/submit ไม่ยืม DB Connection ค้างระหว่างรอ AI (Pool ไม่หมดเมื่อส่งงานพร้อมกันเกินขนาด Pool)
+#   python check_pool_starvation.py --submissions 30 --pool-size 3 --latency-ms 2000
+# ใช้ Fake Backend (ไม่เสียโควตา) + httpx (pip install httpx)
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+parser = argparse.ArgumentParser(description="Connection pool starvation check ของเส้นทางส่งงาน")
+parser.add_argument("--submissions", type=int, default=30, help="จำนวนงานที่ส่งพร้อมกัน (ควรมากกว่า pool-size หลายเท่า)")
+parser.add_argument("--pool-size", type=int, default=3)
+parser.add_argument("--pool-timeout", type=float, default=3.0)
+parser.add_argument("--latency-ms", type=float, default=2000, help="เวลาตอบของ Fake AI")
+parser.add_argument("--probes", type=int, default=20, help="จำนวน Request /auth/me ที่ยิงแทรกระหว่างรอ AI")
+parser.add_argument("--database-url", default=None, help="ค่าเริ่มต้น: SQLite ชั่วคราว")
+args = parser.parse_args()
+
+# ต้องตั้ง Env ก่อน import app เพราะ Config ถูกอ่านตอน import
+db_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'pool_check.db')}"
+os.environ["DATABASE_URL"] = db_url
+# Key ใช้ทิ้งสำหรับการตรวจนี้เท่านั้น (Config บังคับให้มี SECRET_KEY ตอน import)
+os.environ.setdefault("SECRET_KEY", "pool-check-throwaway-key")
+os.environ["AI_LLM_BACKEND"] = "fake"
+os.environ["AI_FAKE_LATENCY_MS"] = str(args.latency_ms)
+os.environ["AI_FAKE_LATENCY_SIGMA"] = "0.1"
+os.environ["AI_FAKE_429_RATE"] = "0"
+os.environ["AI_GRADING_MODE"] = "sync"
+os.environ["AI_L2_CACHE_ENABLED"] = "false"
+os.environ["AI_GLOBAL_LIMITER"] = "memory"
+os.environ["AI_BATCH_ENABLED"] = "false"
+os.environ["AI_SIMILARITY_ENABLED"] = "false"
+os.environ["AI_CONCURRENCY_INITIAL"] = str(args.submissions)
+os.environ["AI_CONCURRENCY_MAX"] = str(args.submissions)
+os.environ["AI_GLOBAL_CONCURRENCY"] = str(args.submissions)
+os.environ["AI_ADMISSION_MAX_INFLIGHT"] = str(args.submissions * 2)
+
+import httpx  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.pool import QueuePool  # noqa: E402
+
+from app.core import security  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models.edp import Base, Project, User  # noqa: E402
+
+# Pool เล็ก ๆ ที่ไม่มี Overflow: ถ้า Endpoint ใดยืม Connection ค้างระหว่างรอ AI จะเห็น Timeout ทันที
+connect_args = {"check_same_thread": False} if db_url.startswith("sqlite") else {}
+small_engine = create_engine(
+    db_url, poolclass=QueuePool, pool_size=args.pool_size, max_overflow=0,
+    pool_timeout=args.pool_timeout, connect_args=connect_args
+)
+Base.metadata.create_all(bind=small_engine)
+SessionLocal.configure(bind=small_engine)
+
+SAMPLE = (
+    "ปัญหาคือขยะในโรงอาหารไม่ถูกแยกประเภท ทำให้รีไซเคิลไม่ได้ กลุ่มเป้าหมายคือนักเรียนและแม่ครัว "
+    "พวกเราจะออกแบบถังขยะที่มีสัญลักษณ์ชัดเจนและเซนเซอร์ตรวจจับขวดพลาสติก งานชิ้นที่ {n}"
+)
+
+
+def seed() -> list:
+    db = SessionLocal()
+    try:
+        tokens = []
+        hashed = security.get_password_hash("pool-check")
+        for i in range(args.submissions):
+            email = f"pool-check-{i}@example.com"
+            user = db.query(User).filter(User.email == email).first()
+            if user is None:
+                user = User(email=email, hashed_password=hashed, student_id=f"PC{i:04d}",
+                            first_name="Pool", last_name=str(i), class_room="PC/1", role="student")
+                db.add(user)
+                db.flush()
+            project = Project(title=f"Pool check {i}", owner_id=user.id)
+            db.add(project)
+            db.flush()
+            tokens.append((security.create_access_token({"sub": email}), project.id))
+        db.commit()
+        return tokens
+    finally:
+        db.close()
+
+
+async def main() -> int:
+    tokens = seed()
+    transport = httpx.ASGITransport(app=app)
+    timeout = httpx.Timeout(args.latency_ms / 1000 * 10 + 30)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://check", timeout=timeout) as client:
+        async def submit(i, token, project_id):
+            response = await client.post(
+                "/edp/submit",
+                json={"project_id": project_id, "step_number": 1, "content": SAMPLE.format(n=i), "time_spent_seconds": 60},
+                headers={"Authorization": f"Bearer {token}"},
+            )
+            return response.status_code
+
+        probe_latencies = []
+
+        async def probe(token):
+            # ระหว่างที่งานทั้งหมดรอ AI อยู่ Request อื่นต้องยังได้ Connection ทันที
+            await asyncio.sleep(args.latency_ms / 1000 / 4)
+            started = time.perf_counter()
+            response = await client.get("/auth/me", headers={"Authorization": f"Bearer {token}"})
+            probe_latencies.append(time.perf_counter() - started)
+            return response.status_code
+
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(submit(i, token, project_id) for i, (token, project_id) in enumerate(tokens)),
+            *(probe(tokens[i % len(tokens)][0]) for i in range(args.probes)),
+            return_exceptions=True,
+        )
+        elapsed = time.perf_counter() - started
+
+    submit_results = results[:len(tokens)]
+    probe_results = results[len(tokens):]
+    failures = [r for r in results if r != 200]
+    probe_latencies.sort()
+    probe_p95 = probe_latencies[min(int(len(probe_latencies) * 0.95), len(probe_latencies) - 1)] if probe_latencies else 0.0
+
+    print(f"Pool: size={args.pool_size}, overflow=0, timeout={args.pool_timeout}s | DB: {db_url}")
+    print(f"Submissions: {submit_results.count(200)}/{len(submit_results)} OK, probes: {probe_results.count(200)}/{len(probe_results)} OK in {elapsed:.2f}s")
+    print(f"Probe latency during AI wait: p95={probe_p95 * 1000:.0f}ms (AI latency {args.latency_ms:.0f}ms)")
+
+    if failures:
+        print(f"❌ FAIL: {len(failures)} requests failed: {failures[:5]}")
+        return 1
+    if probe_p95 >= args.latency_ms / 1000:
+        print("❌ FAIL: other endpoints waited for the AI call (connections held during grading)")
+        return 1
+    print("✅ PASS: no connection was held while waiting for AI")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
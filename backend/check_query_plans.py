@@ -0,0 +1,129 @@
+# backend/check_query_plans.py
+# เทียบ Query Plan ของ Query หลักก่อน/หลัง Migration เพิ่ม Composite Index และ Index ของ Keyset Pagination
+#   python check_query_plans.py                       SQLite ชั่วคราว + ข้อมูลจำลอง: เทียบเวอร์ชัน 1 กับล่าสุด
+#   python check_query_plans.py --rows 100000         ข้อมูลจำลองมากขึ้น
+#   python check_query_plans.py --database-url URL    ดู Plan ของฐานข้อมูลจริงตามสภาพปัจจุบัน (ไม่แก้ Schema/ข้อมูล)
+import argparse
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+parser = argparse.ArgumentParser(description="Query plan check ของ Composite Index")
+parser.add_argument("--database-url", default=None)
+parser.add_argument("--rows", type=int, default=20000, help="จำนวน edp_steps ที่สร้าง (ตารางอื่นตามสัดส่วน)")
+args = parser.parse_args()
+
+# ต้องตั้ง Env ก่อน import app เพราะ Engine ถูกสร้างตอน import
+db_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'plan_check.db')}"
+os.environ["DATABASE_URL"] = db_url
+
+from sqlalchemy import desc, func, insert, or_, select, text  # noqa: E402
+
+from app.database import engine  # noqa: E402
+from app.migrations import MIGRATIONS, current_version, run_migrations  # noqa: E402
+from app.migrations.versions import ACTIVITY_INDEXES, COMPOSITE_INDEXES, KEYSET_INDEXES  # noqa: E402
+from app.models.edp import EdpStep, Project, QuizAttempt, User  # noqa: E402
+
+# Query เดียวกับที่ Endpoint ใช้จริง คู่กับ Index ที่ควรถูกเลือก
+QUERIES = [
+    ("POST /edp/submit (งานล่าสุดของ Step)", "ix_edp_steps_project_step_id",
+     select(EdpStep.id).where(EdpStep.project_id == 1, EdpStep.step_number == 3).order_by(desc(EdpStep.id)).limit(1)),
+    ("POST /edp/submit (งานล่าสุดของ Project)", "ix_edp_steps_project_step_id",
+     select(EdpStep.id).where(EdpStep.project_id == 1).order_by(desc(EdpStep.id)).limit(1)),
+    ("GET /edp/projects", "ix_projects_owner_created",
+     select(Project.id, Project.title).where(Project.owner_id == 1).order_by(desc(Project.created_at))),
+    ("GET /edp/teacher/stats (class distribution)", "ix_users_role_class_room",
+     select(User.class_room, func.count(User.id)).where(User.role == "student").group_by(User.class_room)),
+    ("GET /quiz/history", "ix_quiz_attempts_student_created",
+     select(QuizAttempt.id, QuizAttempt.score).where(QuizAttempt.student_id == 1).order_by(desc(QuizAttempt.created_at))),
+    ("GET /edp/teacher/students?cursor=", "ix_users_role_id",
+     select(User.id).where(User.role == "student", User.id < 40).order_by(desc(User.id)).limit(51)),
+    ("GET /edp/teacher/projects?cursor=", "ix_projects_created_id",
+     select(Project.id).where(
+         Project.created_at <= select(Project.created_at).where(Project.id == 10).scalar_subquery(),
+         or_(Project.created_at < select(Project.created_at).where(Project.id == 10).scalar_subquery(), Project.id < 10)
+     ).order_by(desc(Project.created_at), desc(Project.id)).limit(51)),
+    ("ActivityTracker.flush_sync (นักเรียนที่ Active)", "ix_users_role_last_active",
+     select(User.id, User.last_active_at).where(
+         User.role == "student", User.last_active_at >= datetime(2026, 1, 1, tzinfo=timezone.utc)
+     )),
+]
+
+
+def explain(conn, stmt) -> str:
+    sql = str(stmt.compile(engine, compile_kwargs={"literal_binds": True}))
+    if engine.dialect.name == "sqlite":
+        rows = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")).all()
+        return " | ".join(row[-1] for row in rows)
+    return " | ".join(row[0].strip() for row in conn.execute(text(f"EXPLAIN {sql}")).all())
+
+
+def plans() -> list:
+    with engine.connect() as conn:
+        return [explain(conn, stmt) for _, _, stmt in QUERIES]
+
+
+def seed(n_steps: int):
+    rng = random.Random(42)
+    n_users = max(n_steps // 20, 50)
+    n_projects = max(n_steps // 10, 50)
+    now = datetime.now(timezone.utc)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"email": f"plan{i}@example.com", "hashed_password": "x", "student_id": f"P{i:06d}",
+             "first_name": "Plan", "last_name": str(i), "class_room": f"ม.{4 + i % 3}/{i % 12 + 1}",
+             "role": "teacher" if i % 40 == 0 else "student",
+             "last_active_at": now - timedelta(minutes=i) if i % 10 == 0 else None}
+            for i in range(1, n_users + 1)
+        ])
+        conn.execute(insert(Project), [
+            {"title": f"Project {i}", "owner_id": rng.randint(1, n_users), "created_at": now - timedelta(minutes=i)}
+            for i in range(1, n_projects + 1)
+        ])
+        conn.execute(insert(EdpStep), [
+            {"project_id": rng.randint(1, n_projects), "step_number": rng.randint(1, 6), "content": "x",
+             "score": rng.randint(0, 100), "status": "submitted"}
+            for _ in range(n_steps)
+        ])
+        conn.execute(insert(QuizAttempt), [
+            {"student_id": rng.randint(1, n_users), "score": rng.randint(0, 10), "total_score": 10,
+             "passed": True, "created_at": now - timedelta(minutes=i)}
+            for i in range(n_users * 3)
+        ])
+        conn.execute(text("ANALYZE"))
+
+
+def main() -> int:
+    if args.database_url:
+        print(f"🗄️  {engine.url.render_as_string(hide_password=True)} (schema version {current_version(engine)})")
+        for (label, index, _), plan in zip(QUERIES, plans()):
+            mark = "✅" if index in plan else "⚠️ "
+            print(f"{mark} {label}\n     {plan}")
+        return 0
+
+    run_migrations(engine, MIGRATIONS, target=1)
+    seed(args.rows)
+    before = plans()
+    run_migrations(engine, MIGRATIONS)
+    after = plans()
+
+    failures = 0
+    for (label, index, _), old, new in zip(QUERIES, before, after):
+        used = index in new
+        failures += 0 if used else 1
+        print(f"{'✅' if used else '❌'} {label}")
+        print(f"     before: {old}")
+        print(f"     after:  {new}")
+
+    print(f"\nIndexes: {', '.join(name for name, _, _ in COMPOSITE_INDEXES + KEYSET_INDEXES + ACTIVITY_INDEXES)}")
+    if failures:
+        print(f"❌ FAIL: {failures} queries do not use the expected index")
+        return 1
+    print("✅ PASS: every hot query uses its composite index")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
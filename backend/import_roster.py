@@ -0,0 +1,43 @@
+# backend/import_roster.py
+# นำเข้ารายชื่อนักเรียนทั้งห้องจากไฟล์ CSV/JSON (ไม่ต้องผ่าน API)
+#   python import_roster.py students_m4_1.csv --class-room "ม.4/1"
+#   python import_roster.py students.json --dry-run
+# คอลัมน์: email, student_id, first_name, last_name, class_room (ไม่บังคับ), password (ไม่บังคับ, ค่าเริ่มต้น password123)
+import argparse
+import sys
+
+from app.database import SessionLocal
+from app.services.roster_import import parse_roster, import_roster, shutdown_hash_pool
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="นำเข้ารายชื่อนักเรียนทั้งห้อง")
+    parser.add_argument("file", help="ไฟล์ .csv หรือ .json")
+    parser.add_argument("--class-room", default=None, help="ห้องเรียนสำหรับแถวที่ไม่ได้ระบุ")
+    parser.add_argument("--dry-run", action="store_true", help="ตรวจไฟล์อย่างเดียว ไม่สร้างบัญชี")
+    args = parser.parse_args()
+
+    fmt = "json" if args.file.lower().endswith(".json") else "csv"
+    with open(args.file, "rb") as f:
+        rows = parse_roster(f.read(), fmt)
+
+    db = SessionLocal()
+    try:
+        report = import_roster(db, rows, class_room=args.class_room, dry_run=args.dry_run)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    finally:
+        db.close()
+        shutdown_hash_pool()
+
+    for error in report["errors"]:
+        print(f"⚠️  แถวที่ {error['row']}: {error['error']}")
+    action = "ตรวจผ่าน" if report["dry_run"] else "สร้างบัญชี"
+    print(f"✅ {action} {report['created'] if not report['dry_run'] else report['valid_rows']}/{report['total_rows']} คน "
+          f"(ผิดพลาด {report['failed']} แถว) ใน {report['elapsed_ms']:.0f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
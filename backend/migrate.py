@@ -0,0 +1,63 @@
+# backend/migrate.py
+# จัดการ Schema ของฐานข้อมูลด้วย Migration แบบมีเวอร์ชัน (แทน update_db.py / reset_db.py เดิม)
+#   python migrate.py            รันทุกเวอร์ชันที่ค้างอยู่
+#   python migrate.py status     ดูเวอร์ชันปัจจุบันและเวอร์ชันที่ยังไม่ได้รัน
+#   python migrate.py --to 1     รันถึงเวอร์ชันที่ระบุ
+#   python migrate.py reset      ลบข้อมูลทั้งหมดแล้วสร้าง Schema ใหม่ (ต้องพิมพ์ CONFIRM)
+import argparse
+import sys
+
+from app.database import Base, engine
+from app.migrations import MIGRATIONS, current_version, drop_migration_history, migrate, pending_migrations
+import app.models.edp  # noqa: F401  ให้ Model ทุกตัวลงทะเบียนกับ Base ก่อน drop_all
+
+
+def status() -> int:
+    print(f"🗄️  {engine.url.render_as_string(hide_password=True)}")
+    print(f"Current version: {current_version(engine)}")
+    pending = pending_migrations(engine, MIGRATIONS)
+    if not pending:
+        print("✅ Schema เป็นเวอร์ชันล่าสุดแล้ว")
+    for m in pending:
+        print(f"   pending: {m.version:04d}_{m.name}")
+    return 0
+
+
+def reset() -> int:
+    print("=====================================================")
+    print("⚠️  คำเตือนระดับอันตรายสูงสุด (CRITICAL WARNING) ⚠️")
+    print("=====================================================")
+    print("คุณกำลังจะลบข้อมูล 'ทั้งหมด' ในฐานข้อมูล (Database)!")
+    print("ข้อมูลนักเรียน โครงงาน คะแนน และประวัติการสอบทั้งหมดจะหายไปถาวร\n")
+
+    confirm = input("หากแน่ใจ พิมพ์คำว่า 'CONFIRM' เพื่อยืนยันการลบ: ")
+    if confirm != "CONFIRM":
+        print("\n❌ ยกเลิกการทำงาน (Aborted) - ข้อมูลของคุณยังปลอดภัยครับ")
+        return 0
+
+    print("\n🔥 กำลังลบตารางเก่าทิ้ง (Dropping all tables)...")
+    Base.metadata.drop_all(bind=engine)
+    drop_migration_history(engine)
+    migrate()
+    print("✅ เสร็จสิ้น! Database ของคุณเป็นเวอร์ชันใหม่ที่ว่างเปล่าแล้ว")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Database migrations")
+    parser.add_argument("command", nargs="?", default="upgrade", choices=["upgrade", "status", "reset"])
+    parser.add_argument("--to", type=int, default=None, help="รันถึงเวอร์ชันนี้ (ค่าเริ่มต้น: ล่าสุด)")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        return status()
+    if args.command == "reset":
+        return reset()
+
+    ran = migrate(args.to)
+    print(f"✅ Applied {len(ran)} migration(s), current version: {current_version(engine)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,7 @@
 # backend/promote_teacher.py
 from app.database import SessionLocal
 from app.models.edp import User
+from app.services.principal_cache import invalidate_principal
 
 def promote_to_teacher(email):
     db = SessionLocal()
@@ -11,6 +12,8 @@ def promote_to_teacher(email):
             return
         
         user.role = "teacher"
+        # ให้ทุก Worker ที่ Cache ผู้ใช้นี้ไว้ โหลดสิทธิ์ใหม่ในรอบ Sync ถัดไป
+        invalidate_principal(db, user.id)
         db.commit()
         print(f"✅ อัปเกรด '{user.first_name}' ({email}) เป็น 'Teacher' เรียบร้อยแล้ว!")
         print("➡️  ตอนนี้คุณสามารถล็อกอินด้วยอีเมลนี้เพื่อเข้าหน้า Teacher Dashboard ได้เลย")
@@ -0,0 +1,37 @@
+# backend/purge_ai_cache.py
+import sys
+from app.database import SessionLocal, engine
+from app.models import edp
+from app.core.config import AI_RUBRIC_VERSION
+from app.services.persistent_cache import purge_ai_result_cache
+
+# สร้างตารางถ้ายังไม่มี
+edp.Base.metadata.create_all(bind=engine)
+
+USAGE = """
+วิธีใช้:
+  python purge_ai_cache.py expired   ลบเฉพาะผลตรวจที่หมดอายุ
+  python purge_ai_cache.py stale     ลบผลตรวจของ Rubric เวอร์ชันเก่า (เก็บเวอร์ชันปัจจุบันไว้)
+  python purge_ai_cache.py all       ล้าง Cache ผลตรวจทั้งหมด
+"""
+
+if __name__ == "__main__":
+    mode = sys.argv[1] if len(sys.argv) > 1 else ""
+    if mode not in ("expired", "stale", "all"):
+        print(USAGE)
+        sys.exit(1)
+
+    db = SessionLocal()
+    try:
+        if mode == "expired":
+            deleted = purge_ai_result_cache(db, expired_only=True)
+        elif mode == "stale":
+            deleted = purge_ai_result_cache(db, keep_version=AI_RUBRIC_VERSION)
+        else:
+            deleted = purge_ai_result_cache(db)
+        print(f"✅ ลบ Cache ผลตรวจไปทั้งหมด {deleted} รายการ (Rubric ปัจจุบัน: {AI_RUBRIC_VERSION})")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ เกิดข้อผิดพลาด: {e}")
+    finally:
+        db.close()
@@ -1,25 +0,0 @@
-import sys
-from app.database import engine, Base
-# Import Model ทั้งหมดเพื่อให้ SQLAlchemy รู้จักก่อนดรอปตาราง
-from app.models.edp import User, Project, EdpStep, QuizQuestion, QuizAttempt
-
-print("=====================================================")
-print("⚠️  คำเตือนระดับอันตรายสูงสุด (CRITICAL WARNING) ⚠️")
-print("=====================================================")
-print("คุณกำลังจะลบข้อมูล 'ทั้งหมด' ในฐานข้อมูล (Database)!")
-print("ข้อมูลนักเรียน โครงงาน คะแนน และประวัติการสอบทั้งหมดจะหายไปถาวร\n")
-
-# บังคับให้พิมพ์ยืนยัน
-confirm = input("หากแน่ใจ พิมพ์คำว่า 'CONFIRM' เพื่อยืนยันการลบ: ")
-
-if confirm != "CONFIRM":
-    print("\n❌ ยกเลิกการทำงาน (Aborted) - ข้อมูลของคุณยังปลอดภัยครับ")
-    sys.exit(0)
-
-print("\n🔥 กำลังลบตารางเก่าทิ้ง (Dropping all tables)...")
-Base.metadata.drop_all(bind=engine)
-
-print("✨ กำลังสร้างตารางใหม่ที่มีช่องครบถ้วน (Creating new tables)...")
-Base.metadata.create_all(bind=engine)
-
-print("✅ เสร็จสิ้น! Database ของคุณเป็นเวอร์ชันใหม่ที่ว่างเปล่าแล้ว")
\ No newline at end of file
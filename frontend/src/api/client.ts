@@ -70,4 +70,16 @@ client.interceptors.response.use(
   }
 );
 
+// ── Helper: ดึงรายการที่แบ่งหน้าแบบ Cursor ให้ครบทุกหน้า (Backend ส่ง Cursor หน้าถัดไปใน Header X-Next-Cursor) ──
+export async function fetchAllPages<T>(url: string, pageSize = 200): Promise<T[]> {
+  const items: T[] = [];
+  let cursor: string | undefined;
+  do {
+    const res = await client.get<T[]>(url, { params: { limit: pageSize, cursor } });
+    items.push(...res.data);
+    cursor = res.headers['x-next-cursor'] || undefined;
+  } while (cursor);
+  return items;
+}
+
 export default client;
\ No newline at end of file
@@ -1,6 +1,6 @@
 import { useEffect, useState, useCallback, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
-import client from '../api/client';
+import client, { fetchAllPages } from '../api/client';
 import { 
   LogOut, LayoutDashboard, Users, FolderOpen, 
   Search, Trash2, Edit2, Save, Key, 
@@ -108,14 +108,14 @@ export default function TeacherDashboard() {
 
   const fetchData = useCallback(async () => {
     try {
-      const [resStats, resStudents, resProjects] = await Promise.all([
+      const [resStats, allStudents, allProjects] = await Promise.all([
         client.get('/edp/teacher/stats'),
-        client.get('/edp/teacher/students'),
-        client.get('/edp/teacher/projects')
+        fetchAllPages<Student>('/edp/teacher/students'),
+        fetchAllPages<Project>('/edp/teacher/projects')
       ]);
       setStats(resStats.data);
-      setStudents(resStudents.data);
-      setProjects(resProjects.data);
+      setStudents(allStudents);
+      setProjects(allProjects);
     } catch (err) {
       console.error("Fetch Data Error:", err);
     } finally {